@@ -2,56 +2,130 @@
 
 # Log ALL Claude Code events to DuckDB for exploration
 # Usage: log-all-events.sh <event_type> [tool_name] [matcher]
+#
+# Delivery depends on CLAUDE_MONITOR_HOOK_MODE:
+#   auto   (default) write the payload to the collector socket
+#          (web-ui/collector.py, also embedded in the dashboard); if no
+#          collector is listening or it does not answer "ok" within 2
+#          seconds, append it to the spool instead
+#   spool  always append to the spool and return immediately. Only bash
+#          builtins are used, so the hook costs a few milliseconds and never
+#          waits on the database; the collector loads spooled events
+#   direct insert with the duckdb CLI (drops the event if the file is locked)
 
 EVENT_TYPE="${1:-unknown}"
 TOOL_NAME="${2:-}"
 MATCHER="${3:-}"
+HOOK_MODE="${CLAUDE_MONITOR_HOOK_MODE:-auto}"
 
 # Paths
-SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
-DB_FILE="$SCRIPT_DIR/../logs/claude_events.duckdb"
-LOG_FILE="$SCRIPT_DIR/../logs/all_events.log"
+SCRIPT_DIR="${BASH_SOURCE[0]%/*}"
+[ "$SCRIPT_DIR" = "${BASH_SOURCE[0]}" ] && SCRIPT_DIR="."
+LOGS_DIR="$SCRIPT_DIR/../logs"
+DB_FILE="$LOGS_DIR/claude_events.duckdb"
+LOG_FILE="$LOGS_DIR/all_events.log"
+SOCKET="${CLAUDE_MONITOR_SOCKET:-$LOGS_DIR/collector.sock}"
+SPOOL_DIR="${CLAUDE_MONITOR_SPOOL:-$LOGS_DIR/spool}"
 
-# Read JSON from stdin
-JSON_INPUT=$(cat)
+# Read JSON from stdin (read is a builtin, so this does not fork)
+IFS= read -r -d '' JSON_INPUT
 
-# Get tmux session name if in tmux
+# UTC timestamp, with bash builtins where available (bash >= 5 / 4.2)
+export TZ=UTC
+if [ -n "$EPOCHREALTIME" ]; then
+    NOW="${EPOCHREALTIME%[.,]*}"
+    printf -v TIMESTAMP '%(%Y-%m-%d %H:%M:%S)T.%s' "$NOW" "${EPOCHREALTIME#*[.,]}"
+    printf -v MINUTE '%(%Y%m%d%H%M)T' "$NOW"
+elif [ "${BASH_VERSINFO[0]}" -gt 4 ] || { [ "${BASH_VERSINFO[0]}" -eq 4 ] && [ "${BASH_VERSINFO[1]}" -ge 2 ]; }; then
+    printf -v TIMESTAMP '%(%Y-%m-%d %H:%M:%S)T' -1
+    printf -v MINUTE '%(%Y%m%d%H%M)T' -1
+else
+    TIMESTAMP=$(date -u +"%Y-%m-%d %H:%M:%S")
+    MINUTE=$(date -u +"%Y%m%d%H%M")
+fi
+
+# Get tmux session name if in tmux. Asking tmux costs a fork, so the name is
+# cached per pane and refreshed whenever a Claude session starts.
 TMUX_SESSION=""
 if [ -n "$TMUX" ]; then
-    TMUX_SESSION=$(tmux display-message -p '#S' 2>/dev/null || echo "")
+    TMUX_CACHE="$SPOOL_DIR/.tmux-${TMUX#*,}-${TMUX_PANE#%}"
+    if [ "$EVENT_TYPE" = "SessionStart" ] || ! IFS= read -r TMUX_SESSION 2>/dev/null < "$TMUX_CACHE"; then
+        TMUX_SESSION=$(tmux display-message -p '#S' 2>/dev/null || echo "")
+        [ -d "$SPOOL_DIR" ] || mkdir -p "$SPOOL_DIR"
+        printf '%s\n' "$TMUX_SESSION" > "$TMUX_CACHE" 2>/dev/null
+    fi
 fi
 
-# Add tmux session to JSON if we have it
-if [ -n "$TMUX_SESSION" ]; then
-    JSON_INPUT=$(echo "$JSON_INPUT" | jq --arg tmux "$TMUX_SESSION" '. + {tmux_session: $tmux}')
+# Frame header shared by the socket and the spool (see web-ui/ingest.py)
+frame_header() {
+    local LC_ALL=C  # ${#JSON_INPUT} must count bytes, not characters
+    printf -v HEADER '%s\t%s\t%s\t%s\t%s\t%s' \
+        "$EVENT_TYPE" "$TOOL_NAME" "$MATCHER" "$TIMESTAMP" "$TMUX_SESSION" "${#JSON_INPUT}"
+}
+
+# Write the framed event to the collector socket and print its reply
+send_to_collector() {
+    if command -v nc >/dev/null 2>&1; then
+        printf '%s\n%s' "$HEADER" "$JSON_INPUT" | nc -U -w 2 "$SOCKET" 2>/dev/null
+    elif command -v socat >/dev/null 2>&1; then
+        printf '%s\n%s' "$HEADER" "$JSON_INPUT" | socat -t 2 - "UNIX-CONNECT:$SOCKET" 2>/dev/null
+    else
+        printf '%s\n%s' "$HEADER" "$JSON_INPUT" | python3 -c '
+import socket, sys
+s = socket.socket(socket.AF_UNIX); s.settimeout(2); s.connect(sys.argv[1])
+s.sendall(sys.stdin.buffer.read()); print(s.recv(64).decode().strip())' "$SOCKET" 2>/dev/null
+    fi
+}
+
+# Append the framed event to this process's spool segment. Segments are per
+# process, so concurrent hooks never interleave writes in the same file.
+append_to_spool() {
+    [ -d "$SPOOL_DIR" ] || mkdir -p "$SPOOL_DIR"
+    printf '%s\n%s\n' "$HEADER" "$JSON_INPUT" >> "$SPOOL_DIR/$MINUTE-$$.seg"
+}
+
+if [ "$HOOK_MODE" != "direct" ]; then
+    frame_header
+    if [ "$HOOK_MODE" = "auto" ] && [ -S "$SOCKET" ] && [ "$(send_to_collector)" = "ok" ]; then
+        exit 0
+    fi
+    append_to_spool
+    exit 0
 fi
 
-# Create timestamp
-TIMESTAMP=$(date -u +"%Y-%m-%d %H:%M:%S")
+# Direct mode: insert with the duckdb CLI
 
 # Log to text file for debugging
 echo "====================================" >> "$LOG_FILE"
-echo "[$TIMESTAMP] Event: $EVENT_TYPE | Tool: $TOOL_NAME | Matcher: $MATCHER" >> "$LOG_FILE"
+echo "[$TIMESTAMP] Event: $EVENT_TYPE | Tool: $TOOL_NAME | Matcher: $MATCHER | Tmux: $TMUX_SESSION" >> "$LOG_FILE"
 echo "$JSON_INPUT" | jq '.' >> "$LOG_FILE" 2>/dev/null || echo "$JSON_INPUT" >> "$LOG_FILE"
 
-# Ensure database and table exist
+# Build the INSERT in a single jq pass: merges the tmux session into the
+# payload, extracts the promoted columns and escapes everything for SQL
+INSERT_SQL=$(echo "$JSON_INPUT" | jq -r -f "$SCRIPT_DIR/insert-event.jq" \
+    --arg ts "$TIMESTAMP" --arg event "$EVENT_TYPE" --arg tool "$TOOL_NAME" \
+    --arg matcher "$MATCHER" --arg tmux "$TMUX_SESSION" 2>/dev/null)
+
+# Ensure database and table exist, then insert. The ADD COLUMN statements keep
+# inserts working on files created before the promoted columns existed; run
+# `python web-ui/schema.py migrate` to backfill the older rows.
 duckdb "$DB_FILE" <<EOF 2>/dev/null
 CREATE TABLE IF NOT EXISTS all_events (
     timestamp TIMESTAMP,
     event_type VARCHAR,
     tool_name VARCHAR,
     matcher VARCHAR,
-    data JSON
+    data JSON,
+    session_id VARCHAR,
+    tmux_session VARCHAR,
+    cwd VARCHAR,
+    subagent_type VARCHAR
 );
-EOF
-
-# Escape JSON for SQL insertion
-JSON_ESCAPED=$(echo "$JSON_INPUT" | sed "s/'/''/g")
-
-# Insert into DuckDB
-duckdb "$DB_FILE" <<EOF 2>/dev/null
-INSERT INTO all_events (timestamp, event_type, tool_name, matcher, data)
-VALUES ('$TIMESTAMP', '$EVENT_TYPE', '$TOOL_NAME', '$MATCHER', '$JSON_ESCAPED'::JSON);
+ALTER TABLE all_events ADD COLUMN IF NOT EXISTS session_id VARCHAR;
+ALTER TABLE all_events ADD COLUMN IF NOT EXISTS tmux_session VARCHAR;
+ALTER TABLE all_events ADD COLUMN IF NOT EXISTS cwd VARCHAR;
+ALTER TABLE all_events ADD COLUMN IF NOT EXISTS subagent_type VARCHAR;
+$INSERT_SQL
 EOF
 
 # Return success
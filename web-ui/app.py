@@ -1,14 +1,348 @@
-from flask import Flask, render_template, jsonify, request, send_from_directory
+from flask import Flask, render_template, jsonify, request, send_from_directory, g, Response, stream_with_context, make_response
+from werkzeug.exceptions import HTTPException, NotAcceptable
 import duckdb
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
+import argparse
+import base64
+import functools
 import json
 import os
+import posixpath
+import time
+
+import archive
+import blobstore
+import cache
+import db
+import derived
+import metrics
+import schema
+import search
+import serialize
+import serving
+from collector import Collector, CollectorError
+
+# Optional: Arrow IPC responses (see arrowipc.py)
+try:
+    import arrowipc
+except ImportError:
+    arrowipc = None
 
 app = Flask(__name__)
 
 # Path to DuckDB file (relative to web-ui folder)
 DB_PATH = os.path.join(os.path.dirname(__file__), '../logs/claude_events.duckdb')
 
+# Embedded collector (see collector.py). DuckDB lets only one process hold the
+# file open for writing, so while it runs all reads go through its database.
+collector = None
+
+# Long-lived connection shared by all requests (see db.py)
+pool = db.ConnectionPool(DB_PATH)
+
+# Query timings per route and label, served at /metrics (see metrics.py)
+registry = metrics.Registry()
+
+# Set with --slow-query-ms
+SLOW_QUERY_LOG_PATH = os.path.join(os.path.dirname(__file__), '../logs/slow_queries.log')
+slow_query_log = None
+
+# Set with --query-timeout and --max-concurrent (see serving.py)
+watchdog = None
+limiter = None
+
+# Not counted against --max-concurrent: static files, the long-lived event
+# stream and the metrics that should stay reachable when the limit is hit
+UNLIMITED_ENDPOINTS = {'static', 'favicon', 'stream', 'prometheus_metrics'}
+RETRY_AFTER_SECONDS = 1
+LIMITER_SLOT = 'dashboard.limiter_slot'
+
+def route_name():
+    return request.url_rule.rule if request.url_rule else request.path
+
+def connect():
+    """Timed cursor for the current request, returned to the pool when the request ends"""
+    if 'db' not in g:
+        g.db = metrics.TimedCursor(pool.checkout(), route_name(), registry,
+                                   g.setdefault('query_timings', []), slow_query_log, watchdog)
+    return g.db
+
+def release(conn, limiter_slot=False):
+    if conn is not None:
+        conn.finish()
+        pool.release(conn.cursor)
+    if limiter_slot:
+        limiter.release()
+
+@app.teardown_appcontext
+def release_connection(exc):
+    release(g.pop('db', None))
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def limit_concurrency():
+    """Turn requests away with 503 while --max-concurrent are in flight"""
+    if limiter is None or request.endpoint in UNLIMITED_ENDPOINTS:
+        return None
+    if not limiter.try_acquire():
+        response = json_response({'error': 'Too many concurrent requests'})
+        response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+        return response, 503
+    # On the request rather than g, which /api/batch's panels share
+    request.environ[LIMITER_SLOT] = True
+    return None
+
+@app.teardown_request
+def release_concurrency(exc):
+    release(None, request.environ.pop(LIMITER_SLOT, False))
+
+@app.errorhandler(duckdb.InterruptException)
+def query_timeout(e):
+    return json_response({'error': 'Query timed out'}), 504
+
+@app.after_request
+def add_server_timing(response):
+    """Report the request's queries in Server-Timing and the route's histogram"""
+    if request.url_rule is None or request.endpoint == 'static':
+        return response
+    total = time.perf_counter() - g.request_started
+    registry.observe_request(request.url_rule.rule, total)
+    response.headers['Server-Timing'] = metrics.server_timing(
+        g.get('query_timings', []), total, g.get('cache_status'))
+    return response
+
+# Rendered API responses, valid until the next write (see cache.py)
+response_cache = cache.ResponseCache()
+
+def data_version():
+    """Opaque value that changes whenever events are written"""
+    if collector is not None:
+        return collector.version
+    return pool.file_signature()
+
+def cached(view):
+    """Serve a JSON endpoint from response_cache, with an ETag for conditional requests"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.path, tuple(sorted(request.args.items(multi=True))),
+               request.accept_mimetypes.best_match(['application/json', ARROW_MIMETYPE]))
+        # Taken before querying: a write during the query leaves a stale entry.
+        # The panels of a /api/batch request share the version of its snapshot.
+        version = g.batch_version if 'batch_version' in g else data_version()
+        entry = response_cache.get(key, version)
+        g.cache_status = 'miss' if entry is None else 'hit'
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            headers = [(k, v) for k, v in response.headers.items()
+                       if k not in ('Content-Type', 'Content-Length')]
+            if response.is_streamed:
+                return stream_into_cache(response, key, version, headers)
+            entry = response_cache.put(key, version, response.get_data(), response.mimetype, headers)
+        
+        response = Response(entry.body, mimetype=entry.mimetype, headers=entry.headers)
+        response.set_etag(entry.etag)
+        # Let browsers keep the body but revalidate it on every request
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept')
+        response.make_conditional(request)
+        if response.status_code == 304:
+            response_cache.count_not_modified()
+        return response
+    wrapper.batchable = True
+    return wrapper
+
+def stream_into_cache(response, key, version, headers):
+    """Pass a streamed response on, storing its body once it has been written
+    
+    Sent without an ETag, which needs the whole body; later hits have one.
+    """
+    def generate():
+        chunks = []
+        size = 0
+        try:
+            for chunk in response.response:
+                yield chunk
+                if chunks is not None:
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size > response_cache.max_entry_bytes:
+                        chunks = None
+                        response_cache.count_uncacheable()
+            if chunks is not None:
+                response_cache.put(key, version, b''.join(chunks), response.mimetype, headers)
+        finally:
+            response.close()
+    
+    streamed = Response(generate(), mimetype=response.mimetype, headers=headers)
+    streamed.headers['Cache-Control'] = 'no-cache'
+    streamed.vary.add('Accept')
+    return streamed
+
+# Keyset pagination: list endpoints take ?limit=<n>&cursor=<token> and return
+# the token for the next page in the X-Next-Cursor header (absent on the last
+# page). A cursor holds the sort key of the last row sent, so pages stay
+# consistent while new events arrive and deep pages cost the same as the first.
+MAX_PAGE_SIZE = 1000
+
+class PageError(ValueError):
+    pass
+
+@app.errorhandler(PageError)
+def page_error(e):
+    return json_response({'error': str(e)}), 400
+
+def encode_cursor(timestamp, key):
+    raw = json.dumps([timestamp.isoformat(), key]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def limit_param(default_size, max_size=MAX_PAGE_SIZE):
+    try:
+        limit = int(request.args.get('limit', default_size))
+    except ValueError:
+        raise PageError('limit must be an integer')
+    if not 1 <= limit <= max_size:
+        raise PageError(f'limit must be between 1 and {max_size}')
+    return limit
+
+def page_params(default_size, max_size=MAX_PAGE_SIZE):
+    """(limit, cursor) from the request, cursor being (timestamp, key) or None"""
+    limit = limit_param(default_size, max_size)
+    token = request.args.get('cursor')
+    if not token:
+        return limit, None
+    try:
+        timestamp, key = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return limit, (datetime.fromisoformat(timestamp), key)
+    except (ValueError, TypeError):
+        raise PageError('invalid cursor')
+
+def keyset(cursor, timestamp_col, key_col, descending=False):
+    """SQL condition (and its parameters) selecting rows after the cursor"""
+    if cursor is None:
+        return 'TRUE', []
+    op = '<' if descending else '>'
+    timestamp, key = cursor
+    return (f"({timestamp_col} {op} ? OR ({timestamp_col} = ? AND {key_col} {op} ?))",
+            [timestamp, timestamp, key])
+
+def range_param(name):
+    """Naive UTC datetime from an ISO timestamp query parameter, or None"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise PageError(f'{name} must be an ISO timestamp')
+
+def session_since(conn, session_id):
+    """First day of a session's events, for `date >= ?` to skip archived days before it"""
+    row = conn.execute("""
+        SELECT CAST(session_start AS DATE) FROM session_summary WHERE session_id = ?
+    """, [session_id], label='session_since').fetchone()
+    return row[0] if row and row[0] else date.min
+
+def json_response(body):
+    """Response with body as JSON, holding serialize.Rows anywhere in it
+    
+    Sends the same bytes as jsonify() with the rows materialized, but streams
+    them as they are encoded (see serialize.py); Rows may still fetch from the
+    request's cursor or resolve blobs with it while the body is sent.
+    """
+    if not serialize.compatible(app):
+        return jsonify(serialize.materialize(body))
+    dumps = functools.partial(app.json.dumps, separators=(',', ':'))
+    return stream_response(serialize.iter_json(body, dumps), app.json.mimetype)
+
+def paged(body, rows, limit, sort_key):
+    """JSON response for one page; rows were fetched with LIMIT limit + 1"""
+    response = json_response(body)
+    if len(rows) > limit:
+        response.headers['X-Next-Cursor'] = encode_cursor(*sort_key(rows[limit - 1]))
+    return response
+
+def stream_response(chunks, mimetype):
+    """Response streaming chunks, which may still read from the request's cursor
+    
+    The body is written after the view returns, so the request's cursor and
+    its concurrency slot are released once it has been sent. Panels of
+    /api/batch are read before the batch ends and keep them.
+    """
+    response = Response(chunks, mimetype=mimetype)
+    if 'batch_version' not in g:
+        response.call_on_close(functools.partial(
+            release, g.pop('db', None), request.environ.pop(LIMITER_SLOT, False)))
+    return response
+
+# Timeline and list endpoints answer Accept: application/vnd.apache.arrow.stream
+# with the query's Arrow record batches (see arrowipc.py). Without the per-row
+# cost of JSON, pages can be much larger.
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+MAX_ARROW_PAGE_SIZE = 100000
+ARROW_BATCH_ROWS = 10000
+
+@app.errorhandler(NotAcceptable)
+def not_acceptable(e):
+    return json_response({'error': 'Arrow responses need pyarrow; accept application/json instead'}), 406
+
+def wants_arrow():
+    """Whether the client prefers an Arrow IPC stream to JSON
+    
+    Raises NotAcceptable if it takes nothing else and pyarrow is not installed.
+    """
+    accept = request.accept_mimetypes
+    if accept.best_match(['application/json', ARROW_MIMETYPE]) != ARROW_MIMETYPE:
+        return False
+    if arrowipc is None:
+        if accept['application/json']:
+            return False
+        raise NotAcceptable()
+    return True
+
+def arrow_paged(conn, sql, params, limit, sort_columns, label, descending=False):
+    """Arrow IPC response streaming one page of sql's rows
+    
+    sql selects the rows after the request's cursor, ordered by sort_columns
+    (timestamp, key), without a LIMIT. The next cursor goes out in the headers,
+    before any row, so the last row of the page is looked up first; the page
+    is then every row up to it, which keeps it consistent with the cursor even
+    if events arrive in between.
+    """
+    timestamp_col, key_col = sort_columns
+    direction = 'DESC' if descending else 'ASC'
+    order = f"ORDER BY {timestamp_col} {direction}, {key_col} {direction}"
+    ends = conn.execute(f"""
+        SELECT {timestamp_col}, {key_col} FROM ({sql}) {order}
+        LIMIT 2 OFFSET ?
+    """, params + [limit - 1], label=f'{label}_page_end').fetchall()
+
+    if len(ends) > 1:
+        # Rows not after the last one of the page
+        after_end, end_params = keyset(ends[0], timestamp_col, key_col, descending)
+        page = f"SELECT * FROM ({sql}) WHERE NOT {after_end} {order}"
+        reader = conn.execute(page, params + end_params, label=label).fetch_record_batch(ARROW_BATCH_ROWS)
+    else:
+        page = f"SELECT * FROM ({sql}) {order} LIMIT ?"
+        reader = conn.execute(page, params + [limit], label=label).fetch_record_batch(ARROW_BATCH_ROWS)
+
+    response = stream_response(arrow_chunks(reader), ARROW_MIMETYPE)
+    if len(ends) > 1:
+        response.headers['X-Next-Cursor'] = encode_cursor(*ends[0])
+    return response
+
+def arrow_chunks(reader):
+    """IPC stream of reader, resolving blob references on a cursor of its own"""
+    lookup = pool.checkout()
+    try:
+        yield from arrowipc.ipc_stream(reader, lookup)
+    finally:
+        pool.release(lookup)
+
 @app.route('/')
 def index():
     """Display comprehensive session tracking from all_events"""
@@ -20,7 +354,9 @@ def favicon():
     return send_from_directory(os.path.join(app.root_path, 'static'),
                                'favicon.ico', mimetype='image/vnd.microsoft.icon')
 
-# API endpoints now exclusively use the all_events table for comprehensive tracking
+# API endpoints read the events view: all_events plus the Parquet archive (see
+# archive.py). Queries over a session or the newest events filter on its date
+# column so that archived days outside them are not read.
 
 @app.route('/session-timeline/<session_id>')
 def session_timeline_page(session_id):
@@ -33,24 +369,23 @@ def agent_detail_page(agent_type):
     return render_template('agent_detail.html', agent_type=agent_type)
 
 @app.route('/api/tracking/current-session')
+@cached
 def get_current_session_tracking():
     """Get comprehensive tracking data for the current session"""
-    conn = duckdb.connect(DB_PATH, read_only=True)
+    conn = connect()
     
     # Get the most recent session
     current_session = conn.execute("""
-        SELECT json_extract_string(data, '$.session_id') as session_id
-        FROM all_events
-        WHERE json_extract_string(data, '$.session_id') IS NOT NULL
-        ORDER BY timestamp DESC
+        SELECT session_id, CAST(session_start AS DATE)
+        FROM session_summary
+        ORDER BY session_end DESC
         LIMIT 1
-    """).fetchone()
+    """, label='current_session').fetchone()
     
     if not current_session:
-        conn.close()
-        return jsonify({'error': 'No active session found'}), 404
+        return json_response({'error': 'No active session found'}), 404
     
-    session_id = current_session[0]
+    session_id, since = current_session
     
     # Get session lifecycle
     lifecycle = conn.execute("""
@@ -58,171 +393,292 @@ def get_current_session_tracking():
             timestamp,
             event_type,
             json_extract_string(data, '$.source') as source
-        FROM all_events
+        FROM events
         WHERE event_type IN ('SessionStart', 'SessionEnd', 'PreCompact')
-            AND json_extract_string(data, '$.session_id') = ?
+            AND session_id = ?
+            AND date >= ?
         ORDER BY timestamp ASC
-    """, [session_id]).fetchall()
+    """, [session_id, since], label='lifecycle').fetchall()
     
     # Get tool usage statistics
     tool_stats = conn.execute("""
         SELECT 
-            json_extract_string(data, '$.tool_name') as tool_name,
+            tool_name,
             COUNT(*) FILTER (WHERE event_type = 'PreToolUse') as pre_count,
             COUNT(*) FILTER (WHERE event_type = 'PostToolUse') as post_count,
             COUNT(DISTINCT json_extract_string(data, '$.tool_input.command')) as unique_commands,
             COUNT(DISTINCT json_extract_string(data, '$.tool_input.file_path')) as unique_files
-        FROM all_events
-        WHERE json_extract_string(data, '$.session_id') = ?
+        FROM events
+        WHERE session_id = ?
+            AND date >= ?
             AND event_type IN ('PreToolUse', 'PostToolUse')
-        GROUP BY json_extract_string(data, '$.tool_name')
+        GROUP BY tool_name
         ORDER BY pre_count DESC
-    """, [session_id]).fetchall()
+    """, [session_id, since], label='tool_stats').fetchall()
     
     # Get timeline of all events
     timeline = conn.execute("""
         SELECT 
             timestamp,
             event_type,
-            json_extract_string(data, '$.tool_name') as tool_name,
+            tool_name,
             json_extract_string(data, '$.tool_input.command') as command,
             json_extract_string(data, '$.tool_input.file_path') as file_path,
             json_extract_string(data, '$.tool_input.pattern') as pattern,
             json_extract_string(data, '$.tool_input.url') as url,
             json_extract_string(data, '$.tool_input.description') as description
-        FROM all_events
-        WHERE json_extract_string(data, '$.session_id') = ?
+        FROM events
+        WHERE session_id = ?
+            AND date >= ?
         ORDER BY timestamp DESC
         LIMIT 100
-    """, [session_id]).fetchall()
-    
-    conn.close()
+    """, [session_id, since], label='timeline').fetchall()
     
-    return jsonify({
+    return json_response({
         'session_id': session_id,
-        'lifecycle': [{
-            'timestamp': event[0].isoformat() if event[0] else None,
-            'event_type': event[1],
-            'source': event[2]
-        } for event in lifecycle],
-        'tool_stats': [{
-            'tool_name': stat[0] or 'Unknown',
-            'pre_count': stat[1],
-            'post_count': stat[2],
-            'unique_commands': stat[3],
-            'unique_files': stat[4]
-        } for stat in tool_stats],
-        'timeline': [{
-            'timestamp': event[0].isoformat() if event[0] else None,
-            'event_type': event[1],
-            'tool_name': event[2],
-            'command': event[3],
-            'file_path': event[4],
-            'pattern': event[5],
-            'url': event[6],
-            'description': event[7]
-        } for event in timeline]
+        'lifecycle': serialize.Rows(lifecycle, {
+            'timestamp': (serialize.iso, 0),
+            'event_type': 1,
+            'source': 2
+        }, conn),
+        'tool_stats': serialize.Rows(tool_stats, {
+            'tool_name': (serialize.or_else('Unknown'), 0),
+            'pre_count': 1,
+            'post_count': 2,
+            'unique_commands': 3,
+            'unique_files': 4
+        }),
+        'timeline': serialize.Rows(timeline, {
+            'timestamp': (serialize.iso, 0),
+            'event_type': 1,
+            'tool_name': 2,
+            'command': 3,
+            'file_path': 4,
+            'pattern': 5,
+            'url': 6,
+            'description': 7
+        }, conn)
     })
 
 @app.route('/api/tracking/file-operations')
+@cached
 def get_file_operations():
     """Get all file operations from current session"""
-    conn = duckdb.connect(DB_PATH, read_only=True)
+    limit, cursor = page_params(default_size=50)
+    after, params = keyset(cursor, 'timestamp', 'id', descending=True)
+    conn = connect()
     
-    results = conn.execute("""
-        SELECT 
-            timestamp,
-            json_extract_string(data, '$.tool_name') as tool_name,
-            json_extract_string(data, '$.tool_input.file_path') as file_path,
-            event_type
-        FROM all_events
-        WHERE json_extract_string(data, '$.tool_name') IN ('Read', 'Write', 'Edit', 'MultiEdit')
-            AND json_extract_string(data, '$.tool_input.file_path') IS NOT NULL
-        ORDER BY timestamp DESC
-        LIMIT 50
-    """).fetchall()
+    def operations(days, days_params, size, label):
+        return conn.execute(f"""
+            SELECT 
+                timestamp,
+                tool_name,
+                json_extract_string(data, '$.tool_input.file_path') as file_path,
+                event_type,
+                id
+            FROM events
+            WHERE tool_name IN ('Read', 'Write', 'Edit', 'MultiEdit')
+                AND json_extract_string(data, '$.tool_input.file_path') IS NOT NULL
+                AND {after}
+                AND {days}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        """, params + days_params + [size], label=label).fetchall()
     
-    conn.close()
+    # Newest first: the days not yet archived, then the archive if the page is not full
+    since = archive.live_since(conn)
+    results = operations('date >= ?', [since], limit + 1, 'file_operations')
+    if len(results) <= limit and since > date.min:
+        results += operations('date < ?', [since], limit + 1 - len(results), 'file_operations_archive')
     
-    return jsonify([{
-        'timestamp': row[0].isoformat() if row[0] else None,
-        'tool_name': row[1],
-        'file_path': row[2],
-        'event_type': row[3]
-    } for row in results])
+    return paged(serialize.Rows(results[:limit], {
+        'timestamp': (serialize.iso, 0),
+        'tool_name': 1,
+        'file_path': 2,
+        'event_type': 3
+    }), results, limit, lambda row: (row[0], row[4]))
 
-@app.route('/api/tracking/all-sessions')
-def get_all_sessions_tracking():
-    """Get all sessions with their lifecycle and statistics"""
-    conn = duckdb.connect(DB_PATH, read_only=True)
-    
-    # Get all unique sessions with their lifecycle events
-    sessions = conn.execute("""
-        WITH session_stats AS (
-            SELECT 
-                json_extract_string(data, '$.session_id') as session_id,
-                MIN(timestamp) as session_start,
-                MAX(timestamp) as session_end,
-                COUNT(*) as total_events,
-                COUNT(DISTINCT json_extract_string(data, '$.tool_name')) as unique_tools,
-                COUNT(*) FILTER (WHERE event_type = 'SessionStart') as start_events,
-                COUNT(*) FILTER (WHERE event_type = 'SessionEnd') as end_events,
-                MAX(CASE WHEN event_type = 'SessionStart' 
-                    THEN json_extract_string(data, '$.source') END) as start_source,
-                MAX(json_extract_string(data, '$.cwd')) as cwd,
-                MAX(json_extract_string(data, '$.tmux_session')) as tmux_session,
-                STRING_AGG(DISTINCT json_extract_string(data, '$.tool_name'), ', ') as tools_used
-            FROM all_events
-            WHERE json_extract_string(data, '$.session_id') IS NOT NULL
-            GROUP BY session_id
-        ),
-        subagent_data AS (
-            SELECT 
-                session_id,
-                LIST(agent_type ORDER BY first_use) as agents_list,
-                COUNT(DISTINCT agent_type) as unique_agents_count
+# Hottest files and directories: all time from file_stats/directory_stats, or
+# over ?start=&end= from file_access, which holds only file reads and writes
+HOT_FILES_LIMIT = 50
+
+HOT_WINDOW_SQL = """
+    WITH hot_window AS (
+        SELECT
+            path,
+            COUNT(*) FILTER (WHERE operation = 'read') as reads,
+            COUNT(*) FILTER (WHERE operation = 'write') as writes,
+            COUNT(DISTINCT session_id) as sessions,
+            MAX(timestamp) as last_access
+        FROM file_access
+        WHERE starts_with(path, ?) AND timestamp >= ? AND timestamp < ?
+        GROUP BY path
+    )
+"""
+
+@app.route('/api/tracking/files/hot')
+@cached
+def get_hot_files():
+    """Most accessed files and directories, optionally below ?prefix= and within a time window"""
+    limit = limit_param(HOT_FILES_LIMIT)
+    prefix = request.args.get('prefix') or '/'
+    start, end = range_param('start'), range_param('end')
+    try:
+        depth = int(request.args['depth']) if request.args.get('depth') else None
+    except ValueError:
+        raise PageError('depth must be an integer')
+    conn = connect()
+
+    if start is None and end is None:
+        files = conn.execute("""
+            SELECT path, reads, writes, sessions, last_access
+            FROM file_stats
+            WHERE starts_with(path, ?)
+            ORDER BY reads + writes DESC, last_access DESC
+            LIMIT ?
+        """, [prefix, limit], label='hot_files').fetchall()
+        directories = conn.execute("""
+            SELECT directory, depth, reads, writes, files, last_access
+            FROM directory_stats
+            WHERE starts_with(directory, ?) AND directory <> ? AND (? IS NULL OR depth = ?)
+            ORDER BY reads + writes DESC, depth DESC
+            LIMIT ?
+        """, [prefix, prefix.rstrip('/') or '/', depth, depth, limit], label='hot_directories').fetchall()
+    else:
+        window = [prefix, start or datetime.min, end or datetime.max]
+        files = conn.execute(HOT_WINDOW_SQL + """
+            SELECT path, reads, writes, sessions, last_access
+            FROM hot_window
+            ORDER BY reads + writes DESC, last_access DESC
+            LIMIT ?
+        """, window + [limit], label='hot_files').fetchall()
+        directories = conn.execute(HOT_WINDOW_SQL + """
+            SELECT
+                array_to_string(parts[1:i], '/') as directory,
+                i - 1 as depth,
+                SUM(reads),
+                SUM(writes),
+                COUNT(*),
+                MAX(last_access)
             FROM (
-                SELECT 
-                    json_extract_string(data, '$.session_id') as session_id,
-                    json_extract_string(data, '$.tool_input.subagent_type') as agent_type,
-                    MIN(timestamp) as first_use
-                FROM all_events
-                WHERE event_type = 'PreToolUse'
-                    AND json_extract_string(data, '$.tool_name') = 'Task'
-                    AND json_extract_string(data, '$.tool_input.subagent_type') IS NOT NULL
-                GROUP BY 
-                    json_extract_string(data, '$.session_id'),
-                    json_extract_string(data, '$.tool_input.subagent_type')
-            ) agent_times
-            GROUP BY session_id
-        )
-        SELECT 
-            s.session_id,
-            s.session_start,
-            s.session_end,
-            s.total_events,
-            s.unique_tools,
-            s.start_events,
-            s.end_events,
-            s.start_source,
-            s.cwd,
-            s.tmux_session,
-            s.tools_used,
+                SELECT *, unnest(range(2, len(parts))) as i
+                FROM (SELECT *, string_split(path, '/') as parts FROM hot_window)
+            )
+            WHERE starts_with(directory, ?) AND directory <> ? AND (? IS NULL OR depth = ?)
+            GROUP BY directory, depth
+            ORDER BY SUM(reads) + SUM(writes) DESC, depth DESC
+            LIMIT ?
+        """, window + [prefix, prefix.rstrip('/') or '/', depth, depth, limit],
+            label='hot_directories').fetchall()
+
+    return json_response({
+        'prefix': prefix,
+        'start': start.isoformat() if start else None,
+        'end': end.isoformat() if end else None,
+        'files': serialize.Rows(files, {
+            'path': 0,
+            'reads': 1,
+            'writes': 2,
+            'sessions': 3,
+            'last_access': (serialize.iso, 4)
+        }),
+        'directories': serialize.Rows(directories, {
+            'directory': 0,
+            'depth': 1,
+            'reads': 2,
+            'writes': 3,
+            'files': 4,
+            'last_access': (serialize.iso, 5)
+        })
+    })
+
+@app.route('/api/tracking/files/history')
+@cached
+def get_file_history():
+    """Counts, sessions and accesses (newest first, paginated) of the file at ?path="""
+    path = request.args.get('path')
+    if not path:
+        raise PageError('path is required')
+    path = posixpath.normpath(path)
+    limit, cursor = page_params(default_size=100)
+    after, params = keyset(cursor, 'timestamp', 'event_id', descending=True)
+    conn = connect()
+
+    stats = conn.execute("""
+        SELECT reads, writes, sessions, first_access, last_access, last_session_id, last_tool
+        FROM file_stats
+        WHERE path = ?
+    """, [path], label='file_stats').fetchone()
+    if stats is None:
+        return json_response({'error': 'No accesses to this file'}), 404
+
+    sessions = conn.execute("""
+        SELECT f.session_id, s.tmux_session, f.reads, f.writes, f.first_access, f.last_access
+        FROM file_sessions f
+        LEFT JOIN session_summary s USING (session_id)
+        WHERE f.path = ?
+        ORDER BY f.last_access DESC
+    """, [path], label='file_sessions').fetchall()
+
+    accesses = conn.execute(f"""
+        SELECT timestamp, session_id, tmux_session, tool_name, operation, event_id
+        FROM file_access
+        WHERE path = ? AND {after}
+        ORDER BY timestamp DESC, event_id DESC
+        LIMIT ?
+    """, [path] + params + [limit + 1], label='file_accesses').fetchall()
+
+    return paged({
+        'path': path,
+        'reads': stats[0],
+        'writes': stats[1],
+        'session_count': stats[2],
+        'first_access': stats[3].isoformat() if stats[3] else None,
+        'last_access': stats[4].isoformat() if stats[4] else None,
+        'last_session_id': stats[5],
+        'last_tool': stats[6],
+        'sessions': serialize.Rows(sessions, {
+            'session_id': 0,
+            'tmux_session': 1,
+            'reads': 2,
+            'writes': 3,
+            'first_access': (serialize.iso, 4),
+            'last_access': (serialize.iso, 5)
+        }),
+        'accesses': serialize.Rows(accesses[:limit], {
+            'timestamp': (serialize.iso, 0),
+            'session_id': 1,
+            'tmux_session': 2,
+            'tool_name': 3,
+            'operation': 4,
+            'event_id': 5
+        })
+    }, accesses, limit, lambda row: (row[0], row[5]))
+
+# Columns of session_summary as served by all-sessions and /api/stream
+SESSION_COLUMNS = """
+            session_id,
+            session_start,
+            session_end,
+            total_events,
+            len(tools_used) as unique_tools,
+            start_events,
+            end_events,
+            start_source,
+            cwd,
+            tmux_session,
+            NULLIF(array_to_string(tools_used, ', '), '') as tools_used,
             CASE 
-                WHEN s.end_events > 0 THEN 'completed'
-                WHEN s.session_end > NOW() - INTERVAL '5 minutes' THEN 'active'
+                WHEN end_events > 0 THEN 'completed'
+                WHEN session_end > NOW() - INTERVAL '5 minutes' THEN 'active'
                 ELSE 'inactive'
             END as status,
-            COALESCE(sa.agents_list, []) as agents_used,
-            COALESCE(sa.unique_agents_count, 0) as unique_agents
-        FROM session_stats s
-        LEFT JOIN subagent_data sa ON s.session_id = sa.session_id
-        ORDER BY s.session_start DESC
-    """).fetchall()
-    
-    conn.close()
-    
-    return jsonify([{
+            agents_used,
+            len(agents_used) as unique_agents
+"""
+
+def session_row(row):
+    return {
         'session_id': row[0],
         'session_start': row[1].isoformat() if row[1] else None,
         'session_end': row[2].isoformat() if row[2] else None,
@@ -238,108 +694,157 @@ def get_all_sessions_tracking():
         'agents_used': row[12] if row[12] else [],
         'unique_agents': row[13],
         'duration_seconds': (row[2] - row[1]).total_seconds() if row[1] and row[2] else None
-    } for row in sessions])
+    }
+
+# session_row() for serialize.Rows
+SESSION_FIELDS = {
+    'session_id': 0,
+    'session_start': (serialize.iso, 1),
+    'session_end': (serialize.iso, 2),
+    'total_events': 3,
+    'unique_tools': 4,
+    'start_events': 5,
+    'end_events': 6,
+    'start_source': 7,
+    'cwd': 8,
+    'tmux_session': 9,
+    'tools_used': 10,
+    'status': 11,
+    'agents_used': (serialize.or_else([]), 12),
+    'unique_agents': 13,
+    'duration_seconds': (serialize.duration, 1, 2)
+}
+
+@app.route('/api/tracking/all-sessions')
+@cached
+def get_all_sessions_tracking():
+    """Get all sessions with their lifecycle and statistics, newest first"""
+    arrow = wants_arrow()
+    limit, cursor = page_params(default_size=100, max_size=MAX_ARROW_PAGE_SIZE if arrow else MAX_PAGE_SIZE)
+    after, params = keyset(cursor, 'session_start', 'session_id', descending=True)
+    session_id = request.args.get('session_id')
+    conn = connect()
+    
+    # Per-session lifecycle and usage, maintained by ingest (see derived.py)
+    query = f"""
+        SELECT
+            {SESSION_COLUMNS},
+            EXTRACT(EPOCH FROM (session_end - session_start)) as duration_seconds
+        FROM session_summary
+        WHERE (? IS NULL OR session_id = ?)
+            AND {after}
+        ORDER BY session_start DESC, session_id DESC
+    """
+    params = [session_id, session_id] + params
+    if arrow:
+        return arrow_paged(conn, query, params, limit, ('session_start', 'session_id'), 'sessions',
+                           descending=True)
+    sessions = conn.execute(query + "LIMIT ?", params + [limit + 1], label='sessions').fetchall()
+    
+    return paged(serialize.Rows(sessions[:limit], SESSION_FIELDS),
+                 sessions, limit, lambda row: (row[1], row[0]))
 
 @app.route('/api/tracking/stats/7days')
+@cached
 def get_seven_day_stats():
     """Get statistics for the last 7 days and 24 hours"""
-    conn = duckdb.connect(DB_PATH, read_only=True)
-    
-    # Get 7-day stats
-    stats_7d = conn.execute("""
-        WITH last_7_days AS (
-            SELECT *
-            FROM all_events
-            WHERE timestamp >= CURRENT_TIMESTAMP - INTERVAL '7 days'
-        )
-        SELECT 
-            COUNT(*) as total_events,
-            COUNT(DISTINCT json_extract_string(data, '$.tmux_session')) FILTER (
-                WHERE json_extract_string(data, '$.tmux_session') IS NOT NULL 
-                AND json_extract_string(data, '$.tmux_session') != ''
-            ) as unique_tmux_sessions,
-            COUNT(DISTINCT json_extract_string(data, '$.tool_input.subagent_type')) FILTER (
-                WHERE event_type = 'PreToolUse' 
-                AND json_extract_string(data, '$.tool_name') = 'Task'
-                AND json_extract_string(data, '$.tool_input.subagent_type') IS NOT NULL
-            ) as unique_agents
-        FROM last_7_days
-    """).fetchone()
+    conn = connect()
     
-    # Get 24-hour stats
-    stats_24h = conn.execute("""
-        WITH last_24_hours AS (
-            SELECT *
-            FROM all_events
-            WHERE timestamp >= CURRENT_TIMESTAMP - INTERVAL '24 hours'
-        )
-        SELECT 
-            COUNT(*) as total_events,
-            COUNT(DISTINCT json_extract_string(data, '$.tmux_session')) FILTER (
-                WHERE json_extract_string(data, '$.tmux_session') IS NOT NULL 
-                AND json_extract_string(data, '$.tmux_session') != ''
-            ) as unique_tmux_sessions,
-            COUNT(DISTINCT json_extract_string(data, '$.tool_input.subagent_type')) FILTER (
-                WHERE event_type = 'PreToolUse' 
-                AND json_extract_string(data, '$.tool_name') = 'Task'
-                AND json_extract_string(data, '$.tool_input.subagent_type') IS NOT NULL
-            ) as unique_agents
-        FROM last_24_hours
-    """).fetchone()
+    # Read from the minute/hour rollups maintained by ingest (see derived.py)
+    def window_stats(interval):
+        window = derived.rollup_window(f"(CURRENT_TIMESTAMP - INTERVAL '{interval}')::TIMESTAMP")
+        return conn.execute(f"""
+            SELECT 
+                (SELECT COALESCE(SUM(events), 0) FROM event_rollup WHERE {window}) as total_events,
+                (SELECT COUNT(DISTINCT value) FROM distinct_rollup
+                 WHERE {window} AND dimension = 'tmux_session') as unique_tmux_sessions,
+                (SELECT COUNT(DISTINCT value) FROM distinct_rollup
+                 WHERE {window} AND dimension = 'agent') as unique_agents
+        """, label='window_stats').fetchone()
     
-    conn.close()
+    stats = (window_stats('7 days') or (0, 0, 0)) + (window_stats('24 hours') or (0, 0, 0))
     
-    return jsonify({
-        'total_events_7d': stats_7d[0] if stats_7d else 0,
-        'unique_tmux_sessions_7d': stats_7d[1] if stats_7d else 0,
-        'unique_agents_7d': stats_7d[2] if stats_7d else 0,
-        'total_events_24h': stats_24h[0] if stats_24h else 0,
-        'unique_tmux_sessions_24h': stats_24h[1] if stats_24h else 0,
-        'unique_agents_24h': stats_24h[2] if stats_24h else 0
-    })
+    return json_response(serialize.Row(stats, {
+        'total_events_7d': 0,
+        'unique_tmux_sessions_7d': 1,
+        'unique_agents_7d': 2,
+        'total_events_24h': 3,
+        'unique_tmux_sessions_24h': 4,
+        'unique_agents_24h': 5
+    }))
 
 @app.route('/api/tracking/agents')
+@cached
 def get_agent_statistics():
     """Get statistics about agent (subagent) usage across all sessions"""
-    conn = duckdb.connect(DB_PATH, read_only=True)
+    conn = connect()
     
-    # Get agent usage statistics
+    # From the derived tables, which cover archived events. The last use is
+    # exact when it is in all_events and to the minute (from distinct_rollup)
+    # when it was archived.
     agents = conn.execute("""
+        WITH usage AS (
+            SELECT agent_type, SUM(events) as usage_count
+            FROM event_rollup
+            WHERE grain = 'hour'
+              AND event_type = 'PreToolUse'
+              AND tool_name = 'Task'
+              AND agent_type != ''
+            GROUP BY agent_type
+        ),
+        sessions AS (
+            SELECT agent_type, COUNT(*) as sessions_used, MIN(first_use) as first_used
+            FROM session_agents
+            GROUP BY agent_type
+        ),
+        minutes AS (
+            SELECT value as agent_type, MAX(bucket) as last_minute
+            FROM distinct_rollup
+            WHERE grain = 'minute' AND dimension = 'agent'
+            GROUP BY value
+        ),
+        live AS (
+            SELECT subagent_type as agent_type, MIN(timestamp) as first_used, MAX(timestamp) as last_used
+            FROM all_events
+            WHERE event_type = 'PreToolUse'
+              AND tool_name = 'Task'
+              AND subagent_type IS NOT NULL
+            GROUP BY subagent_type
+        )
         SELECT 
-            json_extract_string(data, '$.tool_input.subagent_type') as agent_type,
-            COUNT(*) as usage_count,
-            COUNT(DISTINCT json_extract_string(data, '$.session_id')) as sessions_used,
-            MIN(timestamp) as first_used,
-            MAX(timestamp) as last_used
-        FROM all_events 
-        WHERE event_type = 'PreToolUse' 
-          AND json_extract_string(data, '$.tool_name') = 'Task'
-          AND json_extract_string(data, '$.tool_input.subagent_type') IS NOT NULL
-        GROUP BY agent_type
-        ORDER BY usage_count DESC
-    """).fetchall()
+            u.agent_type,
+            u.usage_count,
+            COALESCE(s.sessions_used, 0) as sessions_used,
+            LEAST(s.first_used, l.first_used) as first_used,
+            CASE WHEN l.last_used IS NULL OR m.last_minute > date_trunc('minute', l.last_used)
+                THEN m.last_minute ELSE l.last_used END as last_used
+        FROM usage u
+        LEFT JOIN sessions s ON s.agent_type = u.agent_type
+        LEFT JOIN minutes m ON m.agent_type = u.agent_type
+        LEFT JOIN live l ON l.agent_type = u.agent_type
+        ORDER BY u.usage_count DESC
+    """, label='agents')
     
-    conn.close()
-    
-    return jsonify([{
-        'agent_type': row[0],
-        'usage_count': row[1],
-        'sessions_used': row[2],
-        'first_used': row[3].isoformat() if row[3] else None,
-        'last_used': row[4].isoformat() if row[4] else None
-    } for row in agents])
+    return json_response(serialize.Rows(agents, {
+        'agent_type': 0,
+        'usage_count': 1,
+        'sessions_used': 2,
+        'first_used': (serialize.iso, 3),
+        'last_used': (serialize.iso, 4)
+    }))
 
 @app.route('/api/agent/<agent_type>')
+@cached
 def get_agent_detail(agent_type):
     """Get detailed statistics and sessions for a specific agent"""
-    conn = duckdb.connect(DB_PATH, read_only=True)
+    conn = connect()
     
     # Get agent statistics including performance range
     # Note: Duration data is in PostToolUse events
     stats = conn.execute("""
         SELECT 
             COUNT(*) as total_invocations,
-            COUNT(DISTINCT json_extract_string(data, '$.session_id')) as unique_sessions,
+            COUNT(DISTINCT session_id) as unique_sessions,
             MIN(timestamp) as first_used,
             MAX(timestamp) as last_used,
             AVG(CAST(json_extract_string(data, '$.tool_response.totalDurationMs') AS DOUBLE)) as avg_duration_ms,
@@ -347,55 +852,53 @@ def get_agent_detail(agent_type):
             MAX(CAST(json_extract_string(data, '$.tool_response.totalDurationMs') AS DOUBLE)) as max_duration_ms,
             PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY CAST(json_extract_string(data, '$.tool_response.totalDurationMs') AS DOUBLE)) as median_duration_ms,
             PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY CAST(json_extract_string(data, '$.tool_response.totalDurationMs') AS DOUBLE)) as p95_duration_ms
-        FROM all_events 
+        FROM events 
         WHERE event_type = 'PostToolUse' 
-          AND json_extract_string(data, '$.tool_name') = 'Task'
-          AND json_extract_string(data, '$.tool_input.subagent_type') = ?
-    """, [agent_type]).fetchone()
+          AND tool_name = 'Task'
+          AND subagent_type = ?
+    """, [agent_type], label='agent_stats').fetchone()
     
     # Get recent invocations with session details
     invocations = conn.execute("""
         SELECT 
             timestamp,
-            json_extract_string(data, '$.session_id') as session_id,
+            session_id,
             json_extract_string(data, '$.tool_input.description') as description,
-            json_extract_string(data, '$.cwd') as cwd,
-            json_extract_string(data, '$.tmux_session') as tmux_session
-        FROM all_events 
+            cwd,
+            tmux_session
+        FROM events 
         WHERE event_type = 'PreToolUse' 
-          AND json_extract_string(data, '$.tool_name') = 'Task'
-          AND json_extract_string(data, '$.tool_input.subagent_type') = ?
+          AND tool_name = 'Task'
+          AND subagent_type = ?
         ORDER BY timestamp DESC
         LIMIT 50
-    """, [agent_type]).fetchall()
+    """, [agent_type], label='invocations').fetchall()
     
     # Get sessions that used this agent
     sessions = conn.execute("""
         WITH agent_sessions AS (
             SELECT DISTINCT 
-                json_extract_string(data, '$.session_id') as session_id
-            FROM all_events 
+                session_id
+            FROM events 
             WHERE event_type = 'PreToolUse' 
-              AND json_extract_string(data, '$.tool_name') = 'Task'
-              AND json_extract_string(data, '$.tool_input.subagent_type') = ?
+              AND tool_name = 'Task'
+              AND subagent_type = ?
         )
         SELECT 
             s.session_id,
             MIN(e.timestamp) as session_start,
             MAX(e.timestamp) as session_end,
             COUNT(*) as total_events,
-            MAX(json_extract_string(e.data, '$.cwd')) as cwd,
-            MAX(json_extract_string(e.data, '$.tmux_session')) as tmux_session
+            MAX(e.cwd) as cwd,
+            MAX(e.tmux_session) as tmux_session
         FROM agent_sessions s
-        JOIN all_events e ON json_extract_string(e.data, '$.session_id') = s.session_id
+        JOIN events e ON e.session_id = s.session_id
         GROUP BY s.session_id
         ORDER BY MAX(e.timestamp) DESC
         LIMIT 20
-    """, [agent_type]).fetchall()
-    
-    conn.close()
+    """, [agent_type], label='agent_sessions').fetchall()
     
-    return jsonify({
+    return json_response({
         'agent_type': agent_type,
         'stats': {
             'total_invocations': stats[0] if stats else 0,
@@ -408,105 +911,65 @@ def get_agent_detail(agent_type):
             'median_duration_ms': round(stats[7]) if stats and stats[7] else None,
             'p95_duration_ms': round(stats[8]) if stats and stats[8] else None
         },
-        'recent_invocations': [{
-            'timestamp': row[0].isoformat() if row[0] else None,
-            'session_id': row[1],
-            'description': row[2],
-            'cwd': row[3],
-            'tmux_session': row[4]
-        } for row in invocations],
-        'sessions': [{
-            'session_id': row[0],
-            'session_start': row[1].isoformat() if row[1] else None,
-            'session_end': row[2].isoformat() if row[2] else None,
-            'total_events': row[3],
-            'cwd': row[4],
-            'tmux_session': row[5],
-            'duration_seconds': (row[2] - row[1]).total_seconds() if row[1] and row[2] else None
-        } for row in sessions]
+        'recent_invocations': serialize.Rows(invocations, {
+            'timestamp': (serialize.iso, 0),
+            'session_id': 1,
+            'description': 2,
+            'cwd': 3,
+            'tmux_session': 4
+        }, conn),
+        'sessions': serialize.Rows(sessions, {
+            'session_id': 0,
+            'session_start': (serialize.iso, 1),
+            'session_end': (serialize.iso, 2),
+            'total_events': 3,
+            'cwd': 4,
+            'tmux_session': 5,
+            'duration_seconds': (serialize.duration, 1, 2)
+        }, conn)
     })
 
 @app.route('/api/tracking/active-sessions')
+@cached
 def get_active_sessions():
     """Get currently active sessions (sessions without SessionEnd events)"""
-    conn = duckdb.connect(DB_PATH, read_only=True)
+    conn = connect()
     
     # Get active sessions with their details
     active = conn.execute("""
-        WITH session_events AS (
-            SELECT 
-                json_extract_string(data, '$.session_id') as session_id,
-                MIN(timestamp) as session_start,
-                MAX(timestamp) as last_event,
-                COUNT(*) as total_events,
-                MAX(json_extract_string(data, '$.cwd')) as cwd,
-                MAX(json_extract_string(data, '$.tmux_session')) as tmux_session,
-                COUNT(*) FILTER (WHERE event_type = 'SessionEnd') as end_events
-            FROM all_events
-            WHERE json_extract_string(data, '$.session_id') IS NOT NULL
-            GROUP BY session_id
-            HAVING end_events = 0  -- Only sessions without SessionEnd
-        ),
-        subagent_data AS (
-            SELECT 
-                session_id,
-                LIST(agent_type ORDER BY first_use) as agents_list
-            FROM (
-                SELECT 
-                    json_extract_string(data, '$.session_id') as session_id,
-                    json_extract_string(data, '$.tool_input.subagent_type') as agent_type,
-                    MIN(timestamp) as first_use
-                FROM all_events
-                WHERE event_type = 'PreToolUse'
-                    AND json_extract_string(data, '$.tool_name') = 'Task'
-                    AND json_extract_string(data, '$.tool_input.subagent_type') IS NOT NULL
-                GROUP BY 
-                    json_extract_string(data, '$.session_id'),
-                    json_extract_string(data, '$.tool_input.subagent_type')
-            ) agent_times
-            GROUP BY session_id
-        )
         SELECT 
-            se.session_id,
-            se.session_start,
-            se.last_event,
-            se.total_events,
-            se.cwd,
-            se.tmux_session,
-            EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - se.last_event)) as seconds_since_last,
-            COALESCE(sa.agents_list, []) as agents_used
-        FROM session_events se
-        LEFT JOIN subagent_data sa ON se.session_id = sa.session_id
-        WHERE EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - se.last_event)) < 3600  -- Active within last hour
-        ORDER BY se.last_event DESC
+            session_id,
+            session_start,
+            session_end as last_event,
+            total_events,
+            cwd,
+            tmux_session,
+            EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - session_end)) as seconds_since_last,
+            agents_used
+        FROM session_summary
+        WHERE end_events = 0  -- Only sessions without SessionEnd
+            AND EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - session_end)) < 3600  -- Active within last hour
+        ORDER BY session_end DESC
         LIMIT 10
-    """).fetchall()
-    
-    conn.close()
+    """, label='active_sessions')
     
-    return jsonify([{
-        'session_id': row[0],
-        'session_start': row[1].isoformat() if row[1] else None,
-        'last_event': row[2].isoformat() if row[2] else None,
-        'total_events': row[3],
-        'cwd': row[4],
-        'tmux_session': row[5],
-        'seconds_since_last': row[6],
-        'agents_used': row[7] if row[7] else [],
-        'duration_seconds': (row[2] - row[1]).total_seconds() if row[1] and row[2] else None
-    } for row in active])
+    return json_response(serialize.Rows(active, {
+        'session_id': 0,
+        'session_start': (serialize.iso, 1),
+        'last_event': (serialize.iso, 2),
+        'total_events': 3,
+        'cwd': 4,
+        'tmux_session': 5,
+        'seconds_since_last': 6,
+        'agents_used': (serialize.or_else([]), 7),
+        'duration_seconds': (serialize.duration, 1, 2)
+    }))
 
-@app.route('/api/tracking/session/<session_id>/timeline')
-def get_session_timeline(session_id):
-    """Get detailed timeline for a specific session"""
-    conn = duckdb.connect(DB_PATH, read_only=True)
-    
-    # Get all events for this session with full data
-    events = conn.execute("""
-        SELECT 
+# Columns of all_events as served by the session timeline and /api/stream
+TIMELINE_COLUMNS = """
             timestamp,
             event_type,
-            json_extract_string(data, '$.tool_name') as tool_name,
+            tool_name,
             json_extract_string(data, '$.tool_input.command') as command,
             json_extract_string(data, '$.tool_input.file_path') as file_path,
             json_extract_string(data, '$.tool_input.pattern') as pattern,
@@ -517,16 +980,14 @@ def get_session_timeline(session_id):
             json_extract_string(data, '$.tool_input.query') as query,
             json_extract_string(data, '$.tool_input.old_string') as old_string,
             json_extract_string(data, '$.tool_input.new_string') as new_string,
-            json_extract_string(data, '$.tool_input.subagent_type') as subagent_type,
-            data as full_data
-        FROM all_events
-        WHERE json_extract_string(data, '$.session_id') = ?
-        ORDER BY timestamp ASC
-    """, [session_id]).fetchall()
-    
-    conn.close()
-    
-    return jsonify([{
+            subagent_type,
+            json_extract_string(data, '$.tool_use_id') as tool_use_id,
+            md5(json_extract(data, '$.tool_input')::VARCHAR) as input_hash,
+            id
+"""
+
+def timeline_row(event):
+    return {
         'timestamp': event[0].isoformat() if event[0] else None,
         'event_type': event[1],
         'tool_name': event[2],
@@ -541,8 +1002,93 @@ def get_session_timeline(session_id):
         'old_string': event[11],
         'new_string': event[12],
         'subagent_type': event[13],
-        'full_data': json.loads(event[14]) if event[14] else None
-    } for event in events])
+        'tool_use_id': event[14],
+        'input_hash': event[15],
+        'id': event[16]
+    }
+
+# timeline_row() for serialize.Rows
+TIMELINE_FIELDS = {
+    'timestamp': (serialize.iso, 0),
+    'event_type': 1,
+    'tool_name': 2,
+    'command': 3,
+    'file_path': 4,
+    'pattern': 5,
+    'description': 6,
+    'source': 7,
+    'permission_mode': 8,
+    'url': 9,
+    'query': 10,
+    'old_string': 11,
+    'new_string': 12,
+    'subagent_type': 13,
+    'tool_use_id': 14,
+    'input_hash': 15,
+    'id': 16
+}
+
+@app.route('/api/tracking/session/<session_id>/timeline')
+@cached
+def get_session_timeline(session_id):
+    """Get detailed timeline for a specific session, oldest first
+
+    Rows are kept light: the full payload of an event is fetched on demand
+    from /api/event/<id>.
+    """
+    arrow = wants_arrow()
+    limit, cursor = page_params(default_size=200, max_size=MAX_ARROW_PAGE_SIZE if arrow else MAX_PAGE_SIZE)
+    after, params = keyset(cursor, 'timestamp', 'id')
+    conn = connect()
+    
+    # Get one page of events for this session
+    query = f"""
+        SELECT {TIMELINE_COLUMNS}
+        FROM events
+        WHERE session_id = ?
+            AND date >= ?
+            AND {after}
+        ORDER BY timestamp ASC, id ASC
+    """
+    params = [session_id, session_since(conn, session_id)] + params
+    if arrow:
+        return arrow_paged(conn, query, params, limit, ('timestamp', 'id'), 'events')
+    events = conn.execute(query + "LIMIT ?", params + [limit + 1], label='events').fetchall()
+    
+    return paged(serialize.Rows(events[:limit], TIMELINE_FIELDS, conn),
+                 events, limit, lambda event: (event[0], event[16]))
+
+@app.route('/api/event/<int:event_id>')
+@cached
+def get_event(event_id):
+    """Full payload of one event, or only the JSON paths given as ?path=$.a.b (repeatable)"""
+    paths = request.args.getlist('path')
+    conn = connect()
+    
+    row = conn.execute("""
+        SELECT 
+            id,
+            timestamp,
+            event_type,
+            tool_name,
+            session_id,
+            CASE WHEN len(?::VARCHAR[]) = 0 THEN [data] ELSE json_extract(data, ?::VARCHAR[]) END as data
+        FROM events
+        WHERE id = ?
+    """, [paths, paths, event_id], label='event').fetchone()
+    
+    if not row:
+        return json_response({'error': 'Event not found'}), 404
+    
+    values = blobstore.resolve(conn, [json.loads(value) if value is not None else None for value in row[5]])
+    return json_response(serialize.Row(row[:5] + (dict(zip(paths, values)) if paths else values[0],), {
+        'id': 0,
+        'timestamp': (serialize.iso, 1),
+        'event_type': 2,
+        'tool_name': 3,
+        'session_id': 4,
+        'data': 5
+    }))
 
 @app.route('/tmux-sessions')
 def tmux_sessions_page():
@@ -555,25 +1101,23 @@ def tmux_session_detail_page(tmux_name):
     return render_template('tmux_session_detail.html', tmux_name=tmux_name)
 
 @app.route('/api/tracking/tmux-sessions')
+@cached
 def get_tmux_sessions():
     """Get all tmux sessions with aggregated statistics"""
-    conn = duckdb.connect(DB_PATH, read_only=True)
+    conn = connect()
     
-    # Get tmux sessions with their statistics
+    # Get tmux sessions with their statistics, from the per-session summaries
     sessions = conn.execute("""
         WITH tmux_stats AS (
             SELECT 
-                json_extract_string(data, '$.tmux_session') as tmux_session,
-                json_extract_string(data, '$.session_id') as session_id,
-                MIN(timestamp) as session_start,
-                MAX(timestamp) as session_end,
-                COUNT(*) as event_count
-            FROM all_events
-            WHERE json_extract_string(data, '$.tmux_session') IS NOT NULL 
-                AND json_extract_string(data, '$.tmux_session') != ''
-            GROUP BY 
-                json_extract_string(data, '$.tmux_session'),
-                json_extract_string(data, '$.session_id')
+                tmux_session,
+                session_id,
+                session_start,
+                session_end,
+                total_events as event_count
+            FROM session_summary
+            WHERE tmux_session IS NOT NULL 
+                AND tmux_session != ''
         ),
         tmux_aggregated AS (
             SELECT 
@@ -602,43 +1146,49 @@ def get_tmux_sessions():
             END as status
         FROM tmux_aggregated
         ORDER BY last_activity DESC
-    """).fetchall()
-    
-    conn.close()
+    """, label='tmux_sessions')
     
-    return jsonify([{
-        'tmux_session': row[0],
-        'total_sessions': row[1],
-        'first_activity': row[2].isoformat() if row[2] else None,
-        'last_activity': row[3].isoformat() if row[3] else None,
-        'total_events': row[4],
-        'total_duration_seconds': row[5],
-        'session_ids': row[6] if row[6] else [],
-        'status': row[7]
-    } for row in sessions])
+    return json_response(serialize.Rows(sessions, {
+        'tmux_session': 0,
+        'total_sessions': 1,
+        'first_activity': (serialize.iso, 2),
+        'last_activity': (serialize.iso, 3),
+        'total_events': 4,
+        'total_duration_seconds': 5,
+        'session_ids': (serialize.or_else([]), 6),
+        'status': 7
+    }))
 
 @app.route('/api/tracking/tmux-session/<path:tmux_name>/timeline')
+@cached
 def get_tmux_session_timeline(tmux_name):
-    """Get detailed timeline for a specific tmux session with activity gaps"""
-    conn = duckdb.connect(DB_PATH, read_only=True)
+    """Get detailed timeline for a specific tmux session with activity gaps
     
-    # Get all events for this tmux session with gap analysis
-    timeline = conn.execute("""
+    Arrow responses hold the timeline rows only, without the per-session summary.
+    """
+    arrow = wants_arrow()
+    limit, cursor = page_params(default_size=500, max_size=MAX_ARROW_PAGE_SIZE if arrow else MAX_PAGE_SIZE)
+    after, params = keyset(cursor, 'timestamp', 'id')
+    conn = connect()
+    
+    # Get one page of events for this tmux session with gap analysis
+    query = f"""
         WITH session_events AS (
             SELECT 
+                id,
                 timestamp,
-                json_extract_string(data, '$.session_id') as session_id,
+                session_id,
                 event_type,
-                json_extract_string(data, '$.tool_name') as tool_name,
+                tool_name,
                 json_extract_string(data, '$.tool_input.description') as description,
                 json_extract_string(data, '$.tool_input.command') as command,
                 json_extract_string(data, '$.tool_input.file_path') as file_path,
                 LEAD(timestamp) OVER (
-                    PARTITION BY json_extract_string(data, '$.session_id') 
+                    PARTITION BY session_id 
                     ORDER BY timestamp
                 ) as next_timestamp
-            FROM all_events
-            WHERE json_extract_string(data, '$.tmux_session') = ?
+            FROM events
+            WHERE tmux_session = ?
         ),
         events_with_gaps AS (
             SELECT 
@@ -662,23 +1212,28 @@ def get_tmux_session_timeline(tmux_name):
             file_path,
             next_timestamp,
             gap_seconds,
-            activity_state
+            activity_state,
+            id
         FROM events_with_gaps
-        ORDER BY timestamp ASC
-        LIMIT 1000
-    """, [tmux_name]).fetchall()
+        WHERE {after}
+        ORDER BY timestamp ASC, id ASC
+    """
+    params = [tmux_name] + params
+    if arrow:
+        return arrow_paged(conn, query, params, limit, ('timestamp', 'id'), 'timeline')
+    timeline = conn.execute(query + "LIMIT ?", params + [limit + 1], label='timeline').fetchall()
     
     # Get session-level summary
     sessions_summary = conn.execute("""
         WITH session_stats AS (
             SELECT 
-                json_extract_string(data, '$.session_id') as session_id,
+                session_id,
                 MIN(timestamp) as start_time,
                 MAX(timestamp) as end_time,
                 COUNT(*) as event_count
-            FROM all_events
-            WHERE json_extract_string(data, '$.tmux_session') = ?
-            GROUP BY json_extract_string(data, '$.session_id')
+            FROM events
+            WHERE tmux_session = ?
+            GROUP BY session_id
         )
         SELECT 
             session_id,
@@ -688,156 +1243,225 @@ def get_tmux_session_timeline(tmux_name):
             EXTRACT(EPOCH FROM (end_time - start_time)) as duration_seconds
         FROM session_stats
         ORDER BY start_time ASC
-    """, [tmux_name]).fetchall()
+    """, [tmux_name], label='sessions_summary').fetchall()
     
-    conn.close()
-    
-    return jsonify({
+    return paged({
         'tmux_session': tmux_name,
-        'timeline': [{
-            'timestamp': event[0].isoformat() if event[0] else None,
-            'session_id': event[1],
-            'event_type': event[2],
-            'tool_name': event[3],
-            'description': event[4],
-            'command': event[5],
-            'file_path': event[6],
-            'next_timestamp': event[7].isoformat() if event[7] else None,
-            'gap_seconds': event[8],
-            'activity_state': event[9]
-        } for event in timeline],
-        'sessions': [{
-            'session_id': sess[0],
-            'start_time': sess[1].isoformat() if sess[1] else None,
-            'end_time': sess[2].isoformat() if sess[2] else None,
-            'event_count': sess[3],
-            'duration_seconds': sess[4]
-        } for sess in sessions_summary]
-    })
+        'timeline': serialize.Rows(timeline[:limit], {
+            'timestamp': (serialize.iso, 0),
+            'session_id': 1,
+            'event_type': 2,
+            'tool_name': 3,
+            'description': 4,
+            'command': 5,
+            'file_path': 6,
+            'next_timestamp': (serialize.iso, 7),
+            'gap_seconds': 8,
+            'activity_state': 9
+        }, conn),
+        'sessions': serialize.Rows(sessions_summary, {
+            'session_id': 0,
+            'start_time': (serialize.iso, 1),
+            'end_time': (serialize.iso, 2),
+            'event_count': 3,
+            'duration_seconds': 4
+        }, conn)
+    }, timeline, limit, lambda event: (event[0], event[10]))
 
-@app.route('/api/tracking/tmux-session/<path:tmux_name>/activity')
-def get_tmux_session_activity(tmux_name):
-    """Get activity periods and idle gaps for a tmux session - ONLY for sessions with Stop events"""
-    conn = duckdb.connect(DB_PATH, read_only=True)
-    
-    # ONLY analyze sessions that have Stop events - no estimation
-    stop_based_analysis = conn.execute("""
+# Downsampled timeline: one bucket per pixel of the chart, so the response
+# size depends on the chart width and the number of Claude sessions, not on
+# how long the tmux session ran. Gaps to the next event are classified like
+# the paginated timeline above.
+DEFAULT_TIMELINE_WIDTH = 1000
+MAX_TIMELINE_WIDTH = 4000
+MIN_BUCKET_SECONDS = 1
+TIMELINE_STATES = ('active', 'idle', 'waiting')
+
+@app.route('/api/tracking/tmux-session/<path:tmux_name>/timeline/buckets')
+@cached
+def get_tmux_session_timeline_buckets(tmux_name):
+    """Activity states and event counts of a tmux session, bucketed over ?start=&end= for ?width= pixels"""
+    try:
+        width = int(request.args.get('width', DEFAULT_TIMELINE_WIDTH))
+    except ValueError:
+        raise PageError('width must be an integer')
+    if not 1 <= width <= MAX_TIMELINE_WIDTH:
+        raise PageError(f'width must be between 1 and {MAX_TIMELINE_WIDTH}')
+    start, end = range_param('start'), range_param('end')
+    conn = connect()
+
+    if start is None or end is None:
+        first, last = conn.execute("""
+            SELECT MIN(session_start), MAX(session_end)
+            FROM session_summary
+            WHERE tmux_session = ?
+        """, [tmux_name], label='timeline_range').fetchone()
+        start = start or first
+        end = end or last
+    if start is None or end is None:
+        return json_response({'tmux_session': tmux_name, 'start': None, 'end': None,
+                        'bucket_seconds': None, 'bucket_count': 0, 'states': TIMELINE_STATES,
+                        'totals': [], 'sessions': []})
+    if end <= start:
+        end = start + timedelta(seconds=MIN_BUCKET_SECONDS)
+
+    span = (end - start).total_seconds()
+    bucket_count = max(1, min(width, int(span // MIN_BUCKET_SECONDS)))
+    bucket_seconds = span / bucket_count
+
+    # Each event opens a span lasting until the next event of its Claude
+    # session; the state of a bucket is the one covering most of it. Spans are
+    # clipped to the range and spread over the buckets they overlap.
+    rows = conn.execute("""
         WITH session_events AS (
-            SELECT 
+            SELECT
+                session_id,
                 timestamp,
-                event_type,
-                json_extract_string(data, '$.session_id') as session_id,
-                LEAD(timestamp) OVER (
-                    PARTITION BY json_extract_string(data, '$.session_id') 
-                    ORDER BY timestamp
-                ) as next_timestamp,
-                LEAD(event_type) OVER (
-                    PARTITION BY json_extract_string(data, '$.session_id') 
-                    ORDER BY timestamp
-                ) as next_event_type
-            FROM all_events
-            WHERE json_extract_string(data, '$.tmux_session') = ?
-              AND event_type IN ('SessionStart', 'UserPromptSubmit', 'Stop')  -- Only relevant events for transitions
-              AND json_extract_string(data, '$.session_id') IN (
-                  SELECT DISTINCT json_extract_string(data, '$.session_id')
-                  FROM all_events
-                  WHERE event_type = 'Stop'
-                    AND json_extract_string(data, '$.tmux_session') = ?
-              )
+                LEAD(timestamp) OVER (PARTITION BY session_id ORDER BY timestamp) as next_timestamp
+            FROM events
+            WHERE tmux_session = $tmux
         ),
-        work_periods AS (
-            SELECT 
+        spans AS (
+            SELECT
                 session_id,
-                -- Working time: UserPromptSubmit/SessionStart to Stop
-                SUM(CASE 
-                    WHEN event_type IN ('UserPromptSubmit', 'SessionStart') 
-                         AND next_event_type = 'Stop'
-                    THEN EXTRACT(EPOCH FROM (next_timestamp - timestamp))
-                    ELSE 0 
-                END) as working_time_seconds,
-                -- Waiting time: Stop to UserPromptSubmit
-                SUM(CASE 
-                    WHEN event_type = 'Stop' 
-                         AND next_event_type = 'UserPromptSubmit'
-                    THEN EXTRACT(EPOCH FROM (next_timestamp - timestamp))
-                    ELSE 0 
-                END) as waiting_time_seconds,
-                COUNT(CASE WHEN event_type = 'Stop' THEN 1 END) as stop_count,
-                COUNT(CASE WHEN event_type = 'UserPromptSubmit' THEN 1 END) as prompt_count
+                CASE
+                    WHEN EXTRACT(EPOCH FROM (next_timestamp - timestamp)) > 30 THEN 'waiting'
+                    WHEN EXTRACT(EPOCH FROM (next_timestamp - timestamp)) > 5 THEN 'idle'
+                    ELSE 'active'
+                END as state,
+                GREATEST(epoch(timestamp), $start) - $start as span_start,
+                LEAST(epoch(next_timestamp), $end) - $start as span_end
             FROM session_events
-            GROUP BY session_id
+            WHERE timestamp < $end_time AND next_timestamp > $start_time
+        ),
+        coverage AS (
+            SELECT
+                session_id,
+                state,
+                bucket,
+                LEAST(span_end, (bucket + 1) * $size) - GREATEST(span_start, bucket * $size) as seconds
+            FROM (
+                SELECT *, unnest(range(
+                    CAST(floor(span_start / $size) AS BIGINT),
+                    LEAST(CAST(floor(span_end / $size) AS BIGINT), $buckets - 1) + 1
+                )) as bucket
+                FROM spans
+            )
+        ),
+        state_seconds AS (
+            SELECT
+                session_id,
+                bucket,
+                arg_max(state, seconds) as state,
+                SUM(seconds) FILTER (WHERE state = 'active') as active,
+                SUM(seconds) FILTER (WHERE state = 'idle') as idle,
+                SUM(seconds) FILTER (WHERE state = 'waiting') as waiting
+            FROM (
+                SELECT session_id, bucket, state, SUM(seconds) as seconds
+                FROM coverage
+                WHERE seconds > 0
+                GROUP BY session_id, bucket, state
+            )
+            GROUP BY session_id, bucket
+        ),
+        event_counts AS (
+            SELECT
+                session_id,
+                LEAST(CAST(floor((epoch(timestamp) - $start) / $size) AS BIGINT), $buckets - 1) as bucket,
+                COUNT(*) as events
+            FROM session_events
+            WHERE timestamp BETWEEN $start_time AND $end_time
+            GROUP BY 1, 2
         )
-        SELECT 
+        SELECT
             session_id,
-            working_time_seconds,
-            waiting_time_seconds,
-            working_time_seconds + waiting_time_seconds as total_time_seconds,
-            CASE 
-                WHEN (working_time_seconds + waiting_time_seconds) > 0 
-                THEN (working_time_seconds * 100.0) / (working_time_seconds + waiting_time_seconds)
-                ELSE 0 
-            END as active_percentage,
-            stop_count,
-            prompt_count
-        FROM work_periods
-        WHERE working_time_seconds IS NOT NULL OR waiting_time_seconds IS NOT NULL
-    """, [tmux_name, tmux_name]).fetchall()
+            bucket,
+            COALESCE(e.events, 0),
+            COALESCE(s.state, 'active'),
+            COALESCE(s.active, 0),
+            COALESCE(s.idle, 0),
+            COALESCE(s.waiting, 0)
+        FROM state_seconds s
+        FULL OUTER JOIN event_counts e USING (session_id, bucket)
+        ORDER BY session_id, bucket
+    """, {
+        'tmux': tmux_name,
+        'start_time': start,
+        'end_time': end,
+        'start': start.replace(tzinfo=timezone.utc).timestamp(),
+        'end': end.replace(tzinfo=timezone.utc).timestamp(),
+        'size': bucket_seconds,
+        'buckets': bucket_count,
+    }, label='timeline_buckets').fetchall()
+
+    # Sparse lanes per Claude session: [bucket, events, state] for buckets
+    # with any events or coverage, plus per-bucket totals across sessions
+    sessions = {}
+    totals = {}
+    for session_id, bucket, events, state, *seconds in rows:
+        sessions.setdefault(session_id, []).append([bucket, events, state])
+        total = totals.setdefault(bucket, [bucket, 0, 0.0, 0.0, 0.0])
+        total[1] += events
+        for i, value in enumerate(seconds):
+            total[2 + i] += value
+
+    return json_response({
+        'tmux_session': tmux_name,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'bucket_seconds': bucket_seconds,
+        'bucket_count': bucket_count,
+        'states': TIMELINE_STATES,
+        # [bucket, events, active_seconds, idle_seconds, waiting_seconds]
+        'totals': [[b, events, round(active, 3), round(idle, 3), round(waiting, 3)]
+                   for b, events, active, idle, waiting in sorted(totals.values())],
+        'sessions': serialize.Rows(list(sessions.items()), {'session_id': 0, 'buckets': 1}),
+    })
+
+
+@app.route('/api/tracking/tmux-session/<path:tmux_name>/activity')
+@cached
+def get_tmux_session_activity(tmux_name):
+    """Get activity periods and idle gaps for a tmux session - ONLY for sessions with Stop events"""
+    conn = connect()
     
+    # Work/wait state maintained per session at ingest (see derived.py). Only
+    # sessions with Stop events have accurate data - no estimation
+    activity = conn.execute("""
+        SELECT
+            session_id,
+            working_seconds,
+            waiting_seconds,
+            work_periods,
+            prompt_count,
+            stop_count,
+            wait_histogram,
+            longest_wait_seconds
+        FROM session_activity
+        WHERE tmux_session = ? AND stop_count > 0
+        ORDER BY last_seen_at DESC
+    """, [tmux_name], label='activity').fetchall()
     
-    # Get significant gaps (> 60 seconds) for visualization
+    # Significant gaps (> 60 seconds) for visualization
     significant_gaps = conn.execute("""
-        WITH session_events AS (
-            SELECT 
-                timestamp,
-                json_extract_string(data, '$.session_id') as session_id,
-                json_extract_string(data, '$.tool_name') as last_tool,
-                LEAD(timestamp) OVER (
-                    PARTITION BY json_extract_string(data, '$.session_id') 
-                    ORDER BY timestamp
-                ) as next_timestamp,
-                LEAD(json_extract_string(data, '$.tool_name')) OVER (
-                    PARTITION BY json_extract_string(data, '$.session_id') 
-                    ORDER BY timestamp
-                ) as next_tool
-            FROM all_events
-            WHERE json_extract_string(data, '$.tmux_session') = ?
-        )
-        SELECT 
-            session_id,
-            timestamp as gap_start,
-            next_timestamp as gap_end,
-            EXTRACT(EPOCH FROM (next_timestamp - timestamp)) as gap_seconds,
-            last_tool,
-            next_tool
-        FROM session_events
-        WHERE EXTRACT(EPOCH FROM (next_timestamp - timestamp)) > 60
+        SELECT session_id, gap_start, gap_end, gap_seconds, last_tool, next_tool
+        FROM session_gaps
+        WHERE tmux_session = ?
         ORDER BY gap_seconds DESC
         LIMIT 50
-    """, [tmux_name]).fetchall()
-    
-    conn.close()
+    """, [tmux_name], label='significant_gaps').fetchall()
     
-    # Only return stop-based analysis - no estimation
     activity_summary = []
-    
-    # Add stop-based analysis (accurate)
-    for row in stop_based_analysis:
-        working_seconds = row[1] or 0
-        waiting_seconds = row[2] or 0
-        
-        # For gap distribution, categorize the waiting periods
-        short_waits = 0
-        medium_waits = 0
-        long_waits = 0
-        
-        if waiting_seconds > 0:
-            # If we have waiting time, categorize it
-            if waiting_seconds <= 60:
-                short_waits = 1
-            elif waiting_seconds <= 300:
-                medium_waits = 1
-            else:
-                long_waits = 1
+    combined = [0] * (len(derived.WAIT_BUCKETS) + 1)
+    longest_overall = None
+    for row in activity:
+        working_seconds = row[1]
+        waiting_seconds = row[2]
+        histogram = row[6]
+        waits = sum(histogram)
+        combined = [a + b for a, b in zip(combined, histogram)]
+        longest_overall = max(longest_overall or 0, row[7] or 0)
+        total_seconds = working_seconds + waiting_seconds
         
         activity_summary.append({
             'session_id': row[0],
@@ -845,92 +1469,61 @@ def get_tmux_session_activity(tmux_name):
             'data_source': 'stop_events',
             'working_time_seconds': working_seconds,
             'waiting_time_seconds': waiting_seconds,
-            'total_time_seconds': row[3] or 0,
-            'active_percentage': row[4] or 0,
+            'total_time_seconds': total_seconds,
+            'active_percentage': working_seconds * 100.0 / total_seconds if total_seconds > 0 else 0,
             'stop_count': row[5],
-            'prompt_count': row[6],
+            'prompt_count': row[4],
+            'wait_histogram': histogram,
             # Legacy fields for compatibility
             'active_time_seconds': working_seconds,
-            'active_periods': row[5] if working_seconds > 0 else 0,  # Only count if there's work
-            'idle_periods': 0,
-            'short_waits': short_waits,
-            'medium_waits': medium_waits,
-            'long_waits': long_waits,
-            'longest_gap_seconds': waiting_seconds,
-            'avg_gap_seconds': waiting_seconds / row[5] if row[5] > 0 else 0,
-            'median_gap_seconds': waiting_seconds / row[5] if row[5] > 0 else 0
+            'active_periods': row[3],
+            'idle_periods': waits,
+            'short_waits': sum(histogram[:3]),
+            'medium_waits': histogram[3],
+            'long_waits': sum(histogram[4:]),
+            'longest_gap_seconds': row[7] or 0,
+            'avg_gap_seconds': waiting_seconds / waits if waits else 0,
+            'median_gap_seconds': derived.wait_quantile(histogram, 0.5, row[7]) or 0
         })
     
-    return jsonify({
+    return json_response({
         'tmux_session': tmux_name,
         'activity_summary': activity_summary,
-        'significant_gaps': [{
-            'session_id': gap[0],
-            'gap_start': gap[1].isoformat() if gap[1] else None,
-            'gap_end': gap[2].isoformat() if gap[2] else None,
-            'gap_seconds': gap[3],
-            'last_tool': gap[4],
-            'next_tool': gap[5]
-        } for gap in significant_gaps]
+        # Waits (Stop -> next prompt) of all sessions, counted per bucket of
+        # wait_buckets (upper bounds in seconds) plus one for longer waits
+        'wait_buckets': list(derived.WAIT_BUCKETS),
+        'wait_histogram': combined,
+        'median_wait_seconds': derived.wait_quantile(combined, 0.5, longest_overall),
+        'significant_gaps': serialize.Rows(significant_gaps, {
+            'session_id': 0,
+            'gap_start': (serialize.iso, 1),
+            'gap_end': (serialize.iso, 2),
+            'gap_seconds': 3,
+            'last_tool': 4,
+            'next_tool': 5
+        })
     })
 
 @app.route('/api/tracking/session/<session_id>/agents')
+@cached
 def get_session_agents_timeline(session_id):
     """Get agent execution timeline for a specific session"""
-    conn = duckdb.connect(DB_PATH, read_only=True)
+    conn = connect()
     
-    # Get all agent invocations with timing data
+    # Agent invocations, paired on tool_use_id at ingest (see derived.py)
     agents_data = conn.execute("""
-        WITH agent_events AS (
-            SELECT 
-                json_extract_string(data, '$.tool_input.subagent_type') as agent_type,
-                json_extract_string(data, '$.tool_input.description') as description,
-                event_type,
-                timestamp,
-                json_extract_string(data, '$.tool_response.token_usage.total_tokens') as total_tokens
-            FROM all_events
-            WHERE json_extract_string(data, '$.session_id') = ?
-                AND json_extract_string(data, '$.tool_name') = 'Task'
-                AND json_extract_string(data, '$.tool_input.subagent_type') IS NOT NULL
-        ),
-        -- First get all PreToolUse events
-        pre_events AS (
+        WITH paired_events AS (
             SELECT 
                 agent_type,
                 description,
-                timestamp as pre_time,
-                ROW_NUMBER() OVER (PARTITION BY agent_type ORDER BY timestamp) as rn
-            FROM agent_events
-            WHERE event_type = 'PreToolUse'
-        ),
-        -- Then get all PostToolUse events  
-        post_events AS (
-            SELECT 
-                agent_type,
-                description,
-                timestamp as post_time,
-                total_tokens,
-                ROW_NUMBER() OVER (PARTITION BY agent_type ORDER BY timestamp) as rn
-            FROM agent_events
-            WHERE event_type = 'PostToolUse'
-        ),
-        -- Combine them, including orphaned PostToolUse events
-        paired_events AS (
-            SELECT 
-                COALESCE(pre.agent_type, post.agent_type) as agent_type,
-                COALESCE(pre.description, post.description) as description,
-                COALESCE(pre.pre_time, post.post_time) as start_time,
-                post.post_time as end_time,
-                CASE 
-                    WHEN pre.pre_time IS NOT NULL AND post.post_time IS NOT NULL 
-                    THEN EXTRACT(EPOCH FROM (post.post_time - pre.pre_time))
-                    ELSE NULL
-                END as duration_seconds,
-                post.total_tokens
-            FROM pre_events pre
-            FULL OUTER JOIN post_events post 
-                ON pre.agent_type = post.agent_type 
-                AND pre.rn = post.rn
+                COALESCE(start_time, end_time) as start_time,
+                end_time,
+                duration_seconds,
+                total_tokens
+            FROM tool_calls
+            WHERE session_id = ?
+                AND tool_name = 'Task'
+                AND agent_type IS NOT NULL
         ),
         with_ordering AS (
             SELECT 
@@ -963,63 +1556,502 @@ def get_session_agents_timeline(session_id):
             ROW_NUMBER() OVER (PARTITION BY group_id ORDER BY start_time) as position_in_group
         FROM with_groups
         ORDER BY start_time ASC
-    """, [session_id]).fetchall()
-    
-    # Get summary statistics
-    stats = conn.execute("""
-        SELECT 
-            COUNT(DISTINCT json_extract_string(data, '$.tool_input.subagent_type')) as unique_agents,
-            COUNT(DISTINCT 
-                CASE WHEN event_type IN ('PreToolUse', 'PostToolUse') 
-                THEN json_extract_string(data, '$.tool_input.subagent_type') || event_type 
-                END
-            ) as total_events,
-            NULL as avg_duration_seconds  -- Will calculate from agents_data
-        FROM all_events
-        WHERE json_extract_string(data, '$.session_id') = ?
-            AND json_extract_string(data, '$.tool_name') = 'Task'
-            AND json_extract_string(data, '$.tool_input.subagent_type') IS NOT NULL
-    """, [session_id]).fetchone()
-    
-    conn.close()
-    
-    # Format the response
-    agents = []
-    for row in agents_data:
-        agents.append({
-            'agent_type': row[0],
-            'description': row[1],
-            'start_time': row[2].isoformat() if row[2] else None,
-            'end_time': row[3].isoformat() if row[3] else None,
-            'duration_seconds': row[4],
-            'total_tokens': int(row[5]) if row[5] else None,
-            'execution_order': row[6],
-            'group_id': row[7],
-            'group_size': row[8],
-            'position_in_group': row[9],
-            'is_parallel': row[8] > 1
-        })
+    """, [session_id], label='agent_calls').fetchall()
     
     # Calculate average duration from agents that have it
-    durations = [a['duration_seconds'] for a in agents if a['duration_seconds'] is not None]
+    durations = [row[4] for row in agents_data if row[4] is not None]
     avg_duration = sum(durations) / len(durations) if durations else None
     
-    return jsonify({
-        'agents': agents,
+    return json_response({
+        'agents': serialize.Rows(agents_data, {
+            'agent_type': 0,
+            'description': 1,
+            'start_time': (serialize.iso, 2),
+            'end_time': (serialize.iso, 3),
+            'duration_seconds': 4,
+            'total_tokens': (lambda tokens: [int(value) if value else None for value in tokens], 5),
+            'execution_order': 6,
+            'group_id': 7,
+            'group_size': 8,
+            'position_in_group': 9,
+            'is_parallel': (lambda sizes: [size > 1 for size in sizes], 8)
+        }, conn),
         'stats': {
-            'unique_agents': stats[0] if stats else 0,
-            'total_invocations': len(agents),  # Count actual agent invocations
+            'unique_agents': len(set(row[0] for row in agents_data)),
+            'total_invocations': len(agents_data),  # Count actual agent invocations
             'avg_duration_seconds': avg_duration,
-            'parallel_groups': len(set(a['group_id'] for a in agents if a['is_parallel']))
+            'parallel_groups': len(set(row[7] for row in agents_data if row[8] > 1))
         }
     })
 
-# All API endpoints use the all_events table
+@app.route('/api/tracking/tool-latency')
+@cached
+def get_tool_latency():
+    """Per-tool call counts and latency percentiles, optionally for one session"""
+    session_id = request.args.get('session_id')
+    conn = connect()
+    
+    rows = conn.execute("""
+        SELECT 
+            tool_name,
+            COUNT(*) as calls,
+            COUNT(*) FILTER (WHERE status = 'error') as errors,
+            COUNT(*) FILTER (WHERE status = 'running') as running,
+            AVG(duration_seconds) as avg_seconds,
+            PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY duration_seconds) as median_seconds,
+            PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY duration_seconds) as p95_seconds,
+            MAX(duration_seconds) as max_seconds
+        FROM tool_calls
+        WHERE tool_name IS NOT NULL
+            AND (? IS NULL OR session_id = ?)
+        GROUP BY tool_name
+        ORDER BY calls DESC
+    """, [session_id, session_id], label='tool_latency')
+    
+    return json_response(serialize.Rows(rows, {
+        'tool_name': 0,
+        'calls': 1,
+        'errors': 2,
+        'running': 3,
+        'avg_seconds': 4,
+        'median_seconds': 5,
+        'p95_seconds': 6,
+        'max_seconds': 7
+    }))
+
+# Search results are ranked, so their cursor holds an offset; every match is
+# scored for each page anyway (see search.py)
+SEARCH_PAGE_SIZE = 20
+# Longer offsets would overflow DuckDB's BIGINT OFFSET
+MAX_SEARCH_CURSOR_DIGITS = 18
+
+@app.route('/api/search')
+@cached
+def search_events():
+    """Events whose command, file path, pattern, URL, description or prompt contain every term of ?q="""
+    text = request.args.get('q', '')
+    if not search.parse_query(text):
+        raise PageError('q must contain a search term')
+    limit = limit_param(SEARCH_PAGE_SIZE)
+    token = request.args.get('cursor')
+    offset = 0
+    if token:
+        # An offset as we encode it: int() alone would also take '-5', ' 5' or '1_0'
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        except ValueError:
+            raw = b''
+        if not raw.isdigit() or len(raw) > MAX_SEARCH_CURSOR_DIGITS:
+            raise PageError('invalid cursor')
+        offset = int(raw)
+    conn = connect()
+
+    total, matches = search.query(
+        conn, text,
+        tool=request.args.get('tool'),
+        session_id=request.args.get('session_id'),
+        tmux_session=request.args.get('tmux_session'),
+        start=range_param('start'),
+        end=range_param('end'),
+        limit=limit,
+        offset=offset)
+
+    response = json_response({
+        'query': text,
+        'terms': [term + ('*' if is_prefix else '') for term, is_prefix in search.parse_query(text)],
+        'total': total,
+        'results': serialize.Rows(matches, {
+            'event_id': 0,
+            'timestamp': (serialize.iso, 1),
+            'session_id': 2,
+            'tmux_session': 3,
+            'tool_name': 4,
+            'event_type': 5,
+            'score': (serialize.rounded(4), 6),
+            'fields': 7
+        })
+    })
+    if offset + limit < total:
+        response.headers['X-Next-Cursor'] = base64.urlsafe_b64encode(
+            str(offset + limit).encode()).decode().rstrip('=')
+    return response
+
+# Token usage is read from the hourly token_rollup (see derived.py); windows
+# are widened to whole hours
+TOKEN_DIMENSIONS = {'session': 'session_id', 'agent': 'agent_type', 'tool': 'tool_name', 'tmux': 'tmux_session'}
+TOKEN_COLUMNS = ['input_tokens', 'output_tokens', 'cache_creation_tokens', 'cache_read_tokens', 'total_tokens']
+TOKEN_BUCKETS = ('hour', 'day')
+DEFAULT_TOKEN_DAYS = 7
+
+def token_window(default_days=None):
+    """SQL condition on token_rollup.hour for ?start=&end=, its parameters and the window"""
+    start, end = range_param('start'), range_param('end')
+    if start is None and default_days:
+        start = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=default_days)
+    conditions, params = [], []
+    if start:
+        conditions.append("hour >= date_trunc('hour', ?::TIMESTAMP)")
+        params.append(start)
+    if end:
+        conditions.append("hour < ?")
+        params.append(end)
+    return ' AND '.join(conditions) or 'TRUE', params, start, end
+
+def token_usage(row):
+    return dict(zip(['calls'] + TOKEN_COLUMNS, row))
+
+def token_fields(first):
+    """token_usage() of the columns from first on, as serialize.Rows fields"""
+    return {name: first + i for i, name in enumerate(['calls'] + TOKEN_COLUMNS)}
+
+@app.route('/api/tracking/tokens/top')
+@cached
+def get_top_token_consumers():
+    """Sessions, agent types, tools or tmux sessions (?by=) using the most tokens"""
+    by = request.args.get('by', 'session')
+    if by not in TOKEN_DIMENSIONS:
+        raise PageError(f"by must be one of {', '.join(TOKEN_DIMENSIONS)}")
+    column = TOKEN_DIMENSIONS[by]
+    limit = limit_param(10)
+    window, params, start, end = token_window()
+    conn = connect()
+
+    sums = ', '.join(f'SUM({name})' for name in TOKEN_COLUMNS)
+    rows = conn.execute(f"""
+        SELECT NULLIF({column}, '') as key, SUM(calls), {sums}
+        FROM token_rollup
+        WHERE {window}
+        GROUP BY key
+        ORDER BY SUM(total_tokens) DESC, key
+        LIMIT ?
+    """, params + [limit], label='top_tokens').fetchall()
+    totals = conn.execute(f"""
+        SELECT COALESCE(SUM(calls), 0), {', '.join(f'COALESCE(SUM({name}), 0)' for name in TOKEN_COLUMNS)}
+        FROM token_rollup
+        WHERE {window}
+    """, params, label='token_totals').fetchone()
+
+    return json_response({
+        'by': by,
+        'start': start.isoformat() if start else None,
+        'end': end.isoformat() if end else None,
+        'totals': token_usage(totals),
+        'top': serialize.Rows(rows, {by: 0, **token_fields(1)})
+    })
+
+@app.route('/api/tracking/tokens/timeseries')
+@cached
+def get_token_timeseries():
+    """Token usage per hour or day (?bucket=) over ?start= (default: the last 7 days) to ?end=
+
+    Filtered by any of ?session_id=, ?agent_type=, ?tool_name= and ?tmux_session=.
+    """
+    bucket = request.args.get('bucket', 'hour')
+    if bucket not in TOKEN_BUCKETS:
+        raise PageError(f"bucket must be one of {', '.join(TOKEN_BUCKETS)}")
+    window, params, start, end = token_window(DEFAULT_TOKEN_DAYS)
+    filters = []
+    for column in TOKEN_DIMENSIONS.values():
+        value = request.args.get(column)
+        if value:
+            filters.append(f"{column} = ?")
+            params.append(value)
+    conn = connect()
+
+    rows = conn.execute(f"""
+        SELECT date_trunc('{bucket}', hour) as bucket, SUM(calls), {', '.join(f'SUM({name})' for name in TOKEN_COLUMNS)}
+        FROM token_rollup
+        WHERE {' AND '.join([window] + filters)}
+        GROUP BY bucket
+        ORDER BY bucket
+    """, params, label='token_timeseries')
+
+    return json_response({
+        'bucket': bucket,
+        'start': start.isoformat() if start else None,
+        'end': end.isoformat() if end else None,
+        'series': serialize.Rows(rows, {'bucket': (serialize.iso, 0), **token_fields(1)})
+    })
+
+# /api/batch answers several cached endpoints in one request
+MAX_BATCH_REQUESTS = 16
+
+@app.route('/api/batch', methods=['POST'])
+def batch():
+    """Responses of several GET API endpoints, read from one database snapshot
+    
+    Takes a JSON array of paths with their query strings, such as
+    ["/api/tracking/stats/7days", "/api/tracking/all-sessions?limit=50"], and
+    returns {"responses": [{"path", "status", "next_cursor", "body"}, ...]} in
+    the same order. The panels run one after another on the request's cursor
+    inside one read transaction, so they all see the same events; each is
+    still served from (and stored in) the response cache.
+    """
+    paths = request.get_json(silent=True)
+    if (not isinstance(paths, list) or not 0 < len(paths) <= MAX_BATCH_REQUESTS
+            or not all(isinstance(path, str) for path in paths)):
+        return json_response({'error': f'Expected a JSON array of 1 to {MAX_BATCH_REQUESTS} paths'}), 400
+    
+    adapter = app.url_map.bind('localhost')
+    views = []
+    for path in paths:
+        try:
+            endpoint, view_args = adapter.match(path.partition('?')[0], method='GET')
+        except HTTPException:
+            endpoint = None
+        view = app.view_functions.get(endpoint)
+        if not getattr(view, 'batchable', False):
+            return json_response({'error': f'Not a batchable endpoint: {path}'}), 400
+        views.append((path, view, view_args))
+    
+    g.batch_version = data_version()
+    conn = connect()
+    conn.begin()
+    parts = []
+    hits = 0
+    try:
+        for path, view, view_args in views:
+            # Same app context, so the panel's connect() returns this request's cursor
+            with app.test_request_context(path):
+                try:
+                    response = make_response(view(**view_args))
+                except Exception as e:
+                    response = make_response(app.handle_user_exception(e))
+                hits += g.pop('cache_status', None) == 'hit'
+                parts.append(b'{"path":%s,"status":%d,"next_cursor":%s,"body":%s}' % (
+                    json.dumps(path).encode(), response.status_code,
+                    json.dumps(response.headers.get('X-Next-Cursor')).encode(), response.get_data()))
+                response.close()
+    finally:
+        conn.rollback()
+    
+    g.cache_status = f"{hits}/{len(views)} hit"
+    return Response(b'{"responses":[' + b','.join(parts) + b']}', mimetype='application/json')
+
+@app.route('/api/db/pool-stats')
+def get_pool_stats():
+    """Connection pool counters (opens, reopens, checkouts, cursors)"""
+    return json_response(pool.stats())
+
+@app.route('/api/cache-stats')
+def get_cache_stats():
+    """Response cache counters (hits, misses, stale entries, evictions, 304s)"""
+    return json_response(response_cache.stats())
+
+# Row counts on /metrics: table -> SQL
+METRIC_TABLES = {
+    'all_events': "SELECT COUNT(*) FROM all_events",
+    'archived_events': "SELECT COALESCE(SUM(events), 0) FROM archive_log",
+    'session_summary': "SELECT COUNT(*) FROM session_summary",
+    'tool_calls': "SELECT COUNT(*) FROM tool_calls",
+    'blobs': "SELECT COUNT(*) FROM blobs",
+}
+
+def stat_gauges(prefix, help_text, stats):
+    """Gauges for the numeric values of a stats dict"""
+    return [(f"{prefix}_{key}", f"{help_text} ({key})", None, value)
+            for key, value in stats.items() if isinstance(value, (int, float))]
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request/query histograms and pool, cache and table stats in the Prometheus text format"""
+    gauges = stat_gauges('dashboard_pool', 'Connection pool', pool.stats())
+    gauges += stat_gauges('dashboard_cache', 'Response cache', response_cache.stats())
+    if collector is not None:
+        gauges += stat_gauges('dashboard_collector', 'Embedded collector', collector.stats)
+    if limiter is not None:
+        gauges += stat_gauges('dashboard_requests', 'Concurrency limit', limiter.stats())
+    if watchdog is not None:
+        gauges += stat_gauges('dashboard_query_watchdog', 'Query timeout', watchdog.stats())
+    try:
+        conn = connect()
+        for table, sql in METRIC_TABLES.items():
+            rows = conn.execute(sql, label='table_rows').fetchone()[0]
+            gauges.append(('dashboard_table_rows', 'Rows per table', {'table': table}, rows))
+    except duckdb.Error:
+        # No database yet, or one from before the table existed
+        pass
+    return Response(registry.render(gauges), mimetype='text/plain; version=0.0.4')
+
+# Live updates: /api/stream is a Server-Sent Events feed of rows added to
+# all_events since a high-water mark on the event id, plus the session_summary
+# rows they touched. Idle streams only wait for the collector to signal a write
+# (or, without one, watch the database file) and never query the database.
+STREAM_BATCH_SIZE = 500
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_RETRY_MS = 3000
+
+def wait_for_data(version, timeout):
+    """Wait up to timeout seconds for data_version() to move past version; returns it"""
+    if collector is not None:
+        return collector.wait_for_write(version, timeout)
+    deadline = time.monotonic() + timeout
+    while True:
+        current = pool.file_signature()
+        if current != version or time.monotonic() >= deadline:
+            return current
+        time.sleep(0.5)
+
+def fetch_stream_batch(last_id, session_id):
+    """(new high-water mark, events, touched sessions) for events after last_id
+    
+    Uses its own short checkout: the stream must not hold a cursor while it
+    waits for writes.
+    """
+    conn = metrics.TimedCursor(pool.checkout(), '/api/stream', registry,
+                               slow_log=slow_query_log, watchdog=watchdog)
+    try:
+        high = conn.execute("SELECT MAX(id) FROM all_events WHERE id > ?", [last_id],
+                            label='high_water_mark').fetchone()[0]
+        if high is None:
+            return last_id, [], []
+        events = conn.execute(f"""
+            SELECT {TIMELINE_COLUMNS}, session_id, tmux_session
+            FROM all_events
+            WHERE id > ? AND id <= ?
+                AND (? IS NULL OR session_id = ?)
+            ORDER BY id ASC
+            LIMIT ?
+        """, [last_id, high, session_id, session_id, STREAM_BATCH_SIZE], label='events').fetchall()
+        sessions = conn.execute(f"""
+            SELECT {SESSION_COLUMNS}
+            FROM session_summary
+            WHERE session_id IN (SELECT unnest(?::VARCHAR[]))
+        """, [sorted({event[17] for event in events if event[17]})], label='sessions').fetchall() if events else []
+        rows = blobstore.resolve(conn, [dict(timeline_row(event), session_id=event[17], tmux_session=event[18])
+                                        for event in events])
+    finally:
+        conn.finish()
+        pool.release(conn.cursor)
+    
+    # A full batch may have more behind it; otherwise everything up to high
+    # was seen, including events of other sessions the filter skipped
+    if len(events) == STREAM_BATCH_SIZE:
+        high = events[-1][16]
+    return high, rows, [session_row(row) for row in sessions]
+
+@app.route('/api/stream')
+def stream():
+    """Push new events and changed session summaries as they are written
+    
+    Each `update` message carries {"events": [...], "sessions": [...]} and the
+    id of its last event. Reconnecting browsers resume after it through the
+    Last-Event-ID header; ?since=<id> does the same for other clients, and
+    without either the stream starts at the newest event. ?session_id=
+    restricts events to one session.
+    """
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    session_id = request.args.get('session_id')
+    if since is None:
+        conn = pool.checkout()
+        try:
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM all_events").fetchone()[0]
+        finally:
+            pool.release(conn)
+    else:
+        try:
+            last_id = int(since)
+        except ValueError:
+            return json_response({'error': 'since must be an event id'}), 400
+    
+    def generate(last_id):
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        while True:
+            # Take the version first, so a write during the query wakes the wait
+            version = data_version()
+            last_id, events, sessions = fetch_stream_batch(last_id, session_id)
+            if events:
+                payload = json.dumps({'events': events, 'sessions': sessions})
+                yield f"id: {last_id}\nevent: update\ndata: {payload}\n\n"
+                if len(events) == STREAM_BATCH_SIZE:
+                    continue
+            if wait_for_data(version, STREAM_KEEPALIVE_SECONDS) == version:
+                # Comment line: keeps proxies from timing out and detects gone clients
+                yield ": keepalive\n\n"
+    
+    return Response(stream_with_context(generate(last_id)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# All API endpoints use the events view
+
+# Defaults with --production
+PRODUCTION_MAX_CONCURRENT = 16
+PRODUCTION_QUERY_TIMEOUT = 30.0
+SHUTDOWN_GRACE_SECONDS = 10.0
+
+def startup(args, start_collector):
+    """Migrate the database and start the collector, query watchdog and limiter"""
+    global collector, slow_query_log, watchdog, limiter
+    if args.slow_query_ms is not None:
+        slow_query_log = metrics.SlowQueryLog(SLOW_QUERY_LOG_PATH, args.slow_query_ms)
 
-if __name__ == '__main__':
     # Check if database exists
     if not os.path.exists(DB_PATH):
         print(f"Warning: Database not found at {DB_PATH}")
         print("Make sure to run the hooks to generate some data first!")
-    
-    app.run(debug=True, port=8090, host='0.0.0.0')
\ No newline at end of file
+    else:
+        # Queries rely on the promoted columns, so bring older files up to date
+        try:
+            before, after = schema.ensure_schema(DB_PATH)
+            if before != after:
+                print(f"Migrated database schema from version {before} to {after}")
+        except duckdb.Error as e:
+            print(f"Warning: Could not migrate database schema: {e}")
+
+    if start_collector:
+        try:
+            collector = Collector(db_path=DB_PATH, archive_days=args.archive_days).start()
+            pool.attach(collector.cursor())
+        except (CollectorError, duckdb.Error) as e:
+            print(f"Warning: Could not start embedded collector: {e}")
+
+    if args.query_timeout:
+        watchdog = db.QueryWatchdog(args.query_timeout).start()
+    if args.max_concurrent:
+        limiter = serving.RequestLimiter(args.max_concurrent)
+
+def shutdown():
+    """Close the pool and stop what startup() started"""
+    pool.close()
+    if collector is not None:
+        collector.stop()
+    if watchdog is not None:
+        watchdog.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Claude Code monitoring dashboard')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--no-collector', action='store_true',
+                        help='Do not run the event collector in this process')
+    parser.add_argument('--archive-days', type=int,
+                        help='Have the collector move events older than this many days to the Parquet archive')
+    parser.add_argument('--slow-query-ms', type=float,
+                        help=f'Append EXPLAIN ANALYZE of queries slower than this to {SLOW_QUERY_LOG_PATH}')
+    parser.add_argument('--production', action='store_true',
+                        help='Serve requests on a threaded server without the debugger and reloader')
+    parser.add_argument('--max-concurrent', type=int,
+                        help='Answer requests beyond this many in flight with 503 '
+                             f'(default with --production: {PRODUCTION_MAX_CONCURRENT}; 0 for no limit)')
+    parser.add_argument('--query-timeout', type=float,
+                        help='Cancel queries running longer than this many seconds with 504 '
+                             f'(default with --production: {PRODUCTION_QUERY_TIMEOUT:g}; 0 for none)')
+    args = parser.parse_args()
+
+    if args.production:
+        if args.max_concurrent is None:
+            args.max_concurrent = PRODUCTION_MAX_CONCURRENT
+        if args.query_timeout is None:
+            args.query_timeout = PRODUCTION_QUERY_TIMEOUT
+
+    # With the debug reloader the script runs twice; only the serving child
+    # (WERKZEUG_RUN_MAIN) may own the collector socket and writer connection.
+    startup(args, start_collector=not args.no_collector and
+            (args.production or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'))
+    try:
+        if args.production:
+            serving.serve(app, args.host, args.port, limiter, grace=SHUTDOWN_GRACE_SECONDS)
+        else:
+            app.run(debug=True, port=args.port, host=args.host)
+    finally:
+        shutdown()
@@ -0,0 +1,241 @@
+"""Parquet archive tier for old events
+
+all_events only has to keep the recent days that the dashboard queries most.
+Compaction moves events older than a retention period into hive-partitioned
+Parquet files next to the database, in a directory named after it, and
+deletes them from the table:
+
+    logs/claude_events.archive/date=2024-05-01/part-<uuid>.parquet
+    logs/claude_events.archive/date=2024-05-01/tmux_session=work/part-<uuid>.parquet  (--by-tmux)
+
+    python web-ui/archive.py compact [--days 30] [--by-tmux]
+    python web-ui/archive.py status
+
+The dashboard reads the `events` view, the union of all_events and every
+archived file with an extra `date` column. Filters on date (and on
+tmux_session with --by-tmux) prune whole partitions, so queries over recent
+windows (`date >= live_since()`) or a session's days skip the archive while
+session pages still see all of history. The derived tables keep covering
+archived events.
+
+Files are written to a staging directory first and only moved into place
+after the rows were deleted and the run recorded in archive_log, so a crash
+at any point neither loses nor duplicates events: the next run finishes or
+discards the staged files.
+
+Archives used to be written to archive/ next to the database, shared by every
+database in the directory. recover() moves such a directory to the new name
+if its files hold exactly the events this database archived.
+"""
+import argparse
+import glob
+import logging
+import os
+import shutil
+import uuid
+from datetime import date
+
+import duckdb
+
+import ingest
+
+logger = logging.getLogger('archive')
+
+# Path to DuckDB file (relative to web-ui folder)
+DB_PATH = os.path.join(os.path.dirname(__file__), '../logs/claude_events.duckdb')
+
+ARCHIVE_SUFFIX = '.archive'
+LEGACY_ARCHIVE_DIRNAME = 'archive'
+STAGING_PREFIX = '.staging-'
+DEFAULT_RETENTION_DAYS = 30
+
+ARCHIVE_COLUMNS = ('timestamp, event_type, tool_name, matcher, data, '
+                   'session_id, tmux_session, cwd, subagent_type, id')
+
+# Partition layout -> (columns, file glob below the archive directory, hive column types)
+LAYOUTS = {
+    'date': (['date'], 'date=*/*.parquet', "{'date': DATE}"),
+    'date_tmux': (['date', 'tmux_session'], 'date=*/tmux_session=*/*.parquet',
+                  "{'date': DATE, 'tmux_session': VARCHAR}"),
+}
+
+
+def archive_dir(conn):
+    """Archive directory of the database conn is connected to: <name>.archive beside it"""
+    path = conn.execute(
+        "SELECT path FROM duckdb_databases() WHERE database_name = current_database()"
+    ).fetchone()[0]
+    if not path:
+        raise ValueError("An in-memory database has no archive directory")
+    return os.path.splitext(os.path.abspath(path))[0] + ARCHIVE_SUFFIX
+
+
+def live_since(conn):
+    """First day of which no events are archived (date.min if none are)
+
+    Compaction archives whole days before its cutoff, so `date >= live_since()`
+    on the events view skips every archived file and misses no event.
+    """
+    cutoff = conn.execute("SELECT CAST(MAX(cutoff) AS DATE) FROM archive_log").fetchone()[0]
+    return cutoff or date.min
+
+
+def _sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def ensure_view(conn):
+    """(Re)create the `events` view over all_events and the archived files
+
+    read_parquet() fails on a glob without matches, so only layouts that have
+    files are included; run again after files were added or removed.
+    """
+    root = archive_dir(conn)
+    parts = [f"SELECT {ARCHIVE_COLUMNS}, CAST(timestamp AS DATE) as date FROM all_events"]
+    for _columns, pattern, hive_types in LAYOUTS.values():
+        path = os.path.join(root, pattern)
+        if glob.glob(path):
+            parts.append(f"""
+                SELECT {ARCHIVE_COLUMNS}, date
+                FROM read_parquet({_sql_string(path)}, hive_partitioning = true,
+                                  hive_types = {hive_types})""")
+    conn.execute("CREATE OR REPLACE VIEW events AS " + "\nUNION ALL BY NAME\n".join(parts))
+
+
+def _publish(staging, root):
+    """Move staged files to the same place below the archive directory"""
+    for dirpath, _dirnames, filenames in os.walk(staging):
+        target = os.path.join(root, os.path.relpath(dirpath, staging))
+        for filename in filenames:
+            os.makedirs(target, exist_ok=True)
+            os.replace(os.path.join(dirpath, filename), os.path.join(target, filename))
+    shutil.rmtree(staging)
+
+
+def _adopt_legacy_dir(conn, root):
+    """Move this database's archive from the shared archive/ directory to root; whether it did"""
+    legacy = os.path.join(os.path.dirname(root), LEGACY_ARCHIVE_DIRNAME)
+    archived = conn.execute("SELECT SUM(events) FROM archive_log").fetchone()[0]
+    if os.path.exists(root) or not os.path.isdir(legacy) or not archived:
+        return False
+    # Staged files of committed runs count, recover() publishes them after the move
+    committed = {row[0] for row in conn.execute("SELECT run_id FROM archive_log").fetchall()}
+    files = []
+    for dirpath, _dirnames, filenames in os.walk(legacy):
+        top = os.path.relpath(dirpath, legacy).split(os.sep)[0]
+        if top.startswith(STAGING_PREFIX) and top[len(STAGING_PREFIX):] not in committed:
+            continue
+        files += [os.path.join(dirpath, name) for name in filenames if name.endswith('.parquet')]
+    rows = conn.execute("SELECT COUNT(*) FROM read_parquet(?)", [files]).fetchone()[0] if files else 0
+    if rows != archived:
+        logger.warning("Not moving %s to %s: it holds %d archived events, this database archived %d",
+                       legacy, root, rows, archived)
+        return False
+    os.replace(legacy, root)
+    logger.info("Moved the archive of %d events from %s to %s", archived, legacy, root)
+    return True
+
+
+def recover(conn):
+    """Publish staged files of committed runs and discard those of failed ones"""
+    root = archive_dir(conn)
+    moved = _adopt_legacy_dir(conn, root)
+    committed = {row[0] for row in conn.execute("SELECT run_id FROM archive_log").fetchall()}
+    for staging in glob.glob(os.path.join(root, STAGING_PREFIX + '*')):
+        if os.path.basename(staging)[len(STAGING_PREFIX):] in committed:
+            _publish(staging, root)
+        else:
+            shutil.rmtree(staging)
+    if moved:
+        ensure_view(conn)
+
+
+def compact(conn, days=DEFAULT_RETENTION_DAYS, by_tmux=False):
+    """Archive events from before the start of the day `days` days ago
+
+    Returns the number of events moved.
+    """
+    recover(conn)
+    root = archive_dir(conn)
+    layout = 'date_tmux' if by_tmux else 'date'
+    run_id = uuid.uuid4().hex
+    staging = os.path.join(root, STAGING_PREFIX + run_id)
+    os.makedirs(staging)
+
+    try:
+        with ingest.transaction(conn):
+            cutoff = conn.execute("SELECT (CURRENT_DATE - ?::INTEGER)::TIMESTAMP", [days]).fetchone()[0]
+            moved = conn.execute("SELECT COUNT(*) FROM all_events WHERE timestamp < ?",
+                                 [cutoff]).fetchone()[0]
+            if moved:
+                partition_by = ', '.join(LAYOUTS[layout][0])
+                conn.execute(f"""
+                    COPY (
+                        SELECT {ARCHIVE_COLUMNS}, CAST(timestamp AS DATE) as date
+                        FROM all_events
+                        WHERE timestamp < {_sql_string(cutoff.isoformat())}::TIMESTAMP
+                        ORDER BY timestamp, id
+                    ) TO {_sql_string(staging)}
+                    (FORMAT PARQUET, PARTITION_BY ({partition_by}), FILENAME_PATTERN 'part-{{uuid}}')
+                """)
+                conn.execute("DELETE FROM all_events WHERE timestamp < ?", [cutoff])
+                # The derived tables still cover the archived rows
+                conn.execute("UPDATE derived_state SET events = events - ?", [moved])
+                conn.execute("INSERT INTO archive_log VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
+                             [run_id, cutoff, moved, layout])
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if moved:
+        _publish(staging, root)
+        ensure_view(conn)
+    else:
+        shutil.rmtree(staging)
+    return moved
+
+
+def status(conn):
+    """Row counts of the live table and the archive"""
+    live = conn.execute("SELECT COUNT(*), MIN(timestamp) FROM all_events").fetchone()
+    runs = conn.execute("SELECT COUNT(*), SUM(events), MAX(cutoff) FROM archive_log").fetchone()
+    return {
+        'live_events': live[0],
+        'oldest_live_event': live[1],
+        'archived_events': runs[1] or 0,
+        'archive_runs': runs[0],
+        'archived_before': runs[2],
+        'archive_dir': archive_dir(conn),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move old Claude events to the Parquet archive')
+    parser.add_argument('command', choices=['compact', 'status'])
+    parser.add_argument('--days', type=int, default=DEFAULT_RETENTION_DAYS,
+                        help=f'Keep this many days in the live table (default: {DEFAULT_RETENTION_DAYS})')
+    parser.add_argument('--by-tmux', action='store_true',
+                        help='Partition archived files by tmux session as well as by date')
+    parser.add_argument('--db', default=DB_PATH, help='Path to the DuckDB file')
+    args = parser.parse_args()
+
+    conn = duckdb.connect(args.db, read_only=args.command == 'status')
+    if not conn.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = 'archive_log'").fetchone()[0]:
+        conn.close()
+        parser.error("the database schema is out of date, run `python web-ui/schema.py migrate` first")
+
+    if args.command == 'status':
+        for key, value in status(conn).items():
+            print(f"{key}: {value}")
+        conn.close()
+        return
+
+    try:
+        moved = compact(conn, args.days, args.by_tmux)
+    finally:
+        conn.close()
+    print(f"Archived {moved} events")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Arrow IPC responses for the timeline and list endpoints
+
+Clients that send Accept: application/vnd.apache.arrow.stream get query
+results as an Arrow IPC stream instead of JSON. DuckDB hands the result over
+as Arrow record batches, which are written out one by one as they are read, so
+no Python object is built per row or per value and the response never holds
+more than a batch: timestamps stay 64-bit integers instead of being
+formatted one by one. They are timestamp[us] without a time zone, as stored:
+the values are UTC, but the schema does not say so.
+
+Blob references (see blobstore.py) in string columns are replaced column by
+column with Arrow compute functions, one lookup per batch.
+
+Needs pyarrow, which is optional: app.py answers such requests with 406 when
+it cannot be imported.
+"""
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import blobstore
+
+
+def _is_string(data_type):
+    return pa.types.is_string(data_type) or pa.types.is_large_string(data_type) or pa.types.is_string_view(data_type)
+
+
+def resolve_blobs(conn, table):
+    """table (or record batch) with every blob reference in its string columns replaced by its string"""
+    refs = set()
+    columns = []
+    for i, field in enumerate(table.schema):
+        if not _is_string(field.type):
+            continue
+        column = table.column(i)
+        found = pc.filter(column, pc.starts_with(column, blobstore.REF_PREFIX)).unique().to_pylist()
+        if found:
+            refs.update(ref[len(blobstore.REF_PREFIX):] for ref in found if blobstore.is_ref(ref))
+            columns.append(i)
+    if not refs:
+        return table
+
+    strings = blobstore.strings(conn, sorted(refs))
+    keys = pa.array([blobstore.REF_PREFIX + digest for digest in strings], pa.string())
+    values = pa.array(list(strings.values()), pa.string())
+    for i in columns:
+        field = table.schema.field(i)
+        column = table.column(i)
+        resolved = pc.take(values.cast(field.type), pc.index_in(column, value_set=keys.cast(field.type)))
+        table = table.set_column(i, field, pc.coalesce(resolved, column))
+    return table
+
+
+class _Chunks:
+    """Output stream for pa.ipc writers that keeps what was written until taken"""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def ipc_stream(reader, conn=None):
+    """Chunks (bytes) of reader's batches as an Arrow IPC stream, one per batch
+
+    With conn, blob references are resolved batch by batch. It has to be
+    another cursor than the one reader reads from.
+    """
+    sink = _Chunks()
+    with pa.ipc.new_stream(sink, reader.schema) as writer:
+        for batch in reader:
+            if conn is not None:
+                batch = resolve_blobs(conn, batch)
+            writer.write_batch(batch)
+            yield sink.take()
+    # The schema, if no batch was written, and the end-of-stream marker
+    yield sink.take()
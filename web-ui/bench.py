@@ -0,0 +1,185 @@
+"""Per-endpoint latency and memory benchmark of the dashboard API
+
+For each database given (typically workload.py output at different scales)
+every /api/... route of app.py is requested through the Flask test client,
+with the response cache cleared before each request so the queries run every
+time. Route parameters (session ids, agent types, event ids, tmux sessions)
+are filled in from the data itself.
+
+    python web-ui/workload.py --db /tmp/bench-10k.duckdb --events 10000
+    python web-ui/workload.py --db /tmp/bench-1m.duckdb --events 1000000
+    python web-ui/bench.py /tmp/bench-10k.duckdb /tmp/bench-1m.duckdb --output results.json
+
+Results are JSON, one entry per database and route:
+
+    {"db": ..., "events": 1000245, "route": "/api/tracking/all-sessions",
+     "url": "/api/tracking/all-sessions", "status": 200, "runs": 20,
+     "p50_ms": 12.1, "p95_ms": 15.3, "max_ms": 17.0, "bytes": 5120,
+     "peak_python_bytes": 1843200, "duckdb_memory_bytes": 25165824}
+
+peak_python_bytes is the tracemalloc peak of one extra request;
+duckdb_memory_bytes is what DuckDB's buffer manager held at its end.
+/api/stream never ends and is left out.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import duckdb
+
+import app
+import db
+
+DEFAULT_RUNS = 20
+DEFAULT_WARMUP = 2
+
+# Routes that do not return a response of their own
+SKIPPED_ROUTES = {'/api/stream'}
+
+# Required query string parameters, filled in like the URL parameters
+QUERY_PARAMETERS = {'/api/search': ['q'], '/api/tracking/files/history': ['path']}
+
+
+def route_samples(conn):
+    """Values for the URL parameters of parameterized routes"""
+    def first(sql):
+        row = conn.execute(sql).fetchone()
+        return row[0] if row else None
+
+    return {
+        # The busiest session and tmux session are the slow cases
+        'session_id': first("""
+            SELECT session_id FROM session_summary ORDER BY total_events DESC LIMIT 1"""),
+        'agent_type': first("""
+            SELECT agent_type FROM tool_calls WHERE agent_type IS NOT NULL
+            GROUP BY agent_type ORDER BY COUNT(*) DESC LIMIT 1"""),
+        'event_id': first("SELECT MAX(id) FROM all_events"),
+        'tmux_name': first("""
+            SELECT tmux_session FROM session_summary WHERE tmux_session IS NOT NULL
+            GROUP BY tmux_session ORDER BY SUM(total_events) DESC LIMIT 1"""),
+        'q': first("SELECT term FROM search_terms GROUP BY term ORDER BY COUNT(*) DESC LIMIT 1"),
+        'path': first("SELECT path FROM file_stats ORDER BY reads + writes DESC LIMIT 1"),
+    }
+
+
+def api_urls(samples):
+    """(route, url) for every benchmarked /api route, skipping those without sample values"""
+    urls = []
+    for rule in sorted(app.app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if not rule.rule.startswith('/api/') or rule.rule in SKIPPED_ROUTES:
+            continue
+        names = list(rule.arguments) + QUERY_PARAMETERS.get(rule.rule, [])
+        values = {name: samples.get(name) for name in names}
+        missing = [name for name, value in values.items() if value is None]
+        if missing:
+            print(f"Skipping {rule.rule}: no value for {', '.join(missing)}", file=sys.stderr)
+            continue
+        with app.app.test_request_context():
+            urls.append((rule.rule, app.app.url_for(rule.endpoint, **values)))
+    return urls
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(client, url, runs, warmup):
+    """Timings and memory of GET url, each request computed from scratch"""
+    for _ in range(warmup):
+        app.response_cache.clear()
+        client.get(url)
+
+    timings = []
+    for _ in range(runs):
+        app.response_cache.clear()
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    app.response_cache.clear()
+    tracemalloc.start()
+    client.get(url)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    memory = app.pool.checkout()
+    try:
+        duckdb_bytes = memory.execute("SELECT SUM(memory_usage_bytes) FROM duckdb_memory()").fetchone()[0]
+    finally:
+        app.pool.release(memory)
+
+    return {
+        'status': response.status_code,
+        'runs': runs,
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'max_ms': round(max(timings), 3),
+        'bytes': len(response.get_data()),
+        'peak_python_bytes': peak,
+        'duckdb_memory_bytes': int(duckdb_bytes or 0),
+    }
+
+
+def bench_database(db_path, runs=DEFAULT_RUNS, warmup=DEFAULT_WARMUP, routes=None):
+    """Benchmark results for every API route against one database file"""
+    app.pool.close()
+    app.pool = db.ConnectionPool(db_path)
+    try:
+        conn = app.pool.checkout()
+        try:
+            events = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+            samples = route_samples(conn)
+        finally:
+            app.pool.release(conn)
+
+        client = app.app.test_client()
+        results = []
+        for route, url in api_urls(samples):
+            if routes and route not in routes:
+                continue
+            result = {'db': db_path, 'events': events, 'route': route, 'url': url}
+            result.update(measure(client, url, runs, warmup))
+            print(f"{os.path.basename(db_path)} {route}: p50 {result['p50_ms']:.1f}ms "
+                  f"p95 {result['p95_ms']:.1f}ms", file=sys.stderr)
+            results.append(result)
+        return results
+    finally:
+        app.pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard API against DuckDB files')
+    parser.add_argument('databases', nargs='+', help='DuckDB files to benchmark (e.g. from workload.py)')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help='Timed requests per route')
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP, help='Untimed requests per route')
+    parser.add_argument('--route', action='append', help='Only benchmark this route (repeatable)')
+    parser.add_argument('--output', help='Write the JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    report = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'duckdb': duckdb.__version__,
+        'platform': platform.platform(),
+        'results': [],
+    }
+    for path in args.databases:
+        if not os.path.exists(path):
+            parser.error(f"database not found: {path}")
+        report['results'].extend(bench_database(path, args.runs, args.warmup, args.route))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
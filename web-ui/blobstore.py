@@ -0,0 +1,192 @@
+"""Content-addressed store for large strings in event payloads
+
+Tool payloads carry whole file contents (Read), long command output (Bash)
+and the same old/new strings over and over (Edit), which bloats all_events
+and every scan of it. ingest.insert_events() moves every string value of at
+least MIN_BLOB_LENGTH characters into the blobs table, zlib-compressed and
+keyed by its SHA-256, and leaves a reference in the payload instead:
+
+    {"tool_response": {"content": "@blob:3f2a...e9"}}
+
+Identical strings are stored once. Strings that happen to start with
+REF_PREFIX are always moved, so a reference is never ambiguous. Endpoints
+that return payload strings pass their result through resolve(), which puts
+the original strings back in one lookup (arrowipc.resolve_blobs() does the
+same for Arrow tables).
+
+Rows written by the hook's direct mode keep their strings inline until
+
+    python web-ui/blobstore.py compact
+
+is run (with the collector stopped).
+"""
+import argparse
+import hashlib
+import json
+import os
+import zlib
+
+import duckdb
+
+# Path to DuckDB file (relative to web-ui folder)
+DB_PATH = os.path.join(os.path.dirname(__file__), '../logs/claude_events.duckdb')
+
+MIN_BLOB_LENGTH = 1024
+REF_PREFIX = '@blob:'
+
+def is_ref(value):
+    return (isinstance(value, str) and value.startswith(REF_PREFIX)
+            and len(value) == len(REF_PREFIX) + 64)
+
+
+def _externalize_value(value, blobs, keep_refs, moved):
+    if isinstance(value, str):
+        if len(value) < MIN_BLOB_LENGTH and not value.startswith(REF_PREFIX):
+            return value
+        if keep_refs and is_ref(value):
+            return value
+        raw = value.encode('utf-8')
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest not in blobs:
+            blobs[digest] = (len(raw), zlib.compress(raw))
+        moved.append(digest)
+        return REF_PREFIX + digest
+    if isinstance(value, dict):
+        return {key: _externalize_value(item, blobs, keep_refs, moved) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_externalize_value(item, blobs, keep_refs, moved) for item in value]
+    return value
+
+
+def externalize(payload, blobs, keep_refs=False):
+    """Payload JSON text with large strings replaced by references
+
+    The strings are added to blobs as {sha256: (size, compressed bytes)}.
+    With keep_refs, strings that already are references stay as they are
+    (for payloads that went through externalize() before).
+    """
+    # A JSON text is at least as long as any string in it
+    if len(payload) < MIN_BLOB_LENGTH and REF_PREFIX not in payload:
+        return payload
+    moved = []
+    data = _externalize_value(json.loads(payload), blobs, keep_refs, moved)
+    if not moved:
+        return payload
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def store(conn, blobs):
+    """Insert blobs from externalize(), skipping ones already stored"""
+    if blobs:
+        conn.executemany("INSERT INTO blobs VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+                         [(digest, size, data) for digest, (size, data) in blobs.items()])
+
+
+def _collect_refs(value, refs):
+    if isinstance(value, str):
+        if is_ref(value):
+            refs.add(value[len(REF_PREFIX):])
+    elif isinstance(value, dict):
+        for item in value.values():
+            _collect_refs(item, refs)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _collect_refs(item, refs)
+
+
+def _replace_refs(value, strings):
+    if isinstance(value, str):
+        if is_ref(value):
+            return strings.get(value[len(REF_PREFIX):], value)
+        return value
+    if isinstance(value, dict):
+        return {key: _replace_refs(item, strings) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_replace_refs(item, strings) for item in value]
+    return value
+
+
+def strings(conn, digests):
+    """{digest: string} of the stored blobs among digests"""
+    rows = conn.execute("SELECT hash, data FROM blobs WHERE hash IN (SELECT unnest(?::VARCHAR[]))",
+                        [list(digests)]).fetchall()
+    return {digest: zlib.decompress(data).decode('utf-8') for digest, data in rows}
+
+
+def resolve(conn, value):
+    """value (dicts, lists and strings) with every blob reference replaced by its string
+
+    Unknown references are left as they are.
+    """
+    refs = set()
+    _collect_refs(value, refs)
+    if not refs:
+        return value
+    return _replace_refs(value, strings(conn, sorted(refs)))
+
+
+def compact(conn):
+    """Move large strings of rows stored inline into the blob store
+
+    Returns the number of rewritten rows. Call inside a transaction.
+    """
+    rows = conn.execute("SELECT id, data::VARCHAR FROM all_events WHERE length(data::VARCHAR) >= ?",
+                        [MIN_BLOB_LENGTH]).fetchall()
+    blobs = {}
+    updates = []
+    for event_id, payload in rows:
+        try:
+            compacted = externalize(payload, blobs, keep_refs=True)
+        except ValueError:
+            continue
+        if compacted != payload:
+            updates.append((compacted, event_id))
+    store(conn, blobs)
+    if updates:
+        conn.execute("CREATE OR REPLACE TEMP TABLE compacted_events (data VARCHAR, id BIGINT)")
+        conn.executemany("INSERT INTO compacted_events VALUES (?, ?)", updates)
+        conn.execute("""
+            UPDATE all_events SET data = c.data::JSON
+            FROM compacted_events c
+            WHERE all_events.id = c.id
+        """)
+        conn.execute("DROP TABLE compacted_events")
+    return len(updates)
+
+
+def stats(conn):
+    """Size of the blob store"""
+    row = conn.execute("SELECT COUNT(*), SUM(size), SUM(octet_length(data)) FROM blobs").fetchone()
+    return {'blobs': row[0], 'bytes': row[1] or 0, 'stored_bytes': row[2] or 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the payload blob store of the Claude events database')
+    parser.add_argument('command', choices=['compact', 'stats'])
+    parser.add_argument('--db', default=DB_PATH, help='Path to the DuckDB file')
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        conn = duckdb.connect(args.db, read_only=True)
+        for key, value in stats(conn).items():
+            print(f"{key}: {value}")
+        conn.close()
+        return
+
+    conn = duckdb.connect(args.db)
+    try:
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            rewritten = compact(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("CHECKPOINT")
+    finally:
+        conn.close()
+    print(f"Moved large strings of {rewritten} events to the blob store")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""In-process LRU cache of API responses for the dashboard
+
+Between writes the dashboard's endpoints return the same bytes on every poll,
+but each one re-runs its queries. The cache keeps rendered response bodies
+keyed on the request (path and arguments) together with the data version they
+were computed at (see app.data_version()); an entry is only served while the
+version has not moved. Entries also expire after ttl seconds, since some
+responses depend on the clock (sessions turn inactive, 24-hour windows slide)
+rather than on new events.
+
+The total size of the cached bodies is capped at max_bytes; the least recently
+used entries are evicted first.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheEntry:
+    __slots__ = ('version', 'expires', 'etag', 'body', 'mimetype', 'headers', 'size')
+
+    def __init__(self, version, expires, body, mimetype, headers):
+        self.version = version
+        self.expires = expires
+        self.etag = hashlib.md5(body).hexdigest()
+        self.body = body
+        self.mimetype = mimetype
+        self.headers = headers
+        self.size = len(body) + sum(len(k) + len(v) for k, v in headers)
+
+
+class ResponseCache:
+    """Bounded LRU of response bodies, valid for one data version"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=30.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'expired': 0,
+                       'evictions': 0, 'not_modified': 0, 'uncacheable': 0}
+
+    def get(self, key, version):
+        """Entry for key if it was stored at version and has not expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.version != version:
+                    self._stats['stale'] += 1
+                    self._remove(key)
+                    entry = None
+                elif entry.expires <= time.monotonic():
+                    self._stats['expired'] += 1
+                    self._remove(key)
+                    entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    @property
+    def max_entry_bytes(self):
+        # One huge page would flush everything else
+        return self.max_bytes // 4
+
+    def put(self, key, version, body, mimetype, headers=()):
+        """Store a response body computed at version and return its entry"""
+        entry = CacheEntry(version, time.monotonic() + self.ttl, body, mimetype, list(headers))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if entry.size > self.max_entry_bytes:
+                self._stats['uncacheable'] += 1
+                return entry
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+        return entry
+
+    def count_not_modified(self):
+        with self._lock:
+            self._stats['not_modified'] += 1
+
+    def count_uncacheable(self):
+        with self._lock:
+            self._stats['uncacheable'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Counters for /api/cache-stats"""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(
+                self._stats,
+                hit_ratio=self._stats['hits'] / lookups if lookups else None,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                ttl_seconds=self.ttl,
+            )
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
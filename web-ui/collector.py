@@ -0,0 +1,362 @@
+"""Long-running ingest daemon for Claude Code hook events
+
+Listens on a Unix socket, keeps a single writer connection to the DuckDB file
+open and inserts events in batches (by size or time), so hooks no longer spawn
+the duckdb CLI for every tool call or fight over the file lock.
+
+Run standalone:
+
+    python web-ui/collector.py
+
+or embedded in the dashboard process (the default for `python web-ui/app.py`),
+since DuckDB only allows one process to hold the file open for writing.
+
+Wire protocol (one event per connection), as sent by hooks/log-all-events.sh:
+
+    <event_type>\\t<tool_name>\\t<matcher>\\t<timestamp>\\t<tmux_session>\\t<length>\\n
+    <length bytes of JSON payload>
+
+The collector answers "ok\\n" once the event is queued and closes the connection.
+
+Delivery through the socket is at most once. "ok" comes before the batch is
+committed, as a commit (with the derived tables) takes tens of milliseconds
+even for a single event and the hook has to return within a few. Events
+still queued when the collector stops, or that pile up past
+MAX_PENDING_EVENTS while the database cannot be written, go to the spool;
+those queued when the process is killed (up to flush_interval seconds of
+them) are lost. Hooks spool every event the collector does not answer "ok"
+within 2 seconds, so a missing or stuck collector costs no events.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+import duckdb
+
+import archive
+import derived
+import ingest
+import schema
+import spool
+
+LOGS_DIR = os.path.join(os.path.dirname(__file__), '../logs')
+SOCKET_PATH = os.environ.get('CLAUDE_MONITOR_SOCKET', os.path.join(LOGS_DIR, 'collector.sock'))
+TEXT_LOG_PATH = os.path.join(LOGS_DIR, 'all_events.log')
+
+MAX_HEADER_BYTES = 4096
+MAX_PENDING_EVENTS = 100000
+COMPACT_INTERVAL_SECONDS = 3600
+
+logger = logging.getLogger('collector')
+
+_STOP = object()
+
+
+class CollectorError(Exception):
+    pass
+
+
+class _EventHandler(socketserver.StreamRequestHandler):
+    """Read one framed event from a hook and hand it to the collector"""
+
+    def handle(self):
+        header = ingest.parse_header(self.rfile.readline(MAX_HEADER_BYTES))
+        if header is None:
+            self.wfile.write(b'error bad header\n')
+            return
+
+        event = ingest.build_event_from_frame(header, self.rfile.read(header['length']))
+        if event is None:
+            self.wfile.write(b'error invalid payload\n')
+            return
+
+        self.server.collector.submit(event)
+        self.wfile.write(b'ok\n')
+
+
+class _EventServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Collector:
+    """Own the database writer connection and batch incoming events into it"""
+
+    def __init__(self, db_path=schema.DB_PATH, socket_path=SOCKET_PATH,
+                 batch_size=200, flush_interval=1.0, text_log_path=TEXT_LOG_PATH,
+                 spool_dir=spool.SPOOL_DIR, drain_interval=2.0, archive_days=None,
+                 archive_by_tmux=False):
+        self.db_path = db_path
+        self.socket_path = socket_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.text_log_path = text_log_path
+        self.spool_dir = spool_dir
+        self.drain_interval = drain_interval
+        # Move events older than this many days to the Parquet archive (see archive.py)
+        self.archive_days = archive_days
+        self.archive_by_tmux = archive_by_tmux
+
+        self.conn = None
+        self.queue = queue.Queue()
+        self.stats = {'received': 0, 'written': 0, 'batches': 0, 'errors': 0,
+                      'spooled_loaded': 0, 'spooled_skipped': 0, 'archived': 0}
+        self._cursor_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        # Bumped after every commit that added events, for readers waiting on new data
+        self.version = 0
+        self._written = threading.Condition()
+        self._server = None
+        self._threads = []
+
+    def start(self):
+        """Open the database, bind the socket and start the server/writer threads"""
+        self._claim_socket()
+        self.conn = duckdb.connect(self.db_path)
+        schema.migrate(self.conn)
+        archive.recover(self.conn)
+        archive.ensure_view(self.conn)
+        derived.refresh(self.conn)
+
+        self._server = _EventServer(self.socket_path, _EventHandler)
+        self._server.collector = self
+        os.chmod(self.socket_path, 0o600)
+
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, name='collector-server', daemon=True),
+            threading.Thread(target=self._write_loop, name='collector-writer', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info("Collector listening on %s (db: %s)", self.socket_path, self.db_path)
+        return self
+
+    def stop(self):
+        """Stop accepting events, flush everything still queued and close the database"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+        self.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        logger.info("Collector stopped (%s)", self.stats)
+
+    def submit(self, event):
+        """Queue a row built by ingest.build_event for the next batch"""
+        # Called from the server's handler threads
+        with self._stats_lock:
+            self.stats['received'] += 1
+        self.queue.put(event)
+
+    def wait_for_write(self, version, timeout=None):
+        """Block until events were written after `version` (or timeout); returns the current version"""
+        with self._written:
+            self._written.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def _notify_written(self):
+        with self._written:
+            self.version += 1
+            self._written.notify_all()
+
+    def cursor(self):
+        """New cursor on the writer's database for readers in the same process"""
+        with self._cursor_lock:
+            if self.conn is None:
+                raise CollectorError("Collector is not running")
+            return self.conn.cursor()
+
+    def _claim_socket(self):
+        """Refuse to start if another collector is live, otherwise clear a stale socket"""
+        if not os.path.exists(self.socket_path):
+            os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise CollectorError(f"Another collector is already listening on {self.socket_path}")
+
+    def _write_loop(self):
+        writer = self.conn.cursor()
+        pending = []
+        deadline = None
+        stopping = False
+        # Load whatever hooks spooled while no collector was running right away
+        next_drain = time.monotonic()
+        next_compact = time.monotonic() if self.archive_days is not None else None
+
+        while not stopping:
+            wake = next_drain if not pending else min(deadline, next_drain)
+            try:
+                item = self.queue.get(timeout=max(0.0, wake - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                pending.append(item)
+                if len(pending) == 1:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if pending and (stopping or len(pending) >= self.batch_size
+                            or time.monotonic() >= deadline):
+                pending = self._flush(writer, pending)
+                # Back off before retrying a batch that failed to write
+                deadline = time.monotonic() + self.flush_interval
+
+            if stopping or time.monotonic() >= next_drain:
+                self._drain(writer)
+                next_drain = time.monotonic() + self.drain_interval
+
+            if next_compact is not None and not stopping and time.monotonic() >= next_compact:
+                self._compact(writer)
+                next_compact = time.monotonic() + COMPACT_INTERVAL_SECONDS
+
+        if pending:
+            # Hand events that still could not be written to the spool, so the
+            # next collector (or `collector.py --drain`) loads them
+            path = spool.append(pending, self.spool_dir)
+            logger.error("Spooled %d unwritten events to %s on shutdown", len(pending), path)
+        writer.close()
+
+    def _drain(self, writer):
+        """Bulk-load events hooks appended to the spool"""
+        try:
+            result = spool.drain(writer, self.spool_dir)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error("Failed to drain spool %s: %s", self.spool_dir, e)
+            return
+        self.stats['spooled_loaded'] += result['loaded']
+        self.stats['spooled_skipped'] += result['skipped']
+        if result['loaded']:
+            self._notify_written()
+        if result['loaded'] or result['skipped']:
+            logger.info("Loaded %d spooled events (%d unparseable records skipped)",
+                        result['loaded'], result['skipped'])
+
+    def _compact(self, writer):
+        """Archive events past the retention period, between batches"""
+        try:
+            moved = archive.compact(writer, self.archive_days, self.archive_by_tmux)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error("Failed to archive events older than %d days: %s", self.archive_days, e)
+            return
+        self.stats['archived'] += moved
+        if moved:
+            logger.info("Archived %d events older than %d days", moved, self.archive_days)
+
+    def _flush(self, writer, pending):
+        """Write pending events, returning whatever has to be retried"""
+        try:
+            with ingest.transaction(writer):
+                ingest.insert_events(writer, pending)
+        except Exception as e:
+            # Anything escaping here would end the writer thread and leave
+            # hooks queueing events nobody writes
+            self.stats['errors'] += 1
+            logger.error("Failed to write %d events: %s", len(pending), e)
+            if len(pending) > MAX_PENDING_EVENTS:
+                overflow, pending = pending[:-MAX_PENDING_EVENTS], pending[-MAX_PENDING_EVENTS:]
+                try:
+                    path = spool.append(overflow, self.spool_dir)
+                    logger.error("Spooled %d oldest pending events to %s", len(overflow), path)
+                except OSError as spool_error:
+                    logger.error("Discarding %d oldest pending events, could not spool them: %s",
+                                 len(overflow), spool_error)
+            return pending
+
+        self.stats['written'] += len(pending)
+        self.stats['batches'] += 1
+        self._notify_written()
+        self._append_text_log(pending)
+        return []
+
+    def _append_text_log(self, events):
+        """Keep the human-readable all_events.log the hook used to write"""
+        if not self.text_log_path:
+            return
+        try:
+            with open(self.text_log_path, 'a') as log:
+                for event in events:
+                    timestamp, event_type, tool_name, matcher = event[:4]
+                    log.write("====================================\n")
+                    log.write(f"[{timestamp}] Event: {event_type} | Tool: {tool_name or ''} | "
+                              f"Matcher: {matcher or ''} | Tmux: {event[6] or ''}\n")
+                    log.write(json.dumps(json.loads(event[4]), indent=2) + "\n")
+        except OSError as e:
+            logger.warning("Could not write text log %s: %s", self.text_log_path, e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Collect Claude Code hook events into DuckDB')
+    parser.add_argument('--db', default=schema.DB_PATH, help='Path to the DuckDB file')
+    parser.add_argument('--socket', default=SOCKET_PATH, help='Unix socket to listen on')
+    parser.add_argument('--batch-size', type=int, default=200, help='Flush after this many events')
+    parser.add_argument('--flush-interval', type=float, default=1.0, help='Flush at least this often (seconds)')
+    parser.add_argument('--no-text-log', action='store_true', help='Do not append to logs/all_events.log')
+    parser.add_argument('--spool-dir', default=spool.SPOOL_DIR, help='Spool directory written by hooks')
+    parser.add_argument('--drain-interval', type=float, default=2.0, help='Load spooled events this often (seconds)')
+    parser.add_argument('--archive-days', type=int,
+                        help='Hourly, move events older than this many days to the Parquet archive')
+    parser.add_argument('--archive-by-tmux', action='store_true',
+                        help='Partition archived files by tmux session as well as by date')
+    parser.add_argument('--drain', action='store_true',
+                        help='Load spooled events once and exit instead of running the daemon')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    if args.drain:
+        conn = duckdb.connect(args.db)
+        schema.migrate(conn)
+        archive.recover(conn)
+        archive.ensure_view(conn)
+        derived.refresh(conn)
+        result = spool.drain(conn, args.spool_dir)
+        conn.close()
+        print(f"Loaded {result['loaded']} spooled events, skipped {result['skipped']}, "
+              f"removed {result['removed']} segments")
+        return
+
+    collector = Collector(
+        db_path=args.db, socket_path=args.socket, batch_size=args.batch_size,
+        flush_interval=args.flush_interval, text_log_path=None if args.no_text_log else TEXT_LOG_PATH,
+        spool_dir=args.spool_dir, drain_interval=args.drain_interval,
+        archive_days=args.archive_days, archive_by_tmux=args.archive_by_tmux
+    )
+    collector.start()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    stop.wait()
+    collector.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""Process-wide DuckDB connection pool for the dashboard
+
+Opening the database for every request reloads the catalog and throws away
+DuckDB's buffer cache. The pool keeps one long-lived connection instead and
+hands each request a cursor off it. Cursors share the database instance and
+its cache but must not be used from two threads at once, so a cursor belongs
+to one thread until it is released and is then reused by the next checkout;
+the pool only grows to the peak number of concurrent requests.
+
+The base connection is either
+
+- the embedded collector's database (attach()), which sees every write as
+  soon as it is committed, or
+- a read-only connection the pool opens itself. DuckDB does not pick up
+  changes other processes make to a file that is open read-only, and the open
+  file blocks other processes from writing it, so the pool reopens the file
+  when it has been replaced or modified and closes it after idle_timeout
+  seconds without checkouts.
+
+QueryWatchdog cancels queries that run past a timeout (app.py --query-timeout).
+"""
+import os
+import threading
+import time
+
+import duckdb
+
+import schema
+
+
+class ConnectionPool:
+    """Hand out cursors off one shared DuckDB connection"""
+
+    def __init__(self, db_path=schema.DB_PATH, idle_timeout=10.0):
+        self.db_path = db_path
+        self.idle_timeout = idle_timeout
+
+        self._lock = threading.Lock()
+        self._conn = None
+        self._attached = False
+        self._signature = None
+        self._generation = 0
+        self._cursors = []
+        self._idle = []
+        self._active = 0
+        self._idle_timer = None
+        self._stats = {'opens': 0, 'reopens': 0, 'idle_closes': 0,
+                       'checkouts': 0, 'cursors_created': 0}
+
+    def attach(self, conn):
+        """Serve cursors off an existing connection (e.g. Collector.cursor())
+
+        The pool takes ownership of conn and closes it on detach(). The file is
+        then never reopened or released while idle.
+        """
+        with self._lock:
+            self._retire()
+            self._conn = conn
+            self._attached = True
+            self._generation += 1
+            self._stats['opens'] += 1
+
+    def detach(self):
+        """Close the attached connection and go back to opening the file read-only"""
+        with self._lock:
+            self._retire()
+            self._attached = False
+
+    def close(self):
+        """Close the base connection and every cursor handed out from it"""
+        with self._lock:
+            self._retire()
+
+    def checkout(self):
+        """Cursor for use by the calling thread only; give it back with release()"""
+        with self._lock:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            self._ensure_connection()
+
+            if self._idle:
+                cursor = self._idle.pop()
+            else:
+                cursor = self._conn.cursor()
+                self._cursors.append(cursor)
+                self._stats['cursors_created'] += 1
+
+            self._active += 1
+            self._stats['checkouts'] += 1
+            return cursor
+
+    def release(self, cursor):
+        """Return a cursor from checkout() for reuse"""
+        with self._lock:
+            self._active -= 1
+            if any(cursor is c for c in self._cursors):
+                self._idle.append(cursor)
+            if self._active == 0 and not self._attached and self._conn is not None and self.idle_timeout:
+                self._idle_timer = threading.Timer(self.idle_timeout, self._close_idle)
+                self._idle_timer.daemon = True
+                self._idle_timer.start()
+
+    def stats(self):
+        """Counters for /api/db/pool-stats"""
+        with self._lock:
+            return dict(
+                self._stats,
+                mode='attached' if self._attached else 'read_only',
+                connected=self._conn is not None,
+                generation=self._generation,
+                active=self._active,
+                cursors=len(self._cursors),
+                idle=len(self._idle),
+            )
+
+    def _ensure_connection(self):
+        if self._attached:
+            return
+        signature = self.file_signature()
+        if self._conn is not None and (signature == self._signature or self._active):
+            # Unchanged, or changed while other threads are still reading: keep
+            # serving the current snapshot until the last cursor comes back
+            return
+        if self._conn is not None:
+            # Replaced or written by another process since it was opened
+            self._retire()
+            self._stats['reopens'] += 1
+        self._conn = duckdb.connect(self.db_path, read_only=True)
+        self._signature = signature
+        self._generation += 1
+        self._stats['opens'] += 1
+
+    def file_signature(self):
+        """(device, inode, size, mtime) of the database file, or None if it does not exist"""
+        try:
+            st = os.stat(self.db_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _retire(self):
+        """Close the base connection and its cursors (callers hold the lock)
+
+        Only called while no cursor is checked out (or on shutdown): the
+        database file stays open, and locked, for as long as any cursor off it
+        is alive, so they are all closed together.
+        """
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+        for cursor in self._cursors:
+            try:
+                cursor.close()
+            except duckdb.Error:
+                pass
+        self._cursors = []
+        self._idle = []
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except duckdb.Error:
+                pass
+        self._conn = None
+        self._signature = None
+        self._generation += 1
+
+    def _close_idle(self):
+        with self._lock:
+            if self._active == 0 and not self._attached and self._conn is not None:
+                self._retire()
+                self._stats['idle_closes'] += 1
+
+
+class QueryWatchdog:
+    """Interrupt queries that run longer than timeout seconds
+
+    One daemon thread sleeps until the earliest deadline. watch() is called
+    before each call that runs the query (execute, fetch) and clear() after
+    it; a call still running at its deadline is cancelled with interrupt(),
+    which makes it raise duckdb.InterruptException in the thread that ran it.
+    Interrupting a cursor that has just finished is harmless.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._deadlines = {}
+        self._next_key = 0
+        self._thread = None
+        self._running = False
+        self._stats = {'watched': 0, 'interrupted': 0}
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._running = True
+                self._thread = threading.Thread(target=self._run, name='query-watchdog', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def watch(self, cursor, timeout=None):
+        """Start the clock on what cursor is about to run; returns a key for clear()
+
+        timeout defaults to the watchdog's; what is left of it for a query
+        that has already run for a while.
+        """
+        with self._cond:
+            key = self._next_key
+            self._next_key += 1
+            self._deadlines[key] = (time.monotonic() + (self.timeout if timeout is None else timeout), cursor)
+            self._stats['watched'] += 1
+            self._cond.notify()
+            return key
+
+    def clear(self, key):
+        with self._cond:
+            self._deadlines.pop(key, None)
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, timeout_seconds=self.timeout, running=len(self._deadlines))
+
+    def _run(self):
+        with self._cond:
+            while self._running:
+                now = time.monotonic()
+                expired = [key for key, (deadline, _) in self._deadlines.items() if deadline <= now]
+                for key in expired:
+                    _deadline, cursor = self._deadlines.pop(key)
+                    self._stats['interrupted'] += 1
+                    try:
+                        cursor.interrupt()
+                    except duckdb.Error:
+                        pass
+                if self._deadlines:
+                    self._cond.wait(min(deadline for deadline, _ in self._deadlines.values()) - now)
+                else:
+                    self._cond.wait()
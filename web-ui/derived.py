@@ -0,0 +1,815 @@
+"""Derived tables maintained incrementally as events are ingested
+
+Dashboard endpoints that aggregate the whole event history read small derived
+tables instead. ingest.insert_events() stages every batch in the temp table
+ingest_batch and calls update() in the same transaction, so the derived tables
+are always consistent with all_events.
+
+Each maintainer is a function (conn, source) that folds the rows of the
+`source` relation into its tables. Rebuilding runs the same function over all
+of the events view (live and archived events) after emptying the tables:
+
+    python web-ui/derived.py rebuild [session_summary ...]
+
+`check` runs the rebuild in a transaction that is rolled back and reports
+the tables whose incrementally maintained rows differ from it.
+
+Rows inserted without going through ingest (the hook's direct mode) are
+detected by comparing the row count of all_events with derived_state and
+trigger a rebuild the next time the database is opened for writing.
+"""
+import argparse
+import logging
+import os
+import sys
+
+import duckdb
+
+import search
+
+logger = logging.getLogger('derived')
+
+# Path to DuckDB file (relative to web-ui folder)
+DB_PATH = os.path.join(os.path.dirname(__file__), '../logs/claude_events.duckdb')
+
+
+def update_session_summary(conn, source):
+    """Fold per-session lifecycle, counts and tool/agent usage from source"""
+    conn.execute(f"""
+        INSERT INTO session_summary
+        SELECT
+            session_id,
+            MIN(timestamp),
+            MAX(timestamp),
+            COUNT(*),
+            COUNT(*) FILTER (WHERE event_type = 'SessionStart'),
+            COUNT(*) FILTER (WHERE event_type = 'SessionEnd'),
+            MAX(CASE WHEN event_type = 'SessionStart'
+                THEN json_extract_string(data, '$.source') END),
+            MAX(cwd),
+            MAX(tmux_session),
+            list_sort(LIST(DISTINCT tool_name) FILTER (WHERE tool_name IS NOT NULL)),
+            []
+        FROM {source}
+        WHERE session_id IS NOT NULL
+        GROUP BY session_id
+        ON CONFLICT (session_id) DO UPDATE SET
+            session_start = LEAST(session_summary.session_start, excluded.session_start),
+            session_end = GREATEST(session_summary.session_end, excluded.session_end),
+            total_events = session_summary.total_events + excluded.total_events,
+            start_events = session_summary.start_events + excluded.start_events,
+            end_events = session_summary.end_events + excluded.end_events,
+            start_source = GREATEST(session_summary.start_source, excluded.start_source),
+            cwd = GREATEST(session_summary.cwd, excluded.cwd),
+            tmux_session = GREATEST(session_summary.tmux_session, excluded.tmux_session),
+            tools_used = list_sort(list_distinct(list_concat(session_summary.tools_used,
+                                                             excluded.tools_used)))
+    """)
+
+    # Subagents in order of first use. Keep the first use per agent and
+    # re-list only the sessions that used an agent in this batch.
+    conn.execute(f"""
+        INSERT INTO session_agents
+        SELECT session_id, subagent_type, MIN(timestamp)
+        FROM {source}
+        WHERE event_type = 'PreToolUse'
+            AND tool_name = 'Task'
+            AND subagent_type IS NOT NULL
+            AND session_id IS NOT NULL
+        GROUP BY session_id, subagent_type
+        ON CONFLICT (session_id, agent_type) DO UPDATE SET
+            first_use = LEAST(session_agents.first_use, excluded.first_use)
+    """)
+    conn.execute(f"""
+        UPDATE session_summary
+        SET agents_used = a.agents_used
+        FROM (
+            SELECT session_id, LIST(agent_type ORDER BY first_use) as agents_used
+            FROM session_agents
+            WHERE session_id IN (
+                SELECT session_id FROM {source}
+                WHERE event_type = 'PreToolUse' AND tool_name = 'Task'
+                    AND subagent_type IS NOT NULL
+            )
+            GROUP BY session_id
+        ) a
+        WHERE session_summary.session_id = a.session_id
+    """)
+
+
+def update_tool_calls(conn, source):
+    """Pair PreToolUse/PostToolUse events on tool_use_id into tool_calls
+
+    Either half may arrive first or in a later batch; the row is completed
+    when the other half shows up.
+    """
+    # Tool events of the batch with the fields both pairings need
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE tool_events AS
+        SELECT
+            json_extract_string(data, '$.tool_use_id') as tool_use_id,
+            session_id,
+            tool_name,
+            subagent_type,
+            json_extract_string(data, '$.tool_input.description') as description,
+            event_type,
+            timestamp,
+            TRY_CAST(COALESCE(
+                json_extract_string(data, '$.tool_response.token_usage.total_tokens'),
+                json_extract_string(data, '$.tool_response.totalTokens')
+            ) AS BIGINT) as total_tokens,
+            event_type = 'PostToolUseFailure'
+                OR COALESCE(TRY_CAST(json_extract_string(data, '$.tool_response.is_error') AS BOOLEAN), false)
+                as failed,
+            data
+        FROM {source}
+        WHERE event_type IN ('PreToolUse', 'PostToolUse', 'PostToolUseFailure')
+    """)
+    conn.execute("""
+        INSERT INTO tool_calls
+        SELECT
+            tool_use_id,
+            ANY_VALUE(session_id),
+            ANY_VALUE(tool_name),
+            ANY_VALUE(subagent_type),
+            ANY_VALUE(description),
+            MIN(timestamp) FILTER (WHERE event_type = 'PreToolUse') as start_time,
+            MAX(timestamp) FILTER (WHERE event_type <> 'PreToolUse') as end_time,
+            EXTRACT(EPOCH FROM (end_time - start_time)),
+            MAX(total_tokens),
+            CASE
+                WHEN BOOL_OR(failed) THEN 'error'
+                WHEN end_time IS NOT NULL THEN 'completed'
+                ELSE 'running'
+            END
+        FROM tool_events
+        WHERE tool_use_id IS NOT NULL
+        GROUP BY tool_use_id
+        ON CONFLICT (tool_use_id) DO UPDATE SET
+            session_id = COALESCE(tool_calls.session_id, excluded.session_id),
+            tool_name = COALESCE(tool_calls.tool_name, excluded.tool_name),
+            agent_type = COALESCE(tool_calls.agent_type, excluded.agent_type),
+            description = COALESCE(tool_calls.description, excluded.description),
+            start_time = LEAST(tool_calls.start_time, excluded.start_time),
+            end_time = GREATEST(tool_calls.end_time, excluded.end_time),
+            duration_seconds = EXTRACT(EPOCH FROM (
+                GREATEST(tool_calls.end_time, excluded.end_time)
+                - LEAST(tool_calls.start_time, excluded.start_time))),
+            total_tokens = GREATEST(tool_calls.total_tokens, excluded.total_tokens),
+            status = CASE
+                WHEN 'error' IN (tool_calls.status, excluded.status) THEN 'error'
+                WHEN 'completed' IN (tool_calls.status, excluded.status) THEN 'completed'
+                ELSE 'running'
+            END
+    """)
+    _pair_legacy_tool_calls(conn)
+    conn.execute("DROP TABLE tool_events")
+
+
+def _pair_legacy_tool_calls(conn):
+    """Pair events from Claude Code versions that send no tool_use_id
+
+    Calls are matched first-in, first-out per session, tool and subagent type,
+    which is ambiguous when the same tool runs in parallel. Each PreToolUse
+    opens a row keyed by a hash of the event; a PostToolUse closes the oldest
+    open row, or is kept on its own if there is none.
+    """
+    conn.execute("""
+        INSERT INTO tool_calls
+        SELECT
+            'pre:' || md5(concat_ws('|', session_id, timestamp, data)),
+            session_id, tool_name, subagent_type, description,
+            timestamp, NULL, NULL, NULL, 'running'
+        FROM tool_events
+        WHERE tool_use_id IS NULL AND event_type = 'PreToolUse'
+        ON CONFLICT DO NOTHING
+    """)
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE legacy_tool_ends AS
+        WITH ends AS (
+            SELECT *, ROW_NUMBER() OVER (
+                PARTITION BY session_id, tool_name, subagent_type ORDER BY timestamp) as rn
+            FROM tool_events
+            WHERE tool_use_id IS NULL AND event_type <> 'PreToolUse'
+        ),
+        open_calls AS (
+            SELECT tool_use_id, session_id, tool_name, agent_type, ROW_NUMBER() OVER (
+                PARTITION BY session_id, tool_name, agent_type ORDER BY start_time) as rn
+            FROM tool_calls
+            WHERE tool_use_id LIKE 'pre:%' AND end_time IS NULL
+                AND session_id IN (SELECT session_id FROM ends)
+        )
+        SELECT o.tool_use_id as open_id, e.*
+        FROM ends e
+        LEFT JOIN open_calls o
+            ON o.session_id = e.session_id
+            AND o.tool_name IS NOT DISTINCT FROM e.tool_name
+            AND o.agent_type IS NOT DISTINCT FROM e.subagent_type
+            AND o.rn = e.rn
+    """)
+    conn.execute("""
+        UPDATE tool_calls
+        SET end_time = e.timestamp,
+            duration_seconds = EXTRACT(EPOCH FROM (e.timestamp - tool_calls.start_time)),
+            total_tokens = e.total_tokens,
+            description = COALESCE(tool_calls.description, e.description),
+            status = CASE WHEN e.failed THEN 'error' ELSE 'completed' END
+        FROM legacy_tool_ends e
+        WHERE tool_calls.tool_use_id = e.open_id
+    """)
+    conn.execute("""
+        INSERT INTO tool_calls
+        SELECT
+            'post:' || md5(concat_ws('|', session_id, timestamp, data)),
+            session_id, tool_name, subagent_type, description,
+            NULL, timestamp, NULL, total_tokens,
+            CASE WHEN failed THEN 'error' ELSE 'completed' END
+        FROM legacy_tool_ends
+        WHERE open_id IS NULL
+        ON CONFLICT DO NOTHING
+    """)
+    conn.execute("DROP TABLE legacy_tool_ends")
+
+
+# Bucket sizes of the rollup tables, as date_trunc() parts
+ROLLUP_GRAINS = ['minute', 'hour']
+
+
+def update_rollups(conn, source):
+    """Fold event counts and distinct values per time bucket from source
+    
+    event_rollup counts events per bucket, event type, tool and agent type
+    ('' where absent). Distinct counts cannot be summed across buckets, so
+    distinct_rollup keeps the set of tmux sessions and agents seen in each
+    bucket; these are small enough to union exactly over any window.
+    """
+    for grain in ROLLUP_GRAINS:
+        conn.execute(f"""
+            INSERT INTO event_rollup
+            SELECT
+                '{grain}',
+                date_trunc('{grain}', timestamp) as bucket,
+                COALESCE(event_type, '') as event_type,
+                COALESCE(tool_name, '') as tool_name,
+                COALESCE(subagent_type, '') as agent_type,
+                COUNT(*)
+            FROM {source}
+            WHERE timestamp IS NOT NULL
+            GROUP BY bucket, 3, 4, 5
+            ON CONFLICT (grain, bucket, event_type, tool_name, agent_type) DO UPDATE SET
+                events = event_rollup.events + excluded.events
+        """)
+        conn.execute(f"""
+            INSERT INTO distinct_rollup
+            SELECT DISTINCT '{grain}', date_trunc('{grain}', timestamp), 'tmux_session', tmux_session
+            FROM {source}
+            WHERE timestamp IS NOT NULL AND tmux_session IS NOT NULL AND tmux_session != ''
+            UNION
+            SELECT DISTINCT '{grain}', date_trunc('{grain}', timestamp), 'agent', subagent_type
+            FROM {source}
+            WHERE timestamp IS NOT NULL
+                AND event_type = 'PreToolUse'
+                AND tool_name = 'Task'
+                AND subagent_type IS NOT NULL
+            ON CONFLICT DO NOTHING
+        """)
+
+
+# token_rollup column -> payload paths it is read from, first present wins.
+# Subagent (Task) responses report usage/totalTokens; older versions token_usage.
+TOKEN_FIELDS = {
+    'input_tokens': ['$.tool_response.usage.input_tokens',
+                     '$.tool_response.token_usage.input_tokens'],
+    'output_tokens': ['$.tool_response.usage.output_tokens',
+                      '$.tool_response.token_usage.output_tokens'],
+    'cache_creation_tokens': ['$.tool_response.usage.cache_creation_input_tokens',
+                              '$.tool_response.token_usage.cache_creation_input_tokens'],
+    'cache_read_tokens': ['$.tool_response.usage.cache_read_input_tokens',
+                          '$.tool_response.token_usage.cache_read_input_tokens'],
+    'total_tokens': ['$.tool_response.totalTokens',
+                     '$.tool_response.token_usage.total_tokens'],
+}
+
+
+def update_token_rollup(conn, source):
+    """Fold token usage reported by tool responses into hourly token_rollup
+
+    Rows are per hour, session, subagent type and tool ('' where absent).
+    The total is the reported one, or the sum of the parts if none is.
+    """
+    fields = ',\n'.join(
+        "TRY_CAST(COALESCE({}) AS BIGINT) as {}".format(
+            ', '.join(f"json_extract_string(data, '{path}')" for path in paths), column)
+        for column, paths in TOKEN_FIELDS.items())
+    parts = [column for column in TOKEN_FIELDS if column != 'total_tokens']
+    conn.execute(f"""
+        INSERT INTO token_rollup
+        SELECT
+            date_trunc('hour', timestamp) as hour,
+            COALESCE(session_id, '') as session_id,
+            COALESCE(subagent_type, '') as agent_type,
+            COALESCE(tool_name, '') as tool_name,
+            MAX(tmux_session),
+            COUNT(*),
+            {', '.join(f'SUM(COALESCE({column}, 0))' for column in parts)},
+            SUM(COALESCE(total_tokens, {' + '.join(f'COALESCE({column}, 0)' for column in parts)}))
+        FROM (
+            SELECT timestamp, session_id, subagent_type, tool_name, tmux_session,
+                {fields}
+            FROM {source}
+            WHERE event_type IN ('PostToolUse', 'PostToolUseFailure')
+                AND timestamp IS NOT NULL
+                AND json_exists(data, '$.tool_response')
+        )
+        WHERE COALESCE({', '.join(TOKEN_FIELDS)}) IS NOT NULL
+        GROUP BY ALL
+        ON CONFLICT (hour, session_id, agent_type, tool_name) DO UPDATE SET
+            tmux_session = GREATEST(token_rollup.tmux_session, excluded.tmux_session),
+            calls = token_rollup.calls + excluded.calls,
+            {', '.join(f'{column} = token_rollup.{column} + excluded.{column}' for column in TOKEN_FIELDS)}
+    """)
+
+
+# Upper bounds in seconds of the wait_histogram buckets of session_activity;
+# the last bucket counts longer waits
+WAIT_BUCKETS = (10, 30, 60, 300, 900, 3600)
+
+# Idle stretches between consecutive events of a session kept in session_gaps
+MIN_GAP_SECONDS = 60
+
+
+def update_session_activity(conn, source):
+    """Advance each session's work/wait state machine over the events of source
+
+    SessionStart/UserPromptSubmit -> Stop is working time and Stop ->
+    UserPromptSubmit is waiting time (bucketed into wait_histogram). Each
+    session keeps the last of those events and the last event of any kind, so
+    the next batch continues from them; idle stretches of more than
+    MIN_GAP_SECONDS between any two events go to session_gaps. Sessions that
+    receive events from before their saved state (a late spool load) are
+    replayed from all of their events instead.
+    """
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE activity_batch AS
+        SELECT session_id, tmux_session, event_type, tool_name, timestamp
+        FROM {source}
+        WHERE session_id IS NOT NULL AND timestamp IS NOT NULL
+    """)
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE activity_replay AS
+        SELECT DISTINCT b.session_id
+        FROM activity_batch b
+        JOIN session_activity s ON s.session_id = b.session_id
+        WHERE b.timestamp < s.last_seen_at
+    """)
+    if conn.execute("SELECT COUNT(*) FROM activity_replay").fetchone()[0]:
+        for table in ('session_activity', 'session_gaps', 'activity_batch'):
+            conn.execute(f"DELETE FROM {table} WHERE session_id IN (SELECT session_id FROM activity_replay)")
+        conn.execute("""
+            INSERT INTO activity_batch
+            SELECT session_id, tmux_session, event_type, tool_name, timestamp
+            FROM events
+            WHERE session_id IN (SELECT session_id FROM activity_replay) AND timestamp IS NOT NULL
+        """)
+
+    # Each sequence starts from the state saved by the previous batch (is_new = 0)
+    is_wait = "prev_type = 'Stop' AND event_type = 'UserPromptSubmit'"
+    is_work = "prev_type IN ('SessionStart', 'UserPromptSubmit') AND event_type = 'Stop'"
+    bounds = ([f"elapsed <= {WAIT_BUCKETS[0]}"]
+              + [f"elapsed > {lower} AND elapsed <= {upper}" for lower, upper in zip(WAIT_BUCKETS, WAIT_BUCKETS[1:])]
+              + [f"elapsed > {WAIT_BUCKETS[-1]}"])
+    histogram = ', '.join(f"COUNT(*) FILTER (WHERE {is_wait} AND {bound})" for bound in bounds)
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE activity_steps AS
+        WITH transitions AS (
+            SELECT session_id, event_type, timestamp, 1 as is_new
+            FROM activity_batch
+            WHERE event_type IN ('SessionStart', 'UserPromptSubmit', 'Stop')
+            UNION ALL
+            SELECT session_id, last_event_type, last_event_at, 0
+            FROM session_activity
+            WHERE last_event_type IS NOT NULL
+                AND session_id IN (SELECT session_id FROM activity_batch)
+        ),
+        steps AS (
+            SELECT
+                *,
+                LAG(event_type) OVER w as prev_type,
+                EXTRACT(EPOCH FROM (timestamp - LAG(timestamp) OVER w)) as elapsed
+            FROM transitions
+            WINDOW w AS (PARTITION BY session_id ORDER BY timestamp, is_new)
+        )
+        SELECT
+            session_id,
+            COALESCE(SUM(elapsed) FILTER (WHERE {is_work}), 0) as working_seconds,
+            COALESCE(SUM(elapsed) FILTER (WHERE {is_wait}), 0) as waiting_seconds,
+            COUNT(*) FILTER (WHERE {is_work}) as work_periods,
+            COUNT(*) FILTER (WHERE is_new = 1 AND event_type = 'UserPromptSubmit') as prompt_count,
+            COUNT(*) FILTER (WHERE is_new = 1 AND event_type = 'Stop') as stop_count,
+            [{histogram}] as wait_histogram,
+            MAX(elapsed) FILTER (WHERE {is_wait}) as longest_wait_seconds,
+            arg_max(event_type, (timestamp, is_new)) as last_event_type,
+            MAX(timestamp) as last_event_at
+        FROM steps
+        GROUP BY session_id
+    """)
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE activity_seen AS
+        WITH seen AS (
+            SELECT session_id, tmux_session, tool_name, timestamp, 1 as is_new
+            FROM activity_batch
+            UNION ALL
+            SELECT session_id, NULL, last_tool, last_seen_at, 0
+            FROM session_activity
+            WHERE session_id IN (SELECT session_id FROM activity_batch)
+        ),
+        steps AS (
+            SELECT
+                *,
+                LAG(timestamp) OVER w as prev_at,
+                LAG(tool_name) OVER w as prev_tool
+            FROM seen
+            WINDOW w AS (PARTITION BY session_id ORDER BY timestamp, is_new)
+        )
+        SELECT * FROM steps
+    """)
+    conn.execute(f"""
+        INSERT INTO session_gaps
+        SELECT
+            session_id,
+            tmux_session,
+            prev_at,
+            timestamp,
+            EXTRACT(EPOCH FROM (timestamp - prev_at)),
+            prev_tool,
+            tool_name
+        FROM activity_seen
+        WHERE is_new = 1 AND timestamp - prev_at > INTERVAL {MIN_GAP_SECONDS} SECONDS
+    """)
+
+    buckets = len(WAIT_BUCKETS) + 1
+    conn.execute(f"""
+        INSERT INTO session_activity
+        SELECT
+            s.session_id,
+            s.tmux_session,
+            COALESCE(t.working_seconds, 0),
+            COALESCE(t.waiting_seconds, 0),
+            COALESCE(t.work_periods, 0),
+            COALESCE(t.prompt_count, 0),
+            COALESCE(t.stop_count, 0),
+            COALESCE(t.wait_histogram, list_transform(range({buckets}), i -> 0)),
+            t.longest_wait_seconds,
+            t.last_event_type,
+            t.last_event_at,
+            s.last_seen_at,
+            s.last_tool
+        FROM (
+            SELECT
+                session_id,
+                arg_max(tmux_session, timestamp) FILTER (WHERE tmux_session IS NOT NULL) as tmux_session,
+                MAX(timestamp) as last_seen_at,
+                arg_max_null(tool_name, (timestamp, is_new)) as last_tool
+            FROM activity_seen
+            GROUP BY session_id
+        ) s
+        LEFT JOIN activity_steps t ON t.session_id = s.session_id
+        ON CONFLICT (session_id) DO UPDATE SET
+            tmux_session = COALESCE(excluded.tmux_session, session_activity.tmux_session),
+            working_seconds = session_activity.working_seconds + excluded.working_seconds,
+            waiting_seconds = session_activity.waiting_seconds + excluded.waiting_seconds,
+            work_periods = session_activity.work_periods + excluded.work_periods,
+            prompt_count = session_activity.prompt_count + excluded.prompt_count,
+            stop_count = session_activity.stop_count + excluded.stop_count,
+            wait_histogram = list_transform(range(1, {buckets} + 1),
+                i -> session_activity.wait_histogram[i] + excluded.wait_histogram[i]),
+            longest_wait_seconds = GREATEST(session_activity.longest_wait_seconds,
+                                            excluded.longest_wait_seconds),
+            last_event_type = COALESCE(excluded.last_event_type, session_activity.last_event_type),
+            last_event_at = COALESCE(excluded.last_event_at, session_activity.last_event_at),
+            last_seen_at = excluded.last_seen_at,
+            last_tool = excluded.last_tool
+    """)
+    for table in ('activity_batch', 'activity_replay', 'activity_steps', 'activity_seen'):
+        conn.execute(f"DROP TABLE {table}")
+
+
+# File tools and whether they read or write the file
+FILE_OPERATIONS = {'Read': 'read', 'Write': 'write', 'Edit': 'write',
+                   'MultiEdit': 'write', 'NotebookEdit': 'write'}
+
+# Passes removing one `dir/..` each; paths with deeper runs keep the rest
+PARENT_DIR_PASSES = 3
+
+
+def normalized_path(path, cwd='NULL'):
+    """SQL expression for a file path made absolute against cwd, without //, /./ or dir/.."""
+    expr = f"CASE WHEN starts_with({path}, '/') OR {cwd} IS NULL THEN {path} ELSE {cwd} || '/' || {path} END"
+    expr = rf"regexp_replace(regexp_replace({expr}, '/+', '/', 'g'), '/(\./)+', '/', 'g')"
+    for _ in range(PARENT_DIR_PASSES):
+        expr = rf"regexp_replace({expr}, '/[^/]+/\.\.(/|$)', '/', 'g')"
+    return rf"regexp_replace({expr}, '(.)/$', '\1')"
+
+
+def update_file_activity(conn, source):
+    """Fold file reads and writes of source into the file activity index
+
+    file_access keeps every access by normalized path, file_sessions and
+    file_stats the counts per file and session and per file, and
+    directory_stats the counts of every directory above the files (and how
+    many distinct files below it were accessed).
+    """
+    operations = ' '.join(f"WHEN '{tool}' THEN '{op}'" for tool, op in FILE_OPERATIONS.items())
+    raw_path = ("COALESCE(json_extract_string(data, '$.tool_input.file_path'), "
+                "json_extract_string(data, '$.tool_input.notebook_path'))")
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE file_batch AS
+        SELECT
+            id as event_id,
+            timestamp,
+            session_id,
+            tmux_session,
+            tool_name,
+            CASE tool_name {operations} END as operation,
+            {normalized_path(raw_path, 'cwd')} as path
+        FROM {source}
+        WHERE event_type = 'PreToolUse'
+            AND tool_name IN ({', '.join(f"'{tool}'" for tool in FILE_OPERATIONS)})
+            AND {raw_path} IS NOT NULL
+            AND timestamp IS NOT NULL
+    """)
+    conn.execute("""
+        INSERT INTO file_access
+        SELECT
+            event_id, timestamp, session_id, tmux_session, tool_name, operation, path,
+            CASE WHEN contains(path, '/')
+                THEN COALESCE(NULLIF(regexp_replace(path, '/[^/]*$', ''), ''), '/') END
+        FROM file_batch
+    """)
+    conn.execute("""
+        INSERT INTO file_sessions
+        SELECT
+            path,
+            session_id,
+            COUNT(*) FILTER (WHERE operation = 'read'),
+            COUNT(*) FILTER (WHERE operation = 'write'),
+            MIN(timestamp),
+            MAX(timestamp)
+        FROM file_batch
+        WHERE session_id IS NOT NULL
+        GROUP BY path, session_id
+        ON CONFLICT (path, session_id) DO UPDATE SET
+            reads = file_sessions.reads + excluded.reads,
+            writes = file_sessions.writes + excluded.writes,
+            first_access = LEAST(file_sessions.first_access, excluded.first_access),
+            last_access = GREATEST(file_sessions.last_access, excluded.last_access)
+    """)
+
+    # Ancestors of each file of the batch, flagging files seen for the first
+    # time so directory_stats can count distinct files
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE file_batch_directories AS
+        SELECT
+            array_to_string(parts[1:i], '/') as directory,
+            i - 1 as depth,
+            reads,
+            writes,
+            new_file,
+            last_access
+        FROM (
+            SELECT
+                *,
+                unnest(range(CASE WHEN starts_with(path, '/') THEN 2 ELSE 1 END, len(parts))) as i
+            FROM (
+                SELECT
+                    path,
+                    string_split(path, '/') as parts,
+                    COUNT(*) FILTER (WHERE operation = 'read') as reads,
+                    COUNT(*) FILTER (WHERE operation = 'write') as writes,
+                    path NOT IN (SELECT path FROM file_stats) as new_file,
+                    MAX(timestamp) as last_access
+                FROM file_batch
+                GROUP BY path
+            )
+        )
+    """)
+    conn.execute("""
+        INSERT INTO file_stats
+        SELECT
+            b.path,
+            COUNT(*) FILTER (WHERE b.operation = 'read'),
+            COUNT(*) FILTER (WHERE b.operation = 'write'),
+            ANY_VALUE(s.sessions),
+            MIN(b.timestamp),
+            MAX(b.timestamp),
+            arg_max(b.session_id, b.timestamp),
+            arg_max(b.tool_name, b.timestamp)
+        FROM file_batch b
+        LEFT JOIN (
+            SELECT path, COUNT(*) as sessions
+            FROM file_sessions
+            WHERE path IN (SELECT path FROM file_batch)
+            GROUP BY path
+        ) s USING (path)
+        GROUP BY b.path
+        ON CONFLICT (path) DO UPDATE SET
+            reads = file_stats.reads + excluded.reads,
+            writes = file_stats.writes + excluded.writes,
+            sessions = COALESCE(excluded.sessions, file_stats.sessions),
+            first_access = LEAST(file_stats.first_access, excluded.first_access),
+            last_session_id = CASE WHEN excluded.last_access >= file_stats.last_access
+                THEN excluded.last_session_id ELSE file_stats.last_session_id END,
+            last_tool = CASE WHEN excluded.last_access >= file_stats.last_access
+                THEN excluded.last_tool ELSE file_stats.last_tool END,
+            last_access = GREATEST(file_stats.last_access, excluded.last_access)
+    """)
+    conn.execute("""
+        INSERT INTO directory_stats
+        SELECT
+            COALESCE(NULLIF(directory, ''), '/'),
+            ANY_VALUE(depth),
+            SUM(reads),
+            SUM(writes),
+            COUNT(*) FILTER (WHERE new_file),
+            MAX(last_access)
+        FROM file_batch_directories
+        GROUP BY 1
+        ON CONFLICT (directory) DO UPDATE SET
+            reads = directory_stats.reads + excluded.reads,
+            writes = directory_stats.writes + excluded.writes,
+            files = directory_stats.files + excluded.files,
+            last_access = GREATEST(directory_stats.last_access, excluded.last_access)
+    """)
+    for table in ('file_batch', 'file_batch_directories'):
+        conn.execute(f"DROP TABLE {table}")
+
+
+def wait_quantile(histogram, fraction, longest):
+    """Estimate a quantile of waits from a wait_histogram
+
+    Interpolates linearly inside the bucket holding the quantile, as
+    Prometheus' histogram_quantile() does; the open last bucket ends at the
+    longest wait.
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = fraction * total
+    lower = 0
+    for count, upper in zip(histogram, list(WAIT_BUCKETS) + [longest or WAIT_BUCKETS[-1]]):
+        if count and rank <= count:
+            return lower + (upper - lower) * rank / count
+        rank -= count
+        lower = upper
+    return longest
+
+
+def rollup_window(since, until="'infinity'::TIMESTAMP"):
+    """SQL condition on (grain, bucket) covering timestamps in [since, until)
+    
+    since and until are SQL expressions. Whole hours inside the window are
+    read from hour buckets and the partial hours at either end from minute
+    buckets, so a window costs at most a few hundred rows however long it is.
+    The minute containing `since` is counted whole.
+    """
+    first_hour = f"(date_trunc('hour', {since}) + INTERVAL 1 HOUR)"
+    last_hour = f"date_trunc('hour', {until})"
+    return f"""(
+        (grain = 'hour' AND bucket >= {first_hour} AND bucket < {last_hour})
+        OR (grain = 'minute' AND bucket >= date_trunc('minute', {since}) AND bucket < {until}
+            AND (bucket < {first_hour} OR bucket >= {last_hour}))
+    )"""
+
+
+# Derived table name -> (maintainer, tables it owns)
+MAINTAINERS = {
+    'session_summary': (update_session_summary, ['session_summary', 'session_agents']),
+    'tool_calls': (update_tool_calls, ['tool_calls']),
+    'rollups': (update_rollups, ['event_rollup', 'distinct_rollup']),
+    'activity': (update_session_activity, ['session_activity', 'session_gaps']),
+    'search': (search.update_search_index, ['search_documents', 'search_terms']),
+    'files': (update_file_activity, ['file_access', 'file_sessions', 'file_stats', 'directory_stats']),
+    'tokens': (update_token_rollup, ['token_rollup']),
+}
+
+
+# Decimal places to which check() compares floating-point columns
+CHECK_DIGITS = 6
+
+
+def update(conn, source='ingest_batch'):
+    """Apply a batch of new events to every derived table"""
+    for maintain, _tables in MAINTAINERS.values():
+        maintain(conn, source)
+    conn.execute(f"UPDATE derived_state SET events = events + (SELECT COUNT(*) FROM {source})")
+
+
+def _recompute(conn, names):
+    for name in names:
+        maintain, tables = MAINTAINERS[name]
+        for table in tables:
+            conn.execute(f"DELETE FROM {table}")
+        maintain(conn, 'events')
+
+
+def rebuild(conn, names=None):
+    """Recompute derived tables from all events, archived ones included, in one transaction"""
+    names = list(names or MAINTAINERS)
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        _recompute(conn, names)
+        if set(names) == set(MAINTAINERS):
+            conn.execute("DELETE FROM derived_state")
+            conn.execute("INSERT INTO derived_state SELECT COUNT(*) FROM all_events")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def check(conn, names=None):
+    """Tables whose rows differ from what a rebuild would produce
+
+    Returns {table: (rows only in the table, rows only in the rebuild)}. The
+    rebuild runs in a transaction that is rolled back, so nothing changes.
+    Floating-point columns are compared to CHECK_DIGITS decimal places, as
+    sums taken batch by batch round differently from one sum over everything.
+    """
+    names = list(names or MAINTAINERS)
+    tables = [table for name in names for table in MAINTAINERS[name][1]]
+    differences = {}
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        for table in tables:
+            conn.execute(f"CREATE TEMP TABLE check_{table} AS SELECT * FROM {table}")
+        _recompute(conn, names)
+        for table in tables:
+            columns = ', '.join(
+                f"round({column}, {CHECK_DIGITS})" if column_type in ('DOUBLE', 'FLOAT') else column
+                for column, column_type, *_ in conn.execute(f"DESCRIBE {table}").fetchall())
+            kept, rebuilt = (conn.execute(f"""
+                SELECT COUNT(*) FROM (
+                    SELECT {columns} FROM {first} EXCEPT ALL SELECT {columns} FROM {second}
+                )
+            """).fetchone()[0] for first, second in ((f"check_{table}", table), (table, f"check_{table}")))
+            if kept or rebuilt:
+                differences[table] = (kept, rebuilt)
+    finally:
+        conn.execute("ROLLBACK")
+    return differences
+
+
+def is_stale(conn):
+    """Whether all_events has rows the derived tables have not seen"""
+    row = conn.execute("SELECT events FROM derived_state").fetchone()
+    total = conn.execute("SELECT COUNT(*) FROM all_events").fetchone()[0]
+    return row is None or row[0] != total
+
+
+def refresh(conn):
+    """Rebuild every derived table if rows bypassed ingest; returns whether it did"""
+    if not is_stale(conn):
+        return False
+    logger.info("Derived tables are out of date, rebuilding")
+    rebuild(conn)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain derived tables of the Claude events database')
+    parser.add_argument('command', choices=['rebuild', 'status', 'check'])
+    parser.add_argument('tables', nargs='*',
+                        help=f"Derived tables to rebuild or check (default: all of {', '.join(MAINTAINERS)})")
+    parser.add_argument('--db', default=DB_PATH, help='Path to the DuckDB file')
+    args = parser.parse_args()
+    unknown = set(args.tables) - set(MAINTAINERS)
+    if unknown:
+        parser.error(f"unknown derived table: {', '.join(sorted(unknown))}")
+
+    if args.command == 'status':
+        conn = duckdb.connect(args.db, read_only=True)
+        print("Derived tables are " + ("out of date" if is_stale(conn) else "up to date"))
+        conn.close()
+        return
+
+    conn = duckdb.connect(args.db)
+    if args.command == 'check':
+        try:
+            differences = check(conn, args.tables)
+        finally:
+            conn.close()
+        for table, (kept, rebuilt) in differences.items():
+            print(f"{table}: {kept} rows not in a rebuild, {rebuilt} rebuilt rows missing")
+        print("Derived tables " + ("differ from" if differences else "match") + " a rebuild")
+        sys.exit(1 if differences else 0)
+
+    try:
+        rebuild(conn, args.tables)
+    finally:
+        conn.close()
+    for name in args.tables or MAINTAINERS:
+        print(f"Rebuilt {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""Overhead of hooks/log-all-events.sh per tool call
+
+Claude Code waits for the hook on every PreToolUse/PostToolUse, so its wall
+time is added to each tool call. This replays hook payloads through the real
+script, one session at a time and with N concurrent sessions, for each
+delivery mode (CLAUDE_MONITOR_HOOK_MODE):
+
+    auto    collector socket (a collector is started for the run)
+    spool   append to the spool only
+    direct  duckdb CLI insert
+
+and reports per-event wall time (p50/p95/max, overall and by payload size),
+the processes forked per event and events that never arrived (the direct
+mode drops events when another hook holds the database lock).
+
+    python web-ui/hookbench.py [--modes auto,spool,direct] [--concurrency 1,4,16]
+    python web-ui/hookbench.py --payloads-from logs/claude_events.duckdb --output hooks.json
+    python web-ui/hookbench.py --modes spool --budget-ms 20 --baseline hooks.json
+
+Payloads are synthetic (workload.py) or sampled from a recorded database with
+--payloads-from. Each run uses a copy of the hooks in a scratch directory, so
+the real logs/ is never touched. Fork counts come from the system-wide
+counter in /proc/stat and include anything else that started meanwhile.
+
+The exit status is 1 if a mode given with --require exceeds the p95 budget
+or loses events, or if a run's p95 regressed against --baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import duckdb
+
+import blobstore
+import collector as collector_module
+import schema
+import spool
+import workload
+
+HOOKS_DIR = os.path.join(os.path.dirname(__file__), '../hooks')
+HOOK_FILES = ('log-all-events.sh', 'insert-event.jq')
+
+MODES = ('auto', 'spool', 'direct')
+DEFAULT_EVENTS = 200
+DEFAULT_CONCURRENCY = '1,8'
+DEFAULT_BUDGET_MS = 20.0
+DEFAULT_TOLERANCE = 0.25
+HOOK_TIMEOUT_SECONDS = 30
+
+# Payload size buckets (upper bounds in bytes)
+SIZE_BUCKETS = (('small', 1024), ('medium', 16 * 1024), ('large', None))
+
+
+def synthetic_payloads(count, seed=0):
+    """(event_type, tool_name, payload) of `count` workload events"""
+    events = workload.Workload(seed).events(count)
+    return [(event[1], event[2] or '', event[4]) for _, event in zip(range(count), events)]
+
+
+def recorded_payloads(db_path, count, seed=0):
+    """(event_type, tool_name, payload) of `count` events sampled from a database"""
+    conn = duckdb.connect(db_path, read_only=True)
+    try:
+        rows = conn.execute(f"""
+            SELECT event_type, COALESCE(tool_name, ''), data::VARCHAR
+            FROM events USING SAMPLE reservoir({int(count)} ROWS) REPEATABLE ({int(seed)})
+        """).fetchall()
+        # Hooks receive the original strings, not blob references
+        return [(event_type, tool_name, json.dumps(blobstore.resolve(conn, json.loads(payload))))
+                for event_type, tool_name, payload in rows]
+    finally:
+        conn.close()
+
+
+def size_bucket(payload):
+    size = len(payload.encode('utf-8'))
+    for name, limit in SIZE_BUCKETS:
+        if limit is None or size < limit:
+            return name
+
+
+def process_count():
+    """Processes created on this machine since boot, or None where unknown"""
+    try:
+        with open('/proc/stat') as stat:
+            for line in stat:
+                if line.startswith('processes '):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def socket_client():
+    """The program the hook will use to talk to the collector socket"""
+    for program in ('nc', 'socat'):
+        if shutil.which(program):
+            return program
+    return 'python3'
+
+
+class Sandbox:
+    """Scratch copy of the hooks with its own logs directory"""
+
+    def __init__(self, mode):
+        self.root = tempfile.mkdtemp(prefix='hookbench-')
+        hooks = os.path.join(self.root, 'hooks')
+        os.makedirs(hooks)
+        for name in HOOK_FILES:
+            shutil.copy(os.path.join(HOOKS_DIR, name), hooks)
+        self.hook = os.path.join(hooks, 'log-all-events.sh')
+        self.logs = os.path.join(self.root, 'logs')
+        os.makedirs(self.logs)
+        self.db_path = os.path.join(self.logs, 'claude_events.duckdb')
+        self.socket_path = os.path.join(self.logs, 'collector.sock')
+        self.spool_dir = os.path.join(self.logs, 'spool')
+        self.env = dict(os.environ, CLAUDE_MONITOR_HOOK_MODE=mode,
+                        CLAUDE_MONITOR_SOCKET=self.socket_path, CLAUDE_MONITOR_SPOOL=self.spool_dir)
+        # Outside tmux the hook never asks tmux for the session name
+        self.env.pop('TMUX', None)
+
+        conn = duckdb.connect(self.db_path)
+        schema.migrate(conn)
+        conn.close()
+
+    def run_hook(self, event_type, tool_name, payload):
+        """Run the hook once; returns (seconds, exit status)"""
+        started = time.perf_counter()
+        try:
+            result = subprocess.run(['bash', self.hook, event_type, tool_name], input=payload.encode('utf-8'),
+                                    env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                    timeout=HOOK_TIMEOUT_SECONDS)
+            status = result.returncode
+        except subprocess.TimeoutExpired:
+            status = 'timeout'
+        return time.perf_counter() - started, status
+
+    def spooled_events(self):
+        """Number of complete records in the spool"""
+        count = 0
+        if os.path.isdir(self.spool_dir):
+            for name in os.listdir(self.spool_dir):
+                if name.endswith(spool.SEGMENT_SUFFIX):
+                    with open(os.path.join(self.spool_dir, name), 'rb') as segment:
+                        count += len(spool.parse_records(segment.read())[0])
+        return count
+
+    def stored_events(self):
+        conn = duckdb.connect(self.db_path, read_only=True)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM all_events").fetchone()[0]
+        finally:
+            conn.close()
+
+    def close(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(timings):
+    return {
+        'events': len(timings),
+        'p50_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'max_ms': round(max(timings) * 1000, 3),
+    }
+
+
+def run(mode, concurrency, payloads):
+    """Replay payloads through the hook in `mode` with `concurrency` sessions at once"""
+    sandbox = Sandbox(mode)
+    collector = None
+    if mode == 'auto':
+        collector = collector_module.Collector(db_path=sandbox.db_path, socket_path=sandbox.socket_path,
+                                               text_log_path=None, spool_dir=sandbox.spool_dir).start()
+    # Each simulated session replays its share of the payloads in order
+    timings = [[] for _ in range(concurrency)]
+    statuses = [[] for _ in range(concurrency)]
+
+    def session(worker):
+        for event_type, tool_name, payload in payloads[worker::concurrency]:
+            seconds, status = sandbox.run_hook(event_type, tool_name, payload)
+            timings[worker].append((seconds, size_bucket(payload)))
+            statuses[worker].append(status)
+
+    try:
+        forks_before = process_count()
+        started = time.perf_counter()
+        threads = [threading.Thread(target=session, args=(worker,)) for worker in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        forks_after = process_count()
+
+        spooled_fallback = 0
+        if collector is not None:
+            collector.stop()
+            spooled_fallback = collector.stats['spooled_loaded']
+            collector = None
+        delivered = sandbox.spooled_events() if mode == 'spool' else sandbox.stored_events()
+    finally:
+        if collector is not None:
+            collector.stop()
+        sandbox.close()
+
+    samples = [sample for worker in timings for sample in worker]
+    failed = sum(1 for worker in statuses for status in worker if status != 0)
+    result = {'mode': mode, 'concurrency': concurrency}
+    result.update(summarize([seconds for seconds, _ in samples]))
+    result['by_size'] = {
+        name: summarize(bucket)
+        for name, bucket in ((name, [s for s, b in samples if b == name]) for name, _ in SIZE_BUCKETS)
+        if bucket
+    }
+    result['forks_per_event'] = (
+        # Less the hook's own bash process
+        round((forks_after - forks_before) / len(samples) - 1, 2) if forks_before is not None else None
+    )
+    result['events_per_second'] = round(len(samples) / elapsed, 1)
+    result['failed'] = failed
+    result['lost'] = len(payloads) - delivered
+    result['spooled_fallback'] = spooled_fallback
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Runs whose p95 grew by more than tolerance over the baseline report"""
+    previous = {(r['mode'], r['concurrency']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['mode'], result['concurrency']))
+        if before and result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append({'mode': result['mode'], 'concurrency': result['concurrency'],
+                                'baseline_p95_ms': before['p95_ms'], 'p95_ms': result['p95_ms']})
+    return regressions
+
+
+def _csv(value, convert=str):
+    return [convert(item) for item in value.split(',') if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the latency hooks/log-all-events.sh adds per tool call')
+    parser.add_argument('--modes', type=_csv, default=list(MODES),
+                        help=f"Comma-separated hook modes (default: {','.join(MODES)})")
+    parser.add_argument('--concurrency', type=lambda v: _csv(v, int), default=_csv(DEFAULT_CONCURRENCY, int),
+                        help=f'Comma-separated numbers of concurrent sessions (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--events', type=int, default=DEFAULT_EVENTS, help='Events replayed per run')
+    parser.add_argument('--payloads-from', metavar='DB', help='Sample payloads from this database')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the payloads')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help=f'p95 latency budget per event (default: {DEFAULT_BUDGET_MS})')
+    parser.add_argument('--require', type=_csv, default=[],
+                        help='Fail unless these modes stay within the budget without losing events')
+    parser.add_argument('--baseline', help='Earlier --output to check for p95 regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Allowed p95 growth over the baseline (default: {DEFAULT_TOLERANCE})')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+    unknown = set(args.modes + args.require) - set(MODES)
+    if unknown:
+        parser.error(f"unknown hook mode: {', '.join(sorted(unknown))}")
+    if 'direct' in args.modes and not (shutil.which('duckdb') and shutil.which('jq')):
+        parser.error("direct mode needs the duckdb CLI and jq on PATH")
+
+    if args.payloads_from:
+        payloads = recorded_payloads(args.payloads_from, args.events, args.seed)
+    else:
+        payloads = synthetic_payloads(args.events, args.seed)
+
+    results = []
+    for mode in args.modes:
+        for concurrency in args.concurrency:
+            result = run(mode, concurrency, payloads)
+            result['within_budget'] = result['p95_ms'] <= args.budget_ms and not result['lost']
+            print(f"{mode:6} x{concurrency:<3} p50 {result['p50_ms']:7.1f}ms  p95 {result['p95_ms']:7.1f}ms  "
+                  f"forks/event {result['forks_per_event']}  lost {result['lost']}", file=sys.stderr)
+            results.append(result)
+
+    report = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'platform': platform.platform(),
+        'bash': subprocess.run(['bash', '-c', 'echo $BASH_VERSION'], capture_output=True, text=True).stdout.strip(),
+        'socket_client': socket_client(),
+        'budget_ms': args.budget_ms,
+        'payloads': 'recorded' if args.payloads_from else 'synthetic',
+        'results': results,
+        # Modes that kept every run within the budget
+        'within_budget': [mode for mode in args.modes
+                          if all(r['within_budget'] for r in results if r['mode'] == mode)],
+    }
+    failures = [mode for mode in args.require if mode not in report['within_budget']]
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(results, json.load(f), args.tolerance)
+        failures.extend(f"{r['mode']} x{r['concurrency']} regressed" for r in report['regressions'])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if failures:
+        print(f"Failed checks: {', '.join(failures)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
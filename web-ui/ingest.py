@@ -0,0 +1,125 @@
+"""Turn raw hook payloads into all_events rows and write them in batches
+
+Shared by the collector daemon and the spool drainer, so the promoted columns
+are always extracted the same way as hooks/insert-event.jq.
+
+Hooks frame each event the same way for the collector socket and the spool:
+
+    <event_type>\\t<tool_name>\\t<matcher>\\t<timestamp>\\t<tmux_session>\\t<length>\\n
+    <length bytes of JSON payload>
+"""
+import json
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import blobstore
+import derived
+
+EVENT_COLUMNS = ('timestamp, event_type, tool_name, matcher, data, '
+                 'session_id, tmux_session, cwd, subagent_type')
+
+# Batches are staged in a temp table so the derived tables can be updated from
+# exactly the new rows with set-based SQL (see derived.py). Ids are drawn when
+# staging, so derived tables can refer to the events of the batch.
+BATCH_DDL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS ingest_batch AS
+    SELECT {EVENT_COLUMNS}, id FROM all_events LIMIT 0
+"""
+
+# The batch is bound as a single JSON array of rows and unpacked by DuckDB:
+# executemany() binds row by row and manages well under 1000 rows/s
+INSERT_SQL = f"""
+    INSERT INTO ingest_batch ({EVENT_COLUMNS}, id)
+    SELECT r[1]::TIMESTAMP, r[2], r[3], r[4], r[5]::JSON, r[6], r[7], r[8], r[9], nextval('all_events_id_seq')
+    FROM (SELECT unnest(from_json(?, '["VARCHAR[]"]')) as r)
+"""
+
+HEADER_FIELDS = ('event_type', 'tool_name', 'matcher', 'timestamp', 'tmux_session', 'length')
+
+
+def utc_now():
+    """Current UTC time as a naive datetime, matching the TIMESTAMP column"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def parse_header(line):
+    """Parse a frame header line into a dict, or None if it is malformed"""
+    fields = line.rstrip(b'\n').decode('utf-8', 'replace').split('\t')
+    if len(fields) != len(HEADER_FIELDS) or not fields[-1].isdigit():
+        return None
+    header = dict(zip(HEADER_FIELDS, fields))
+    header['length'] = int(header['length'])
+    return header
+
+
+def format_record(event_type, payload, tool_name='', matcher='', timestamp='', tmux_session=''):
+    """Frame a payload (bytes) exactly like the hook does"""
+    header = '\t'.join([event_type, tool_name, matcher, str(timestamp), tmux_session, str(len(payload))])
+    return header.encode('utf-8') + b'\n' + payload + b'\n'
+
+
+def build_event(event_type, payload, tool_name='', matcher='', tmux_session='', timestamp=None):
+    """Build an all_events row from a raw hook payload (None if it is not a JSON object)"""
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    if tmux_session:
+        data['tmux_session'] = tmux_session
+    tool_input = data.get('tool_input')
+
+    return (
+        timestamp or utc_now(),
+        event_type or 'unknown',
+        data.get('tool_name') or tool_name or None,
+        matcher or None,
+        json.dumps(data, ensure_ascii=False, separators=(',', ':')),
+        data.get('session_id'),
+        data.get('tmux_session') or None,
+        data.get('cwd'),
+        tool_input.get('subagent_type') if isinstance(tool_input, dict) else None,
+    )
+
+
+def build_event_from_frame(header, payload):
+    """build_event for a parsed frame header and its payload bytes"""
+    return build_event(
+        header['event_type'], payload.decode('utf-8', 'replace'),
+        tool_name=header['tool_name'], matcher=header['matcher'],
+        tmux_session=header['tmux_session'], timestamp=header['timestamp'] or None
+    )
+
+
+@contextmanager
+def transaction(conn):
+    """Run a block in a single DuckDB transaction"""
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def insert_events(conn, events):
+    """Insert rows from build_event and update the derived tables
+
+    Call inside transaction() so the batch and the derived tables change atomically.
+    Large payload strings are moved to the blob store (see blobstore.py).
+    """
+    if not events:
+        return 0
+    blobs = {}
+    rows = [(str(event[0]),) + event[1:4] + (blobstore.externalize(event[4], blobs),) + event[5:]
+            for event in events]
+    blobstore.store(conn, blobs)
+    conn.execute(BATCH_DDL)
+    conn.execute("DELETE FROM ingest_batch")
+    conn.execute(INSERT_SQL, [json.dumps(rows, ensure_ascii=False)])
+    conn.execute(f"INSERT INTO all_events ({EVENT_COLUMNS}, id) SELECT {EVENT_COLUMNS}, id FROM ingest_batch")
+    derived.update(conn)
+    return len(events)
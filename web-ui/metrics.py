@@ -0,0 +1,259 @@
+"""Query timing and Prometheus metrics for the dashboard
+
+Requests get their cursor wrapped in a TimedCursor, which times every query
+from execute() through its fetch and files it under a label: the one passed
+to execute(label=...), or the module and function that ran it. Each query
+is added to
+
+- the request's list of timings, which app.py sends back in a Server-Timing
+  header (visible in the browser's network panel),
+- histograms of query time and counters of rows per route and label, and
+- the slow-query log, if one is configured: queries that took longer than its
+  threshold are run again under EXPLAIN ANALYZE and the plan is appended to
+  the log file.
+
+/metrics renders the histograms in the Prometheus text format (render()),
+together with whatever gauges the app adds (pool, cache, table sizes).
+"""
+import json
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Upper bounds in seconds, as used by Prometheus client libraries
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Request and query metrics, keyed by route and query label"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._queries = {}
+        self._rows = {}
+
+    def observe_request(self, route, seconds):
+        with self._lock:
+            if route not in self._requests:
+                self._requests[route] = Histogram(self.buckets)
+            self._requests[route].observe(seconds)
+
+    def observe_query(self, route, label, seconds, rows):
+        key = (route, label)
+        with self._lock:
+            if key not in self._queries:
+                self._queries[key] = Histogram(self.buckets)
+                self._rows[key] = 0
+            self._queries[key].observe(seconds)
+            self._rows[key] += rows
+
+    def render(self, gauges=()):
+        """Prometheus text exposition of the histograms followed by gauges
+
+        gauges are (name, help, {labels} or None, value) tuples.
+        """
+        lines = []
+        with self._lock:
+            _render_histograms(lines, 'dashboard_request_duration_seconds',
+                               'Time to build responses',
+                               {(route,): h for route, h in self._requests.items()}, ('route',))
+            _render_histograms(lines, 'dashboard_query_duration_seconds',
+                               'Time to execute and fetch SQL queries',
+                               self._queries, ('route', 'query'))
+            lines.append('# HELP dashboard_query_rows_total Rows fetched by SQL queries')
+            lines.append('# TYPE dashboard_query_rows_total counter')
+            for key, rows in sorted(self._rows.items()):
+                lines.append(f"dashboard_query_rows_total{_labels(zip(('route', 'query'), key))} {rows}")
+
+        seen = set()
+        for name, help_text, labels, value in gauges:
+            if value is None:
+                continue
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{_labels((labels or {}).items())} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _render_histograms(lines, name, help_text, histograms, label_names):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, histogram in sorted(histograms.items()):
+        labels = list(zip(label_names, key))
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f"{name}_bucket{_labels(labels + [('le', _number(bound))])} {count}")
+        lines.append(f"{name}_bucket{_labels(labels + [('le', '+Inf')])} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+
+def _labels(pairs):
+    pairs = list(pairs)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class SlowQueryLog:
+    """Append EXPLAIN ANALYZE of queries slower than threshold_ms to a file"""
+
+    def __init__(self, path, threshold_ms):
+        self.path = path
+        self.threshold = threshold_ms / 1000
+        self._lock = threading.Lock()
+
+    def record(self, cursor, route, label, seconds, sql, params):
+        try:
+            plan = cursor.execute('EXPLAIN ANALYZE ' + sql, params).fetchall()
+            plan = '\n'.join(row[-1] for row in plan)
+        except Exception as e:
+            plan = f"EXPLAIN ANALYZE failed: {e}"
+        entry = (f"==== {datetime.now().isoformat(timespec='seconds')} {route} {label} "
+                 f"{seconds * 1000:.1f}ms\n{sql.strip()}\n"
+                 f"-- params: {json.dumps(params, default=str)}\n{plan}\n")
+        with self._lock:
+            with open(self.path, 'a') as log:
+                log.write(entry)
+
+
+class TimedCursor:
+    """DuckDB cursor wrapper that times and labels every query
+
+    Anything other than execute() and the fetch methods is passed through to
+    the wrapped cursor. With a watchdog (db.QueryWatchdog) each query is
+    interrupted once it has spent the watchdog's timeout in execute() and
+    fetches. DuckDB computes results as they are fetched, so streamed
+    responses are watched batch by batch, and the time spent sending each
+    batch to the client between fetches does not count.
+    """
+
+    def __init__(self, cursor, route, registry, timings=None, slow_log=None, watchdog=None):
+        self.cursor = cursor
+        self.route = route
+        self.registry = registry
+        self.timings = timings
+        self.slow_log = slow_log
+        self.watchdog = watchdog
+        self._query = None
+
+    def execute(self, sql, params=None, label=None):
+        self.finish()
+        if label is None:
+            caller = sys._getframe(1)
+            label = f"{caller.f_globals.get('__name__', '?')}.{caller.f_code.co_name}"
+        self._query = [label, 0.0, 0, sql, params]
+        try:
+            self._timed(self.cursor.execute, sql, params)
+        except Exception:
+            self._query = None
+            raise
+        return self
+
+    def fetchone(self):
+        row = self._timed(self.cursor.fetchone)
+        self._query[2] += row is not None
+        self.finish()
+        return row
+
+    def fetchall(self):
+        rows = self._timed(self.cursor.fetchall)
+        self._query[2] += len(rows)
+        self.finish()
+        return rows
+
+    def fetchmany(self, size=1):
+        rows = self._timed(self.cursor.fetchmany, size)
+        self._query[2] += len(rows)
+        if len(rows) < size:
+            self.finish()
+        return rows
+
+    def fetch_record_batch(self, rows_per_batch=1000000):
+        """Arrow RecordBatchReader over the result, timed batch by batch
+
+        The query is recorded once the last batch has been read.
+        """
+        # Newer DuckDB releases deprecate fetch_record_batch() for to_arrow_reader()
+        fetch = getattr(self.cursor, 'to_arrow_reader', None) or self.cursor.fetch_record_batch
+        reader = self._timed(fetch, rows_per_batch)
+        return reader.from_batches(reader.schema, self._batches(reader))
+
+    def _batches(self, reader):
+        while True:
+            try:
+                batch = self._timed(reader.read_next_batch)
+            except StopIteration:
+                break
+            self._query[2] += batch.num_rows
+            yield batch
+        self.finish()
+
+    def _timed(self, call, *args):
+        """Run call on the cursor, adding its time to the query's (and its timeout)"""
+        if self.watchdog is not None:
+            watch = self.watchdog.watch(self.cursor, self.watchdog.timeout - self._query[1])
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            self._query[1] += time.perf_counter() - started
+            if self.watchdog is not None:
+                self.watchdog.clear(watch)
+
+    def finish(self):
+        """Record the current query (called on its fetch, the next execute and release)"""
+        if self._query is None:
+            return
+        label, seconds, rows, sql, params = self._query
+        self._query = None
+        self.registry.observe_query(self.route, label, seconds, rows)
+        if self.timings is not None:
+            self.timings.append((label, seconds))
+        if self.slow_log is not None and seconds >= self.slow_log.threshold:
+            self.slow_log.record(self.cursor, self.route, label, seconds, sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def server_timing(timings, total=None, cache=None):
+    """Server-Timing header value for (label, seconds) pairs"""
+    parts = [f"{label};dur={seconds * 1000:.2f}" for label, seconds in timings]
+    if cache is not None:
+        parts.append(f'cache;desc="{cache}"')
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(parts)
@@ -0,0 +1,76 @@
+"""Check that the API URLs used by the dashboard pages are routes of app.py
+
+Every /api/... string in templates/*.html (fetch() targets and the panel
+paths handed to /api/batch) is matched against app.url_map, so a route that
+is renamed or loses its decorator fails here rather than as a blank panel.
+Parts filled in by the page (${...} in template literals, and whatever is
+appended to a string ending in /) stand in as a placeholder segment; query
+strings are ignored.
+
+    python web-ui/routecheck.py
+
+Exits with status 1 and lists the URLs matching no route, if any.
+"""
+import argparse
+import os
+import re
+import sys
+
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.routing import RequestRedirect
+
+from app import app
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+# Quoted or backquoted strings starting with /api/
+API_URL = re.compile(r"""(['"`])(/api/[^'"`]*)\1""")
+PLACEHOLDER = '1'  # Also matches <int:...> converters
+
+
+def template_urls(templates_dir=TEMPLATES_DIR):
+    """(template, line number, URL) of every /api/ string in the templates"""
+    for name in sorted(os.listdir(templates_dir)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(templates_dir, name)) as f:
+            for number, line in enumerate(f, 1):
+                for match in API_URL.finditer(line):
+                    yield name, number, match.group(2)
+
+
+def route_path(url):
+    """Path part of url with page-filled parts replaced by a placeholder"""
+    path = re.sub(r'\$\{[^}]*\}', PLACEHOLDER, url.split('?', 1)[0])
+    return path + PLACEHOLDER if path.endswith('/') else path
+
+
+def unresolved(urls):
+    """Those of (template, line, URL) whose path matches no route"""
+    adapter = app.url_map.bind('localhost')
+    missing = []
+    for name, number, url in urls:
+        try:
+            adapter.match(route_path(url), method='GET')
+        except MethodNotAllowed:
+            pass  # A route, for another method (POST /api/batch)
+        except (NotFound, RequestRedirect):
+            missing.append((name, number, url))
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that the API URLs used by the templates are routes of the app')
+    parser.add_argument('--templates', default=TEMPLATES_DIR, help='Directory of the templates to check')
+    args = parser.parse_args()
+
+    urls = list(template_urls(args.templates))
+    missing = unresolved(urls)
+    for name, number, url in missing:
+        print(f"{name}:{number}: no route for {url}")
+    print(f"{len(urls) - len(missing)} of {len(urls)} template URLs resolve")
+    sys.exit(1 if missing else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,439 @@
+"""Schema definition and migrations for the Claude events DuckDB database
+
+Run directly to bring an existing database up to date:
+
+    python web-ui/schema.py migrate
+"""
+import argparse
+import os
+
+import duckdb
+
+import archive
+import blobstore
+import derived
+
+# Path to DuckDB file (relative to web-ui folder)
+DB_PATH = os.path.join(os.path.dirname(__file__), '../logs/claude_events.duckdb')
+
+SCHEMA_VERSION = 13
+
+# Hot payload fields promoted to real columns. Filled in at insert time by
+# hooks/log-all-events.sh (see hooks/insert-event.jq) and backfilled by the
+# version 2 migration for rows written before that.
+PROMOTED_COLUMNS = {
+    'session_id': '$.session_id',
+    'tool_name': '$.tool_name',
+    'tmux_session': '$.tmux_session',
+    'cwd': '$.cwd',
+    'subagent_type': '$.tool_input.subagent_type',
+}
+
+ALL_EVENTS_DDL = """
+    CREATE TABLE IF NOT EXISTS all_events (
+        timestamp TIMESTAMP,
+        event_type VARCHAR,
+        tool_name VARCHAR,
+        matcher VARCHAR,
+        data JSON,
+        session_id VARCHAR,
+        tmux_session VARCHAR,
+        cwd VARCHAR,
+        subagent_type VARCHAR
+    )
+"""
+
+INDEXES_DDL = [
+    "CREATE INDEX IF NOT EXISTS idx_all_events_session_id ON all_events (session_id)",
+    "CREATE INDEX IF NOT EXISTS idx_all_events_tmux_session ON all_events (tmux_session)",
+]
+
+
+def table_exists(conn, name):
+    """Check whether a table exists in the main schema"""
+    return conn.execute("""
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_schema = 'main' AND table_name = ?
+    """, [name]).fetchone()[0] > 0
+
+
+def get_version(conn):
+    """Return the schema version of the database (0 = empty, 1 = pre-versioning)"""
+    if table_exists(conn, 'schema_version'):
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+        if row and row[0] is not None:
+            return row[0]
+    return 1 if table_exists(conn, 'all_events') else 0
+
+
+def set_version(conn, version):
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER, applied_at TIMESTAMP)")
+    conn.execute("INSERT INTO schema_version VALUES (?, CURRENT_TIMESTAMP)", [version])
+
+
+def migrate_v2(conn):
+    """Promote hot JSON fields to typed, indexed columns and backfill them"""
+    # Rebuilding the table in one pass is much faster than ALTER + UPDATE on
+    # large files and leaves the columns densely packed. The hook may already
+    # have added (empty) columns, so always recompute them from the payload.
+    conn.execute("""
+        CREATE TABLE all_events_v2 AS
+        SELECT
+            timestamp,
+            event_type,
+            COALESCE(json_extract_string(data, '$.tool_name'), NULLIF(tool_name, '')) as tool_name,
+            matcher,
+            data,
+            json_extract_string(data, '$.session_id') as session_id,
+            NULLIF(json_extract_string(data, '$.tmux_session'), '') as tmux_session,
+            json_extract_string(data, '$.cwd') as cwd,
+            json_extract_string(data, '$.tool_input.subagent_type') as subagent_type
+        FROM all_events
+        ORDER BY timestamp
+    """)
+    conn.execute("DROP TABLE all_events")
+    conn.execute("ALTER TABLE all_events_v2 RENAME TO all_events")
+    for ddl in INDEXES_DDL:
+        conn.execute(ddl)
+
+
+def migrate_v3(conn):
+    """Track how much of each spool segment has been loaded (see spool.py)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS spool_progress (
+            segment VARCHAR PRIMARY KEY,
+            bytes_loaded BIGINT,
+            updated_at TIMESTAMP
+        )
+    """)
+
+
+def migrate_v4(conn):
+    """Per-session summary maintained by ingest (see derived.py), backfilled"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_summary (
+            session_id VARCHAR PRIMARY KEY,
+            session_start TIMESTAMP,
+            session_end TIMESTAMP,
+            total_events BIGINT,
+            start_events BIGINT,
+            end_events BIGINT,
+            start_source VARCHAR,
+            cwd VARCHAR,
+            tmux_session VARCHAR,
+            tools_used VARCHAR[],
+            agents_used VARCHAR[]
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_agents (
+            session_id VARCHAR,
+            agent_type VARCHAR,
+            first_use TIMESTAMP,
+            PRIMARY KEY (session_id, agent_type)
+        )
+    """)
+    # Number of all_events rows the derived tables reflect
+    conn.execute("CREATE TABLE IF NOT EXISTS derived_state (events BIGINT)")
+    derived.MAINTAINERS['session_summary'][0](conn, 'all_events')
+    conn.execute("INSERT INTO derived_state SELECT COUNT(*) FROM all_events")
+
+
+def migrate_v5(conn):
+    """Tool calls paired on tool_use_id with durations (see derived.py), backfilled"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tool_calls (
+            tool_use_id VARCHAR PRIMARY KEY,
+            session_id VARCHAR,
+            tool_name VARCHAR,
+            agent_type VARCHAR,
+            description VARCHAR,
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            duration_seconds DOUBLE,
+            total_tokens BIGINT,
+            status VARCHAR
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tool_calls_session_start ON tool_calls (session_id, start_time)")
+    derived.MAINTAINERS['tool_calls'][0](conn, 'all_events')
+
+
+def migrate_v6(conn):
+    """Stable event ids, used with the timestamp as the keyset for pagination"""
+    # rowid is not stable across table rebuilds such as migrate_v2, so give
+    # every row a real id. Existing rows are numbered in storage order.
+    conn.execute("CREATE SEQUENCE IF NOT EXISTS all_events_id_seq")
+    conn.execute("ALTER TABLE all_events ADD COLUMN IF NOT EXISTS id BIGINT DEFAULT nextval('all_events_id_seq')")
+
+
+def migrate_v7(conn):
+    """Minute and hour rollups of event counts and distinct values (see derived.py), backfilled"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS event_rollup (
+            grain VARCHAR,
+            bucket TIMESTAMP,
+            event_type VARCHAR,
+            tool_name VARCHAR,
+            agent_type VARCHAR,
+            events BIGINT,
+            PRIMARY KEY (grain, bucket, event_type, tool_name, agent_type)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS distinct_rollup (
+            grain VARCHAR,
+            bucket TIMESTAMP,
+            dimension VARCHAR,
+            value VARCHAR,
+            PRIMARY KEY (grain, bucket, dimension, value)
+        )
+    """)
+    derived.MAINTAINERS['rollups'][0](conn, 'all_events')
+
+
+def migrate_v8(conn):
+    """Log of archive runs and the `events` view over live and archived events (see archive.py)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archive_log (
+            run_id VARCHAR PRIMARY KEY,
+            cutoff TIMESTAMP,
+            events BIGINT,
+            layout VARCHAR,
+            archived_at TIMESTAMP
+        )
+    """)
+    archive.ensure_view(conn)
+
+
+def migrate_v9(conn):
+    """Content-addressed store for large payload strings (see blobstore.py), backfilled"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash VARCHAR PRIMARY KEY,
+            size BIGINT,
+            data BLOB
+        )
+    """)
+    blobstore.compact(conn)
+
+
+def migrate_v10(conn):
+    """Per-session work/wait state and idle gaps (see derived.py), backfilled"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_activity (
+            session_id VARCHAR PRIMARY KEY,
+            tmux_session VARCHAR,
+            working_seconds DOUBLE,
+            waiting_seconds DOUBLE,
+            work_periods BIGINT,
+            prompt_count BIGINT,
+            stop_count BIGINT,
+            wait_histogram BIGINT[],
+            longest_wait_seconds DOUBLE,
+            last_event_type VARCHAR,
+            last_event_at TIMESTAMP,
+            last_seen_at TIMESTAMP,
+            last_tool VARCHAR
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_gaps (
+            session_id VARCHAR,
+            tmux_session VARCHAR,
+            gap_start TIMESTAMP,
+            gap_end TIMESTAMP,
+            gap_seconds DOUBLE,
+            last_tool VARCHAR,
+            next_tool VARCHAR
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_session_activity_tmux ON session_activity (tmux_session)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_session_gaps_tmux ON session_gaps (tmux_session)")
+    derived.MAINTAINERS['activity'][0](conn, 'events')
+
+
+def migrate_v11(conn):
+    """Full-text index of commands, file paths and prompts (see search.py), backfilled"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS search_documents (
+            event_id BIGINT PRIMARY KEY,
+            timestamp TIMESTAMP,
+            session_id VARCHAR,
+            tmux_session VARCHAR,
+            tool_name VARCHAR,
+            event_type VARCHAR,
+            terms BIGINT,
+            command VARCHAR,
+            file_path VARCHAR,
+            pattern VARCHAR,
+            url VARCHAR,
+            description VARCHAR,
+            prompt VARCHAR
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS search_terms (
+            term VARCHAR,
+            event_id BIGINT,
+            frequency BIGINT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_search_terms_term ON search_terms (term)")
+    derived.MAINTAINERS['search'][0](conn, 'events')
+
+
+def migrate_v12(conn):
+    """File activity index by normalized path (see derived.py), backfilled"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS file_access (
+            event_id BIGINT,
+            timestamp TIMESTAMP,
+            session_id VARCHAR,
+            tmux_session VARCHAR,
+            tool_name VARCHAR,
+            operation VARCHAR,
+            path VARCHAR,
+            directory VARCHAR
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS file_sessions (
+            path VARCHAR,
+            session_id VARCHAR,
+            reads BIGINT,
+            writes BIGINT,
+            first_access TIMESTAMP,
+            last_access TIMESTAMP,
+            PRIMARY KEY (path, session_id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS file_stats (
+            path VARCHAR PRIMARY KEY,
+            reads BIGINT,
+            writes BIGINT,
+            sessions BIGINT,
+            first_access TIMESTAMP,
+            last_access TIMESTAMP,
+            last_session_id VARCHAR,
+            last_tool VARCHAR
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS directory_stats (
+            directory VARCHAR PRIMARY KEY,
+            depth BIGINT,
+            reads BIGINT,
+            writes BIGINT,
+            files BIGINT,
+            last_access TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_file_access_path ON file_access (path)")
+    derived.MAINTAINERS['files'][0](conn, 'events')
+
+
+def migrate_v13(conn):
+    """Hourly token usage per session, subagent type and tool (see derived.py), backfilled"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS token_rollup (
+            hour TIMESTAMP,
+            session_id VARCHAR,
+            agent_type VARCHAR,
+            tool_name VARCHAR,
+            tmux_session VARCHAR,
+            calls BIGINT,
+            input_tokens BIGINT,
+            output_tokens BIGINT,
+            cache_creation_tokens BIGINT,
+            cache_read_tokens BIGINT,
+            total_tokens BIGINT,
+            PRIMARY KEY (hour, session_id, agent_type, tool_name)
+        )
+    """)
+    derived.MAINTAINERS['tokens'][0](conn, 'events')
+
+
+MIGRATIONS = {
+    2: migrate_v2,
+    3: migrate_v3,
+    4: migrate_v4,
+    5: migrate_v5,
+    6: migrate_v6,
+    7: migrate_v7,
+    8: migrate_v8,
+    9: migrate_v9,
+    10: migrate_v10,
+    11: migrate_v11,
+    12: migrate_v12,
+    13: migrate_v13,
+}
+
+
+def create_schema(conn):
+    """Create the version 2 layout of all_events in an empty database"""
+    conn.execute(ALL_EVENTS_DDL)
+    for ddl in INDEXES_DDL:
+        conn.execute(ddl)
+
+
+def migrate(conn):
+    """Apply pending migrations, returning (from_version, to_version)"""
+    start = current = get_version(conn)
+    if current >= SCHEMA_VERSION:
+        return current, current
+
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        if current == 0:
+            create_schema(conn)
+            current = 2
+        for version in range(current + 1, SCHEMA_VERSION + 1):
+            MIGRATIONS[version](conn)
+        set_version(conn, SCHEMA_VERSION)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return start, SCHEMA_VERSION
+
+
+def ensure_schema(db_path=DB_PATH):
+    """Open the database for writing just long enough to migrate it
+
+    Also rebuilds the derived tables if events were inserted without them and
+    points the events view at the archive next to the file.
+    """
+    conn = duckdb.connect(db_path)
+    try:
+        versions = migrate(conn)
+        archive.recover(conn)
+        archive.ensure_view(conn)
+        derived.refresh(conn)
+        return versions
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the Claude events database schema')
+    parser.add_argument('command', choices=['migrate', 'version'])
+    parser.add_argument('--db', default=DB_PATH, help='Path to the DuckDB file')
+    args = parser.parse_args()
+
+    if args.command == 'version':
+        conn = duckdb.connect(args.db, read_only=True)
+        print(f"Schema version: {get_version(conn)} (latest: {SCHEMA_VERSION})")
+        conn.close()
+        return
+
+    before, after = ensure_schema(args.db)
+    if before == after:
+        print(f"Schema is up to date (version {after})")
+    else:
+        print(f"Migrated schema from version {before} to {after}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""Full-text search over commands, file paths, patterns, URLs, descriptions and prompts
+
+An inverted index kept in two tables, maintained like the other derived tables
+(see derived.py) as batches are ingested:
+
+- search_documents has one row per indexed event (PreToolUse with one of the
+  fields below in tool_input, and UserPromptSubmit) with its session, tool,
+  number of terms and a preview of each field, and
+- search_terms has one row per term and event, with the term's frequency.
+
+Text is lowercased and split on anything but letters, digits and underscores,
+so /src/app.py is indexed as src, app and py. Strings moved to the blob store
+(see blobstore.py) are indexed by their original text.
+
+query() ranks the events containing every query term with BM25; a term ending
+in * matches any term it is a prefix of.
+
+    python web-ui/search.py "pytest -k"
+"""
+import argparse
+import os
+import re
+import zlib
+
+import duckdb
+
+import blobstore
+
+# Path to DuckDB file (relative to web-ui folder)
+DB_PATH = os.path.join(os.path.dirname(__file__), '../logs/claude_events.duckdb')
+
+# Indexed field -> SQL expression on an events relation
+FIELDS = {
+    'command': "json_extract_string(data, '$.tool_input.command')",
+    'file_path': """COALESCE(json_extract_string(data, '$.tool_input.file_path'),
+                             json_extract_string(data, '$.tool_input.notebook_path'),
+                             json_extract_string(data, '$.tool_input.path'))""",
+    'pattern': "json_extract_string(data, '$.tool_input.pattern')",
+    'url': "json_extract_string(data, '$.tool_input.url')",
+    'description': "json_extract_string(data, '$.tool_input.description')",
+    'prompt': "CASE WHEN event_type = 'UserPromptSubmit' THEN json_extract_string(data, '$.prompt') END",
+}
+
+# Separators between terms, in RE2 (DuckDB) and Python syntax
+TERM_SEPARATOR = r'[^\pL\pN_]+'
+QUERY_TERM = re.compile(r'[^\W]+\*?')
+
+# Longer terms (hashes, base64) are not indexed
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+
+# Characters of each field kept in search_documents for display
+PREVIEW_LENGTH = 300
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def update_search_index(conn, source):
+    """Index the PreToolUse and UserPromptSubmit events of source"""
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE search_batch AS
+        SELECT
+            id as event_id,
+            timestamp,
+            session_id,
+            tmux_session,
+            tool_name,
+            event_type,
+            {', '.join(f'{sql} as {field}' for field, sql in FIELDS.items())}
+        FROM {source}
+        WHERE event_type IN ('PreToolUse', 'UserPromptSubmit') AND id IS NOT NULL
+    """)
+    conn.execute(f"DELETE FROM search_batch WHERE COALESCE({', '.join(FIELDS)}) IS NULL")
+    _resolve_blobs(conn)
+
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE search_batch_terms AS
+        SELECT event_id, term, COUNT(*) as frequency
+        FROM (
+            SELECT event_id, unnest(regexp_split_to_array(
+                lower(concat_ws(' ', {', '.join(FIELDS)})), '{TERM_SEPARATOR}')) as term
+            FROM search_batch
+        )
+        WHERE term <> '' AND length(term) <= {MAX_TERM_LENGTH}
+        GROUP BY event_id, term
+    """)
+    conn.execute(f"""
+        INSERT INTO search_documents
+        SELECT
+            b.event_id,
+            b.timestamp,
+            b.session_id,
+            b.tmux_session,
+            b.tool_name,
+            b.event_type,
+            COALESCE(t.terms, 0),
+            {', '.join(f'left(b.{field}, {PREVIEW_LENGTH})' for field in FIELDS)}
+        FROM search_batch b
+        LEFT JOIN (
+            SELECT event_id, SUM(frequency) as terms FROM search_batch_terms GROUP BY event_id
+        ) t USING (event_id)
+    """)
+    conn.execute("INSERT INTO search_terms SELECT term, event_id, frequency FROM search_batch_terms")
+    for table in ('search_batch', 'search_batch_terms'):
+        conn.execute(f"DROP TABLE {table}")
+
+
+def _resolve_blobs(conn):
+    """Replace blob references in search_batch by their strings"""
+    refs = conn.execute(f"""
+        SELECT DISTINCT value FROM (
+            SELECT unnest([{', '.join(FIELDS)}]) as value FROM search_batch
+        )
+        WHERE starts_with(value, '{blobstore.REF_PREFIX}')
+    """).fetchall()
+    digests = [ref[len(blobstore.REF_PREFIX):] for ref, in refs if blobstore.is_ref(ref)]
+    if not digests:
+        return
+    rows = conn.execute("SELECT hash, data FROM blobs WHERE hash IN (SELECT unnest(?::VARCHAR[]))",
+                        [digests]).fetchall()
+    conn.execute("CREATE OR REPLACE TEMP TABLE search_blobs (ref VARCHAR, text VARCHAR)")
+    conn.executemany("INSERT INTO search_blobs VALUES (?, ?)",
+                     [(blobstore.REF_PREFIX + digest, zlib.decompress(data).decode('utf-8'))
+                      for digest, data in rows])
+    for field in FIELDS:
+        conn.execute(f"""
+            UPDATE search_batch SET {field} = search_blobs.text
+            FROM search_blobs
+            WHERE search_batch.{field} = search_blobs.ref
+        """)
+    conn.execute("DROP TABLE search_blobs")
+
+
+def parse_query(text):
+    """(term, is_prefix) pairs of a query, tokenized like the indexed text"""
+    terms = []
+    for word in QUERY_TERM.findall(text.lower()):
+        term = word.rstrip('*')
+        if term and len(term) <= MAX_TERM_LENGTH and (term, word != term) not in terms:
+            terms.append((term, word != term))
+    return terms[:MAX_QUERY_TERMS]
+
+
+def query(conn, text, tool=None, session_id=None, tmux_session=None, start=None, end=None,
+          limit=50, offset=0):
+    """(total matches, one page of matches ranked by BM25) for a query string
+
+    Matches are (event_id, timestamp, session_id, tmux_session, tool_name,
+    event_type, score, {field: preview}) tuples. Each term is looked up in
+    search_terms on its own, so only the postings of the query terms are read.
+    """
+    terms = parse_query(text)
+    if not terms:
+        return 0, []
+
+    postings = []
+    params = []
+    for i, (term, is_prefix) in enumerate(terms):
+        condition = 'starts_with(term, ?)' if is_prefix else 'term = ?'
+        postings.append(f"SELECT {i} as q, event_id, SUM(frequency) as frequency "
+                        f"FROM search_terms WHERE {condition} GROUP BY event_id")
+        params.append(term)
+
+    filters = []
+    for column, value in (('tool_name', tool), ('session_id', session_id), ('tmux_session', tmux_session)):
+        if value:
+            filters.append(f"d.{column} = ?")
+            params.append(value)
+    if start:
+        filters.append("d.timestamp >= ?")
+        params.append(start)
+    if end:
+        filters.append("d.timestamp < ?")
+        params.append(end)
+
+    rows = conn.execute(f"""
+        WITH postings AS (
+            {' UNION ALL '.join(postings)}
+        ),
+        frequencies AS (
+            SELECT q, COUNT(*) as documents FROM postings GROUP BY q
+        ),
+        corpus AS (
+            SELECT COUNT(*) as documents, GREATEST(AVG(terms), 1) as average_terms FROM search_documents
+        ),
+        scored AS (
+            SELECT
+                p.event_id,
+                SUM(
+                    ln(1 + (corpus.documents - f.documents + 0.5) / (f.documents + 0.5))
+                    * p.frequency * ({K1} + 1)
+                    / (p.frequency + {K1} * (1 - {B} + {B} * d.terms / corpus.average_terms))
+                ) as score
+            FROM postings p
+            JOIN frequencies f USING (q)
+            JOIN search_documents d USING (event_id)
+            CROSS JOIN corpus
+            WHERE {' AND '.join(filters) or 'TRUE'}
+            GROUP BY p.event_id
+            HAVING COUNT(*) = {len(terms)}
+        )
+        SELECT
+            d.event_id,
+            d.timestamp,
+            d.session_id,
+            d.tmux_session,
+            d.tool_name,
+            d.event_type,
+            s.score,
+            {', '.join(f'd.{field}' for field in FIELDS)},
+            COUNT(*) OVER () as total
+        FROM scored s
+        JOIN search_documents d USING (event_id)
+        ORDER BY s.score DESC, d.timestamp DESC, d.event_id DESC
+        LIMIT ? OFFSET ?
+    """, params + [limit, offset]).fetchall()
+
+    total = rows[0][-1] if rows else 0
+    return total, [row[:7] + ({field: value for field, value in zip(FIELDS, row[7:-1]) if value is not None},)
+                   for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search commands, file paths and prompts of the Claude events database')
+    parser.add_argument('query', help='Terms that must all appear; end a term with * to match prefixes')
+    parser.add_argument('--tool', help='Only events of this tool')
+    parser.add_argument('--session', help='Only events of this session')
+    parser.add_argument('--tmux', help='Only events of this tmux session')
+    parser.add_argument('--limit', type=int, default=20, help='Number of results')
+    parser.add_argument('--db', default=DB_PATH, help='Path to the DuckDB file')
+    args = parser.parse_args()
+
+    conn = duckdb.connect(args.db, read_only=True)
+    try:
+        total, matches = query(conn, args.query, tool=args.tool, session_id=args.session,
+                               tmux_session=args.tmux, limit=args.limit)
+    finally:
+        conn.close()
+    print(f"{total} matching events")
+    for event_id, timestamp, session_id, _tmux, tool_name, event_type, score, fields in matches:
+        print(f"{score:6.2f}  {timestamp:%Y-%m-%d %H:%M:%S}  {(session_id or '-')[:8]}  {tool_name or event_type}  #{event_id}")
+        for field, preview in fields.items():
+            print(f"        {field}: {' '.join(preview.split())[:120]}")
+
+
+if __name__ == '__main__':
+    main()
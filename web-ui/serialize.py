@@ -0,0 +1,230 @@
+"""Column-wise JSON encoding of query results
+
+Building a dict per row and handing the whole list to jsonify() costs more
+than the queries on large responses. Endpoints instead put Rows in their
+response body: a query result (a cursor still to be fetched, or rows already
+fetched) together with how each field of the JSON objects is computed from its
+columns. iter_json() then writes the body out in chunks:
+
+- rows are fetched BATCH_SIZE at a time and split into columns,
+- each field is computed for the whole batch at once (timestamps formatted,
+  durations taken) and encoded with the json module's C string encoder, and
+- the encoded columns are zipped into objects with one %-format per row, so
+  no dict or intermediate list of objects is built.
+
+Row encodes a single row as one object the same way, for endpoints returning
+one record.
+
+The output is byte for byte what Flask's jsonify() sends with its default
+settings: sorted keys, compact separators, ASCII only and a trailing newline.
+compatible() tells whether the app still uses them; when it does not (the
+debug server indents JSON), materialize() turns a body into the plain lists
+and dicts jsonify() expects.
+"""
+from json.encoder import encode_basestring_ascii
+
+from flask.json.provider import DefaultJSONProvider
+
+import blobstore
+
+BATCH_SIZE = 2048
+
+INFINITY = float('inf')
+
+
+# Field functions: columns of a batch (tuples) in, the field's values out
+
+def iso(column):
+    """Timestamps as ISO strings"""
+    return [None if value is None else value.isoformat() for value in column]
+
+
+def duration(starts, ends):
+    """Seconds from each start to its end"""
+    return [(end - start).total_seconds() if start and end else None for start, end in zip(starts, ends)]
+
+
+def or_else(default):
+    """Field function replacing falsy values (None, empty lists) by default"""
+    return lambda column: [value if value else default for value in column]
+
+
+def rounded(ndigits=None):
+    """Field function rounding numbers to ndigits"""
+    return lambda column: [None if value is None else round(value, ndigits) for value in column]
+
+
+class Rows:
+    """Query result encoded as a JSON array of objects
+
+    source is a cursor whose result has not been fetched, or a list of rows.
+    fields maps each key of the objects to a column index, or to a tuple
+    (function, index, ...) whose function gets those columns of a batch and
+    returns the field's values. With conn, blob references in string fields
+    are replaced by their strings (see blobstore.py).
+    """
+
+    def __init__(self, source, fields, conn=None):
+        self.source = source
+        self.fields = fields
+        self.conn = conn
+        keys = sorted(fields)
+        self._keys = keys
+        self._template = '{' + ','.join(encode_basestring_ascii(key).replace('%', '%%') + ':%s'
+                                        for key in keys) + '}'
+
+    def _batches(self):
+        if isinstance(self.source, list):
+            for start in range(0, len(self.source), BATCH_SIZE):
+                yield self.source[start:start + BATCH_SIZE]
+            return
+        while True:
+            rows = self.source.fetchmany(BATCH_SIZE)
+            if rows:
+                yield rows
+            if len(rows) < BATCH_SIZE:
+                return
+
+    def _values(self, rows):
+        """{key: values of the batch} in sorted key order"""
+        columns = list(zip(*rows))
+        values = {}
+        for key in self._keys:
+            spec = self.fields[key]
+            if isinstance(spec, int):
+                values[key] = columns[spec]
+            else:
+                function, *indexes = spec
+                values[key] = function(*(columns[i] for i in indexes))
+        if self.conn is not None:
+            _resolve_blobs(self.conn, values)
+        return values
+
+    def _objects(self, dumps):
+        """The objects of each batch, encoded and joined by commas"""
+        for rows in self._batches():
+            encoded = [_encode(column, dumps) for column in self._values(rows).values()]
+            template = self._template
+            yield ','.join([template % row for row in zip(*encoded)])
+
+    def chunks(self, dumps):
+        yield '['
+        separator = ''
+        for objects in self._objects(dumps):
+            yield separator + objects
+            separator = ','
+        yield ']'
+
+    def materialize(self):
+        objects = []
+        for rows in self._batches():
+            values = self._values(rows)
+            objects.extend(dict(zip(values, row)) for row in zip(*values.values()))
+        return objects
+
+
+class Row(Rows):
+    """One row (a tuple) encoded as a JSON object, fields as for Rows"""
+
+    def __init__(self, row, fields, conn=None):
+        super().__init__([row], fields, conn)
+
+    def chunks(self, dumps):
+        yield from self._objects(dumps)
+
+    def materialize(self):
+        return super().materialize()[0]
+
+
+def _resolve_blobs(conn, values):
+    refs = set()
+    for column in values.values():
+        refs.update(value[len(blobstore.REF_PREFIX):] for value in column if blobstore.is_ref(value))
+    if not refs:
+        return
+    strings = {blobstore.REF_PREFIX + digest: string
+               for digest, string in blobstore.strings(conn, sorted(refs)).items()}
+    for key, column in values.items():
+        if any(blobstore.is_ref(value) for value in column):
+            values[key] = [strings.get(value, value) if blobstore.is_ref(value) else value for value in column]
+
+
+def _float(value):
+    # As json.dumps(): repr, except for the non-finite values
+    if value != value:
+        return 'NaN'
+    if value == INFINITY:
+        return 'Infinity'
+    if value == -INFINITY:
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+_ENCODERS = {
+    type(None): lambda value: 'null',
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: _float,
+    bool: lambda value: 'true' if value else 'false',
+}
+
+
+def _encode(column, dumps):
+    encoders = _ENCODERS
+    return [encoders.get(type(value), dumps)(value) for value in column]
+
+
+def _contains_rows(value):
+    if isinstance(value, Rows):
+        return True
+    if isinstance(value, dict):
+        return any(_contains_rows(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_contains_rows(item) for item in value)
+    return False
+
+
+def _chunks(value, dumps):
+    if isinstance(value, Rows):
+        yield from value.chunks(dumps)
+    elif isinstance(value, dict) and _contains_rows(value):
+        separator = '{'
+        for key in sorted(value):
+            yield separator + encode_basestring_ascii(key) + ':'
+            yield from _chunks(value[key], dumps)
+            separator = ','
+        yield '}'
+    elif isinstance(value, (list, tuple)) and _contains_rows(value):
+        separator = '['
+        for item in value:
+            yield separator
+            yield from _chunks(item, dumps)
+            separator = ','
+        yield ']'
+    else:
+        yield dumps(value)
+
+
+def iter_json(body, dumps):
+    """Chunks (bytes) of body as JSON; dumps encodes everything but Rows"""
+    for chunk in _chunks(body, dumps):
+        yield chunk.encode('utf-8')
+    yield b'\n'
+
+
+def materialize(body):
+    """body with every Rows replaced by its list of dicts"""
+    if isinstance(body, Rows):
+        return body.materialize()
+    if isinstance(body, dict):
+        return {key: materialize(value) for key, value in body.items()}
+    if isinstance(body, (list, tuple)):
+        return [materialize(item) for item in body]
+    return body
+
+
+def compatible(app):
+    """Whether jsonify() of app writes what iter_json() does"""
+    provider = app.json
+    return (type(provider) is DefaultJSONProvider and provider.ensure_ascii and provider.sort_keys
+            and provider.compact is not False and not (provider.compact is None and app.debug))
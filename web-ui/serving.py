@@ -0,0 +1,78 @@
+"""Production serving for the dashboard (app.py --production)
+
+The Flask development server handles one request after another with the
+debugger and reloader on. serve() runs the app on Werkzeug's threaded server
+instead: each request gets a thread and its own pooled cursor (see db.py), and
+DuckDB releases the GIL while a query runs, so slow queries no longer hold up
+the rest of the dashboard.
+
+Threads rather than worker processes: DuckDB lets only one process open the
+database file while another holds it for writing, and the embedded collector
+holds it for as long as the dashboard runs.
+
+RequestLimiter caps the requests being answered at once; app.py turns away the
+rest with 503 so a burst of slow queries cannot pile up threads and cursors.
+On SIGTERM or Ctrl-C, serve() stops accepting connections and waits up to
+grace seconds for in-flight requests before returning.
+"""
+import signal
+import threading
+
+from werkzeug.serving import make_server
+
+
+class RequestLimiter:
+    """Counting semaphore over in-flight requests that never blocks"""
+
+    def __init__(self, max_concurrent):
+        self.max_concurrent = max_concurrent
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._stats = {'served': 0, 'rejected': 0}
+
+    def try_acquire(self):
+        """Take a slot if one is free; False if max_concurrent requests are in flight"""
+        with self._cond:
+            if self._in_flight >= self.max_concurrent:
+                self._stats['rejected'] += 1
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._stats['served'] += 1
+            self._cond.notify_all()
+
+    def wait_idle(self, timeout):
+        """Wait up to timeout seconds for in-flight requests; True if none are left"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, max_concurrent=self.max_concurrent, in_flight=self._in_flight)
+
+
+def serve(app, host, port, limiter=None, grace=10.0):
+    """Serve app on a threaded Werkzeug server until SIGTERM or Ctrl-C"""
+    server = make_server(host, port, app, threaded=True)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, which runs in this
+        # (the main) thread, so it has to be called from another one
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    previous = signal.signal(signal.SIGTERM, stop)
+    print(f" * Serving on http://{host}:{port} (threaded"
+          f"{f', at most {limiter.max_concurrent} requests at once' if limiter else ''})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        server.server_close()
+        if limiter is not None and not limiter.wait_idle(grace):
+            print(f"Warning: {limiter.stats()['in_flight']} requests still running after {grace:g}s")
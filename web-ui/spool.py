@@ -0,0 +1,160 @@
+"""Append-only spool for hook events that bypass the collector
+
+In spool mode (or whenever the collector socket is unavailable) the hook
+appends the framed event to a segment file under logs/spool/ and returns
+immediately, without touching DuckDB. Segments are named
+<YYYYmmddHHMM>-<pid>.seg (UTC minute of the write, hook process id), so only
+one process appends to a segment at a time and no segment is written to once
+its minute has passed.
+
+The drainer bulk-loads complete records into all_events and, in the same
+transaction, records how many bytes of each segment have been loaded in
+spool_progress. A crash or a locked database at any point therefore never
+loses or duplicates an event: the next drain resumes from the committed offset.
+"""
+import os
+import time
+from datetime import datetime, timezone
+
+import ingest
+
+LOGS_DIR = os.path.join(os.path.dirname(__file__), '../logs')
+SPOOL_DIR = os.environ.get('CLAUDE_MONITOR_SPOOL', os.path.join(LOGS_DIR, 'spool'))
+
+SEGMENT_SUFFIX = '.seg'
+
+# How long after its minute ends a segment may still receive a late write
+SEAL_GRACE_SECONDS = 120
+
+
+def segment_name(prefix='py'):
+    """Segment file name for records written by this process"""
+    minute = datetime.now(timezone.utc).strftime('%Y%m%d%H%M')
+    return f"{minute}-{prefix}{os.getpid()}{SEGMENT_SUFFIX}"
+
+
+def append(events, spool_dir=SPOOL_DIR):
+    """Spool rows built by ingest.build_event, e.g. ones the collector could not write"""
+    os.makedirs(spool_dir, exist_ok=True)
+    path = os.path.join(spool_dir, segment_name())
+    with open(path, 'ab') as segment:
+        for event in events:
+            timestamp, event_type, tool_name, matcher, data = event[:5]
+            segment.write(ingest.format_record(
+                event_type, data.encode('utf-8'), tool_name or '', matcher or '', timestamp
+            ))
+    return path
+
+
+def parse_records(data):
+    """Parse complete framed records from a chunk of a segment
+
+    Returns (events, consumed_bytes, skipped). A trailing record that is still
+    being written is left for the next drain.
+    """
+    events = []
+    skipped = 0
+    pos = 0
+    while pos < len(data):
+        newline = data.find(b'\n', pos)
+        if newline < 0:
+            break
+        header = ingest.parse_header(data[pos:newline + 1])
+        if header is None:
+            # Not a frame header (e.g. the tail of a write that was cut
+            # short): resynchronise on the next line
+            skipped += 1
+            pos = newline + 1
+            continue
+        end = newline + 1 + header['length']
+        if end + 1 > len(data):
+            break
+        event = ingest.build_event_from_frame(header, data[newline + 1:end])
+        if event is None:
+            skipped += 1
+        else:
+            events.append(event)
+        pos = end + 1  # payload is followed by a newline
+    return events, pos, skipped
+
+
+def is_sealed(name, path, now=None):
+    """Whether no hook can still append to this segment"""
+    now = now or time.time()
+    try:
+        minute = datetime.strptime(name.split('-', 1)[0], '%Y%m%d%H%M').replace(tzinfo=timezone.utc)
+        last_write = minute.timestamp() + 60
+    except ValueError:
+        last_write = os.path.getmtime(path)
+    return now - last_write > SEAL_GRACE_SECONDS
+
+
+def drain(conn, spool_dir=SPOOL_DIR):
+    """Load every complete spooled record not loaded yet
+
+    Returns a dict with the number of events loaded, records skipped as
+    unparseable and segments removed.
+    """
+    result = {'loaded': 0, 'skipped': 0, 'removed': 0}
+    try:
+        names = sorted(n for n in os.listdir(spool_dir) if n.endswith(SEGMENT_SUFFIX))
+    except FileNotFoundError:
+        return result
+    if not names:
+        return result
+
+    progress = dict(conn.execute("SELECT segment, bytes_loaded FROM spool_progress").fetchall())
+
+    # Read everything new first, then load it in one transaction
+    events = []
+    updates = []
+    sizes = {}
+    for name in names:
+        path = os.path.join(spool_dir, name)
+        offset = progress.get(name, 0)
+        try:
+            with open(path, 'rb') as segment:
+                segment.seek(offset)
+                data = segment.read()
+        except FileNotFoundError:
+            continue
+        sizes[name] = offset + len(data)
+        if not data:
+            continue
+        parsed, consumed, skipped = parse_records(data)
+        if consumed < len(data) and is_sealed(name, path):
+            # A sealed segment will never grow, so a trailing partial record
+            # is a write that was cut short (e.g. the hook was killed)
+            consumed = len(data)
+            skipped += 1
+        result['skipped'] += skipped
+        if consumed:
+            events.extend(parsed)
+            updates.append((name, offset + consumed))
+            progress[name] = offset + consumed
+
+    if updates:
+        with ingest.transaction(conn):
+            ingest.insert_events(conn, events)
+            conn.executemany("""
+                INSERT INTO spool_progress (segment, bytes_loaded, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (segment) DO UPDATE SET
+                    bytes_loaded = excluded.bytes_loaded,
+                    updated_at = excluded.updated_at
+            """, updates)
+        result['loaded'] = len(events)
+
+    # Fully loaded segments that can no longer grow are removed. The file goes
+    # first: a leftover progress row for a missing file is harmless.
+    for name, size in sizes.items():
+        path = os.path.join(spool_dir, name)
+        if progress.get(name, 0) >= size and is_sealed(name, path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            conn.execute("DELETE FROM spool_progress WHERE segment = ?", [name])
+            result['removed'] += 1
+
+    return result
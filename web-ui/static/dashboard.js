@@ -4,17 +4,22 @@ function dashboard() {
         subagents: [],
         sessions: [],
         autoRefresh: true,
-        refreshInterval: null,
+        refreshTimer: null,
         
         async init() {
             await this.loadAllData();
             
-            // Set up auto-refresh
-            this.refreshInterval = setInterval(() => {
-                if (this.autoRefresh) {
-                    this.loadAllData();
+            // Refresh when /api/stream reports new events instead of on a
+            // timer, at most every 5 seconds while they keep arriving
+            const source = new EventSource('/api/stream');
+            source.addEventListener('update', () => {
+                if (this.autoRefresh && !this.refreshTimer) {
+                    this.refreshTimer = setTimeout(() => {
+                        this.refreshTimer = null;
+                        this.loadAllData();
+                    }, 5000);
                 }
-            }, 30000); // 30 seconds
+            });
         },
         
         async loadAllData() {
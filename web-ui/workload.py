@@ -0,0 +1,260 @@
+"""Synthetic Claude Code hook events for benchmarking the dashboard
+
+Writes sessions that look like what the hooks record: sessions grouped into
+tmux sessions, UserPromptSubmit -> tool calls -> Stop cycles, PreToolUse and
+PostToolUse pairs sharing a tool_use_id (some failing), parallel Task
+subagents whose tool calls interleave with each other, Notification and
+PreCompact events, and Read/Bash responses large enough for the blob store.
+Session start times are spread over the last --days days.
+
+    python web-ui/workload.py --db /tmp/bench.duckdb --events 1000000
+
+Events go through ingest.insert_events(), so the derived tables are
+maintained the same way the collector maintains them. The same --seed always
+produces the same events (timestamps are relative to the time of the run).
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import timedelta
+
+import duckdb
+
+import archive
+import ingest
+import schema
+
+DEFAULT_EVENTS = 10000
+DEFAULT_DAYS = 30
+BATCH_SIZE = 20000
+
+AGENT_TYPES = ['general-purpose', 'code-reviewer', 'test-runner', 'debugger',
+               'doc-writer', 'refactorer', 'security-auditor', 'planner']
+PROJECTS = ['api-server', 'web-client', 'infra', 'data-pipeline', 'mobile-app', 'docs',
+            'auth-service', 'billing', 'search', 'cli-tools', 'ml-models', 'analytics']
+TMUX_SESSIONS = ['main', 'work', 'review', 'ops', 'scratch', 'oncall', 'research', 'release']
+COMMANDS = ['git status', 'git diff', 'npm test', 'pytest -q', 'make build', 'ls -la',
+            'cargo check', 'go test ./...', 'docker compose ps', 'rg TODO']
+PERMISSION_MODES = ['default', 'default', 'default', 'acceptEdits', 'plan']
+
+# Tool mix of the main agent and of subagents (Task only in the main agent)
+MAIN_TOOLS = (['Read'] * 30 + ['Edit'] * 15 + ['Bash'] * 20 + ['Grep'] * 10 + ['Glob'] * 5
+              + ['Write'] * 4 + ['TodoWrite'] * 4 + ['WebFetch'] * 2 + ['WebSearch'] * 2 + ['Task'] * 8)
+SUBAGENT_TOOLS = ['Read'] * 40 + ['Grep'] * 20 + ['Bash'] * 20 + ['Glob'] * 10 + ['Edit'] * 10
+
+
+class Workload:
+    """Deterministic stream of events built with ingest.build_event"""
+
+    def __init__(self, seed=0, days=DEFAULT_DAYS, now=None):
+        self.random = random.Random(seed)
+        self.days = days
+        self.now = now or ingest.utc_now()
+        self.sessions = 0
+        self.tool_uses = 0
+        # A fixed set of file contents, so the blob store deduplicates like it
+        # does for files that are read over and over
+        self.files = {}
+        for project in PROJECTS:
+            for i in range(20):
+                path = f"/home/dev/{project}/src/module_{i}.py"
+                size = self.random.choice([300, 800, 2000, 6000, 20000])
+                line = f"def handler_{i}(request):  # {project}\n"
+                self.files[path] = (line * (size // len(line) + 1))[:size]
+        self.paths = list(self.files)
+
+    def events(self, count):
+        """Yield at least `count` events, whole sessions at a time"""
+        emitted = 0
+        while emitted < count:
+            for event in self.session():
+                emitted += 1
+                yield event
+
+    def session(self):
+        """Events of one session in timestamp order"""
+        r = self.random
+        self.sessions += 1
+        session_id = f"{r.getrandbits(32):08x}-bench-{self.sessions:08d}"
+        project = r.choice(PROJECTS)
+        # Most sessions run inside tmux, several per tmux session
+        tmux = f"{r.choice(TMUX_SESSIONS)}-{r.randrange(4)}" if r.random() < 0.8 else ''
+        base = {
+            'session_id': session_id,
+            'transcript_path': f"/home/dev/.claude/projects/{project}/{session_id}.jsonl",
+            'cwd': f"/home/dev/{project}",
+            'permission_mode': r.choice(PERMISSION_MODES),
+        }
+        clock = self.now - timedelta(seconds=r.uniform(0, self.days * 86400))
+        events = []
+
+        def emit(event_type, fields=None, tool_name='', at=None):
+            data = dict(base, hook_event_name=event_type, **(fields or {}))
+            event = ingest.build_event(event_type, json.dumps(data), tool_name=tool_name,
+                                       tmux_session=tmux, timestamp=at or clock)
+            events.append(event)
+
+        emit('SessionStart', {'source': r.choice(['startup', 'startup', 'resume', 'clear'])})
+        # Sessions range from a quick question to a long working day
+        cycles = max(1, int(r.expovariate(1 / 6)))
+        for _ in range(cycles):
+            clock += timedelta(seconds=r.uniform(1, 5))
+            emit('UserPromptSubmit', {'prompt': f"Work on {project}: task {r.randrange(1000)}"})
+            for _ in range(max(1, int(r.expovariate(1 / 8)))):
+                clock += timedelta(seconds=r.uniform(0.5, 20))
+                tool = r.choice(MAIN_TOOLS)
+                if tool == 'Task':
+                    clock = self._tasks(emit, clock, base['cwd'])
+                else:
+                    clock = self._tool_call(emit, tool, clock, base['cwd'])
+            if r.random() < 0.1:
+                clock += timedelta(seconds=r.uniform(1, 10))
+                emit('Notification', {'message': 'Claude needs your permission to use Bash'})
+            if r.random() < 0.03:
+                emit('PreCompact', {'trigger': 'auto'})
+            clock += timedelta(seconds=r.uniform(1, 10))
+            emit('Stop', {'stop_hook_active': False})
+            # Waiting for the user before the next prompt
+            clock += timedelta(seconds=r.expovariate(1 / 300))
+        if r.random() < 0.85:
+            emit('SessionEnd', {'reason': r.choice(['exit', 'logout', 'clear', 'other'])})
+
+        events.sort(key=lambda event: event[0])
+        return events
+
+    def _tool_call(self, emit, tool, start, cwd):
+        """Emit a PreToolUse/PostToolUse pair, returning when the call ended"""
+        r = self.random
+        self.tool_uses += 1
+        tool_use_id = f"toolu_bench{self.tool_uses:012d}"
+        tool_input, tool_response = self._tool_io(tool, cwd)
+        end = start + timedelta(seconds=r.expovariate(1 / (3 if tool in ('Bash', 'WebFetch') else 0.5)))
+        emit('PreToolUse', {'tool_name': tool, 'tool_input': tool_input, 'tool_use_id': tool_use_id},
+             tool_name=tool, at=start)
+        if r.random() < 0.03:
+            emit('PostToolUseFailure', {'tool_name': tool, 'tool_input': tool_input,
+                                        'tool_use_id': tool_use_id, 'error': 'Command failed'},
+                 tool_name=tool, at=end)
+        else:
+            emit('PostToolUse', {'tool_name': tool, 'tool_input': tool_input, 'tool_use_id': tool_use_id,
+                                 'tool_response': tool_response},
+                 tool_name=tool, at=end)
+        return end
+
+    def _tasks(self, emit, start, cwd):
+        """Emit one to four Task subagents running in parallel, returning when the last finished"""
+        r = self.random
+        finished = start
+        for _ in range(r.choice([1, 1, 1, 2, 2, 3, 4])):
+            self.tool_uses += 1
+            tool_use_id = f"toolu_bench{self.tool_uses:012d}"
+            agent_type = r.choice(AGENT_TYPES)
+            tool_input = {'subagent_type': agent_type,
+                          'description': f"{agent_type} pass {r.randrange(100)}",
+                          'prompt': f"Run the {agent_type} agent over {cwd}"}
+            begin = start + timedelta(seconds=r.uniform(0, 0.5))
+            emit('PreToolUse', {'tool_name': 'Task', 'tool_input': tool_input, 'tool_use_id': tool_use_id},
+                 tool_name='Task', at=begin)
+            # The subagent's own tool calls, interleaved with those of its siblings
+            clock = begin
+            for _ in range(r.randrange(2, 15)):
+                clock = self._tool_call(emit, r.choice(SUBAGENT_TOOLS),
+                                        clock + timedelta(seconds=r.uniform(0.2, 4)), cwd)
+            clock += timedelta(seconds=r.uniform(0.5, 5))
+            emit('SubagentStop', {'stop_hook_active': False}, at=clock)
+            tokens = r.randrange(2000, 80000)
+            emit('PostToolUse', {
+                'tool_name': 'Task', 'tool_input': tool_input, 'tool_use_id': tool_use_id,
+                'tool_response': {
+                    'content': [{'type': 'text', 'text': f"{agent_type} finished"}],
+                    'totalDurationMs': int((clock - begin).total_seconds() * 1000),
+                    'totalTokens': tokens,
+                    'totalToolUseCount': r.randrange(2, 15),
+                    'usage': {'input_tokens': tokens * 3 // 4, 'output_tokens': tokens // 4},
+                },
+            }, tool_name='Task', at=clock)
+            finished = max(finished, clock)
+        return finished
+
+    def _tool_io(self, tool, cwd):
+        """(tool_input, tool_response) payloads of a tool call"""
+        r = self.random
+        path = r.choice(self.paths)
+        if tool == 'Read':
+            content = self.files[path]
+            return ({'file_path': path},
+                    {'type': 'text', 'file': {'filePath': path, 'content': content,
+                                              'numLines': content.count('\n')}})
+        if tool == 'Edit':
+            old = f"    return handler_{r.randrange(20)}(request)"
+            return ({'file_path': path, 'old_string': old, 'new_string': old + '  # fixed'},
+                    {'filePath': path, 'oldString': old, 'newString': old + '  # fixed'})
+        if tool == 'Write':
+            return {'file_path': path, 'content': self.files[path]}, {'type': 'create', 'filePath': path}
+        if tool == 'Bash':
+            command = r.choice(COMMANDS)
+            lines = r.choice([1, 5, 20, 200])
+            stdout = ''.join(f"{cwd}: line {i} of {command}\n" for i in range(lines))
+            return ({'command': command, 'description': f"Run {command}"},
+                    {'stdout': stdout, 'stderr': '', 'interrupted': False})
+        if tool in ('Grep', 'Glob'):
+            return ({'pattern': r.choice(['TODO', 'def handler', '*.py', 'import'])},
+                    {'numFiles': r.randrange(30), 'filenames': r.sample(self.paths, 5)})
+        if tool == 'WebFetch':
+            return {'url': f"https://docs.example.com/page/{r.randrange(50)}", 'prompt': 'Summarize'}, {'result': 'ok'}
+        if tool == 'WebSearch':
+            return {'query': f"{r.choice(PROJECTS)} error {r.randrange(100)}"}, {'results': []}
+        return {'todos': [{'content': 'Write tests', 'status': 'pending'}]}, {'oldTodos': [], 'newTodos': []}
+
+
+def generate(conn, count, seed=0, days=DEFAULT_DAYS, batch_size=BATCH_SIZE, progress=None):
+    """Insert about `count` synthetic events (whole sessions) and return the number written"""
+    workload = Workload(seed, days)
+    written = 0
+    batch = []
+    for event in workload.events(count):
+        batch.append(event)
+        if len(batch) >= batch_size:
+            with ingest.transaction(conn):
+                written += ingest.insert_events(conn, batch)
+            batch = []
+            if progress:
+                progress(written)
+    if batch:
+        with ingest.transaction(conn):
+            written += ingest.insert_events(conn, batch)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill a DuckDB file with synthetic Claude Code events')
+    parser.add_argument('--db', required=True, help='DuckDB file to write (created if missing)')
+    parser.add_argument('--events', type=int, default=DEFAULT_EVENTS,
+                        help=f'Approximate number of events (default: {DEFAULT_EVENTS})')
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS,
+                        help=f'Spread sessions over this many days (default: {DEFAULT_DAYS})')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Events per transaction')
+    args = parser.parse_args()
+
+    if os.path.abspath(args.db) == os.path.abspath(schema.DB_PATH):
+        parser.error("refusing to write synthetic events into the live database")
+
+    conn = duckdb.connect(args.db)
+    try:
+        schema.migrate(conn)
+        archive.ensure_view(conn)
+        started = time.monotonic()
+        written = generate(conn, args.events, args.seed, args.days, args.batch_size,
+                           progress=lambda n: print(f"\r{n} events", end='', flush=True))
+        conn.execute("CHECKPOINT")
+    finally:
+        conn.close()
+    elapsed = time.monotonic() - started
+    print(f"\rWrote {written} events to {args.db} in {elapsed:.1f}s ({written / elapsed:.0f} events/s)")
+
+
+if __name__ == '__main__':
+    main()